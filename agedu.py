@@ -34,10 +34,9 @@
 #  Author Doug Hughes
 #  Last modified 2018-03-14
 #
-# Run simple sql queries while removing the need to find the auth key or
-# format the query
-# This query outputs the query results, whatever they are, in a CSV output
-# format. It does not currently take care of quoting.
+# Write the files of the Starfish catalog (all volumes, or one --volume and
+# --path) as an agedu dump, the format read by agedu -L, so agedu can show
+# where the old data is without scanning the file systems itself.
 
 import psycopg2
 import ConfigParser
@@ -47,6 +46,12 @@ import grp
 import os
 import argparse
 import locale
+import zlib
+import shutil
+import multiprocessing
+import gzip
+import sfsnapshot
+import sfcheckpoint
 
 
 
@@ -55,27 +60,396 @@ def getpgauth():
   config.read("/opt/starfish/etc/99-local.ini")
   return(config.get('pg','pg_uri'))
 
-def ins_sort(k):
-    for i in range(1,len(k)):    #start at beginning of list
-        j = i                    #reducing i directly will break for loop, so reduce copy j 
-        temp = k[j]              #temp will be used for comparison with previous items, and sent to the place it belongs
-	#j>0 : no point going till k[0] since there is no seat available on its left, for temp
-        while j > 0 and temp < k[j-1]: 
-	    #Move the bigger item 1 step right to make room for temp
-            k[j] = k[j-1] 
-            #take k[j] all the way left to the place where it has a smaller/no value to its left.
-            j=j-1 
-        k[j] = temp
-    return k
+# the live database, or a local snapshot with --source snapshot:<dir>
+def dbconnect():
+  if snapshot:
+    return sfsnapshot.connect(snapshot)
+  return psycopg2.connect(getpgauth())
 
-#--------------------------------------------------------------------------------------------
+# Default dump location (see --output). The sidecar index records, for every
+# directory block in the dump, its byte offset, length and crc32, so an
+# incremental run can copy unchanged blocks instead of querying them again.
+# Offsets are into the uncompressed stream, also for gzip dumps. Each entry
+# also carries the directory's own file count, bytes and atime/mtime
+# min/max/size-weighted sums, which is what the tree index (--tree, see
+# sftree.py) is rolled up from.
+dumpfile = "/tmp/d2"
+indexversion = "agedu index v2"
+checkpointversion = "agedu checkpoint v1"
 
-# connect to Postgres
-try:
-  conn = psycopg2.connect(getpgauth())
-except psycopg2.DatabaseError, e:
-  print "unable to connect to the database: %s" % self.fmt_errmsg(e)
-  sys.exit(1)
+# Rows fetched per round trip, and bytes buffered before each write
+itersize = 10000
+writebuffer = 1048576
+
+# File rows are (size, atime, volume name, dir path, file name, dir id, mtime).
+# Volumes are ordered bytewise like paths and names, so the dump order does
+# not depend on the database collation (sfdiff.py relies on it); dumps
+# written before that may list volumes in another order.
+qfilecols = "f.size, extract(epoch from f.atime), v.name, d.path, f.name, d.id, extract(epoch from f.mtime)"
+qorder = 'ORDER BY v.name COLLATE "C", d.path COLLATE "C", d.name COLLATE "C"'
+
+# Write agedu dump records while keeping the sidecar index up to date
+class DumpWriter(object):
+
+  def __init__(self, dump, index):
+    self.dump = dump
+    self.index = index
+    self.offset = 0
+    self.block = None
+    self.crc = 0
+    self.stats = None
+    self.buf = []
+    self.buflen = 0
+
+  def write(self, data):
+    self.buf.append(data)
+    self.buflen += len(data)
+    if self.buflen >= writebuffer:
+      self.flush()
+    self.offset += len(data)
+    self.crc = zlib.crc32(data, self.crc)
+
+  def flush(self):
+    if not self.buf:
+      return
+    self.dump.write("".join(self.buf))
+    self.buf = []
+    self.buflen = 0
+
+  def startdir(self, vname, dirid, dpath):
+    self.enddir()
+    self.block = (vname, dirid, self.offset, dpath)
+    self.crc = 0
+    # files, bytes, atime min, max, sum of size*atime, then the same for mtime
+    self.stats = [0, 0, None, None, 0.0, None, None, 0.0]
+
+  def enddir(self):
+    if self.block is not None:
+      vname, dirid, start, dpath = self.block
+      stats = "\t".join("" if v is None else repr(v) for v in self.stats)
+      self.index.write("%s\t%d\t%d\t%d\t%d\t%s\t%s\n" % (vname, dirid, start, self.offset - start, self.crc & 0xffffffff, stats, dpath))
+      self.block = None
+
+  def row(self, row):
+    if self.block is None or self.block[1] != row[5]:
+      self.startdir(row[2], row[5], row[3])
+      # note, this gets the atime of the first element in the directory and set
+      # the directory size to 1024. That's really ok to a reasonable approximation.
+      self.write("1024 %d %s:/%s\n" % (row[1], row[2], row[3]))
+    if row[3] == "":
+      # absorb the / dir without doubling
+      self.write("%d %d %s:/%s%s\n" % row[:5])
+    else:
+      self.write("%d %d %s:/%s/%s\n" % row[:5])
+    size, atime, mtime = int(row[0]), float(row[1] or 0), float(row[6] or 0)
+    st = self.stats
+    st[0] += 1
+    st[1] += size
+    if st[2] is None or atime < st[2]:
+      st[2] = atime
+    if st[3] is None or atime > st[3]:
+      st[3] = atime
+    st[4] += size * atime
+    if st[5] is None or mtime < st[5]:
+      st[5] = mtime
+    if st[6] is None or mtime > st[6]:
+      st[6] = mtime
+    st[7] += size * mtime
+
+  # copy one directory block from the previous dump, checking its crc
+  def copyblock(self, old, entry):
+    vname, dirid, offset, length, crc, dpath, stats = entry
+    self.startdir(vname, dirid, dpath)
+    self.stats = list(stats)
+    old.seek(offset)
+    remaining = length
+    while remaining > 0:
+      data = old.read(min(remaining, 1048576))
+      if not data:
+        break
+      self.write(data)
+      remaining -= len(data)
+    if remaining > 0 or (self.crc & 0xffffffff) != crc:
+      raise ValueError("previous dump does not match its index at %s:/%s" % (vname, dpath))
+
+  # append a dump part and its index, written by another DumpWriter that
+  # started at offset 0, shifting the part's index offsets to fit
+  def append(self, dumppart, indexpart):
+    self.enddir()
+    self.flush()
+    base = self.offset
+    with open(dumppart, "rb") as part:
+      shutil.copyfileobj(part, self.dump, 1048576)
+    self.offset += os.path.getsize(dumppart)
+    with open(indexpart) as part:
+      for line in part:
+        fields = line.split("\t", 3)
+        fields[2] = str(int(fields[2]) + base)
+        self.index.write("\t".join(fields))
+
+  def close(self):
+    self.enddir()
+    self.flush()
+
+# Open a dump, gzip compressed if compressed is set (the dump name ends in .gz)
+def opendump(path, mode, compressed):
+  if compressed:
+    return gzip.open(path, mode)
+  return open(path, mode)
+
+# Read the sidecar index: a header line, then one entry per directory block,
+# as (volume, dir id, offset, length, crc, dir path, directory stats)
+def readindex(path):
+  f = open(path)
+  header = f.readline().rstrip("\n").split("\t")
+  def entries():
+    for line in f:
+      fields = line.rstrip("\n").split("\t", 13)
+      stats = [int(fields[5]), int(fields[6])] + [float(v) if v else None for v in fields[7:13]]
+      yield (fields[0], int(fields[1]), int(fields[2]), int(fields[3]), int(fields[4]), fields[13], stats)
+    f.close()
+  return header, entries()
+
+# Full export: every file, in agedu order. extra adds conditions to the
+# selection and params adds values for them.
+def fullexport(conn, writer, extra=[], params={}):
+  where = wlist + extra
+  qparams = dict(wparams)
+  qparams.update(params)
+  wfull = ""
+  if len(where) > 0:
+    wfull = "WHERE " + " AND ".join(where)
+  qfiles = """SELECT %s
+  FROM sf.file_current f JOIN sf_volumes.volume v ON v.id = f.volume_id 
+       JOIN sf.dir_current d ON f.parent_id = d.id
+  %s
+  %s, f.name COLLATE "C" """ % (qfilecols, wfull, qorder)
+
+  # stream through a server-side cursor, so memory does not grow with the
+  # number of files
+  cur = conn.cursor(name="agedu_files")
+  cur.itersize = itersize
+  cur.execute(qfiles, qparams)
+  for row in cur:
+    writer.row(row)
+  cur.close()
+
+# Split a full export into ranges of d.path per volume, using top-level
+# directory names as boundaries. A prefix split would not do: "t-x" sorts
+# between "t" and "t/a" in the C collation. Contiguous ranges keep every
+# directory whole and concatenate back into exactly the single query order.
+def partitions(cur, jobs):
+  parts = []
+  for vname in exportvolumes(cur):
+    cur.execute("""SELECT d.path FROM sf.dir_current d JOIN sf_volumes.volume v ON v.id = d.volume_id
+    WHERE v.name = %s AND d.path <> '' AND strpos(d.path, '/') = 0
+    ORDER BY d.path COLLATE "C" """, (vname,))
+    tops = [row[0] for row in cur.fetchall()]
+    # a few partitions per job evens out uneven subtrees
+    step = max(1, -(-len(tops) // (jobs * 4)))
+    lows = [""] + tops[step::step]
+    highs = lows[1:] + [None]
+    for lo, hi in zip(lows, highs):
+      parts.append((len(parts), vname, lo, hi))
+  return parts
+
+# The volumes to export, in dump order
+def exportvolumes(cur):
+  if args.volume:
+    return [args.volume]
+  cur.execute('SELECT name FROM sf_volumes.volume ORDER BY name COLLATE "C"')
+  return [row[0] for row in cur.fetchall()]
+
+# Conditions (for fullexport) selecting the directories of one volume with
+# lo <= d.path < hi in the C collation; hi None for no upper bound
+def rangeconditions(vname, lo, hi):
+  extra = ["v.name = %(pvolume)s", 'd.path COLLATE "C" >= %(plo)s']
+  params = {'pvolume': vname, 'plo': lo}
+  if hi is not None:
+    extra.append('d.path COLLATE "C" < %(phi)s')
+    params['phi'] = hi
+  return extra, params
+
+# Export one partition on its own connection into numbered part files.
+# Runs in a pool worker process.
+def exportpartition(part):
+  n, vname, lo, hi = part
+  extra, params = rangeconditions(vname, lo, hi)
+  dumppart = "%s.part%d" % (workprefix, n)
+  indexpart = "%s.idx.part%d" % (workprefix, n)
+  pconn = dbconnect()
+  with open(dumppart, "w") as d, open(indexpart, "w") as i:
+    pwriter = DumpWriter(d, i)
+    fullexport(pconn, pwriter, extra, params)
+    pwriter.close()
+  pconn.close()
+  return dumppart, indexpart
+
+# Full export split over jobs worker processes. Parts are appended in order
+# as soon as each one and all those before it are done.
+def parallelexport(cur, writer, jobs):
+  parts = partitions(cur, jobs)
+  print >> sys.stderr, "exporting %d partitions with %d jobs" % (len(parts), jobs)
+  pool = multiprocessing.Pool(jobs)
+  try:
+    for dumppart, indexpart in pool.imap(exportpartition, parts):
+      writer.append(dumppart, indexpart)
+      os.remove(dumppart)
+      os.remove(indexpart)
+  finally:
+    pool.terminate()
+    pool.join()
+
+# Checkpointed full export (--chunk): each volume is exported chunk
+# directories at a time, in dump order, each range in its own transaction.
+# After every range the dump and index are synced to disk and the position
+# reached is saved to the checkpoint (see sfcheckpoint.py), so after a
+# failure --resume carries on from the last complete range and the dump
+# comes out the same as from an uninterrupted run. A range ends on a
+# directory boundary, so the index blocks stay whole. A gzip dump gets a new
+# gzip member per range, which gzip and agedu read back as one stream.
+def chunkedexport(conn, writer, checkpoint, state):
+  cur = conn.cursor()
+  volumes = exportvolumes(cur)
+  if state['volume'] is None:
+    i = 0
+  elif state['volume'] in volumes:
+    i = volumes.index(state['volume'])
+  else:
+    raise ValueError("volume %s of the checkpoint is gone" % (state['volume']))
+  lo = state['lo']
+  while not state['done']:
+    if i >= len(volumes):
+      state['done'] = True
+    else:
+      # the first directory of the next range bounds this one
+      extra, params = rangeconditions(volumes[i], lo, None)
+      qparams = dict(wparams)
+      qparams.update(params)
+      qparams['chunk'] = state['chunk']
+      cur.execute("""SELECT d.path FROM sf.dir_current d JOIN sf_volumes.volume v ON v.id = d.volume_id
+      WHERE %s
+      ORDER BY d.path COLLATE "C" LIMIT 1 OFFSET %%(chunk)s""" % (" AND ".join(wlist + extra)), qparams)
+      row = cur.fetchone()
+      hi = row[0] if row else None
+      extra, params = rangeconditions(volumes[i], lo, hi)
+      fullexport(conn, writer, extra, params)
+      conn.rollback()
+      if hi is None:
+        i += 1
+        lo = ""
+      else:
+        lo = hi
+      state['volume'] = volumes[i] if i < len(volumes) else None
+      state['lo'] = lo
+    savechunk(writer, checkpoint, state)
+
+def savechunk(writer, checkpoint, state):
+  writer.enddir()
+  writer.flush()
+  if compressed:
+    # end the gzip member; the next one starts when the file is reopened
+    writer.dump.close()
+    with open(dumpfile + ".new", "ab") as f:
+      os.fsync(f.fileno())
+  else:
+    sfcheckpoint.sync(writer.dump)
+  sfcheckpoint.sync(writer.index)
+  state['offset'] = writer.offset
+  state['dumpsize'] = os.path.getsize(dumpfile + ".new")
+  state['indexsize'] = writer.index.tell()
+  checkpoint.save(state)
+  if compressed and not state['done']:
+    writer.dump = opendump(dumpfile + ".new", "ab", True)
+
+# A value for COPY ... FROM in text format
+def copyescape(value):
+  return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+# Incremental export: re-query only directories whose own ctime/mtime, or
+# whose files' ctime/atime, moved since the previous run (less some slack for
+# scan latency), and directories that are no longer at the path of their
+# previous block. Everything else is copied from the previous dump block by
+# block. Directories keeping their path keep their relative order, so copied
+# blocks are read from the old dump front to back, and the result is still
+# sorted. The previous blocks are held by directory id, one index entry per
+# directory with files.
+def incrementalexport(conn, writer, since, entries):
+  previous = {}
+  for entry in entries:
+    previous[entry[1]] = entry
+  cur = conn.cursor()
+  if wappend:
+    wand = wappend + " AND"
+  else:
+    wand = "WHERE"
+  qparams = dict(wparams)
+  qparams['since'] = since
+  cur.execute("""CREATE TEMP TABLE agedu_changed ON COMMIT DROP AS
+  SELECT d.id FROM sf.dir_current d JOIN sf_volumes.volume v ON v.id = d.volume_id
+  %s (d.ctime >= to_timestamp(%%(since)s) OR d.mtime >= to_timestamp(%%(since)s))
+  UNION
+  SELECT f.parent_id FROM sf.file_current f JOIN sf_volumes.volume v ON v.id = f.volume_id
+       JOIN sf.dir_current d ON f.parent_id = d.id
+  %s (f.ctime >= to_timestamp(%%(since)s) OR f.atime >= to_timestamp(%%(since)s))""" % (wand, wand), qparams)
+
+  # renaming or moving a directory changes the path of every directory under
+  # it, while their own mtime/ctime stay put
+  prevfile = workprefix + ".previous"
+  with open(prevfile, "w") as f:
+    for dirid, entry in previous.iteritems():
+      f.write("%d\t%s\t%s\n" % (dirid, copyescape(entry[0]), copyescape(entry[5])))
+  cur.execute("CREATE TEMP TABLE agedu_previous (id bigint, volume text, path text) ON COMMIT DROP")
+  with open(prevfile) as f:
+    cur.copy_expert("COPY agedu_previous FROM STDIN", f)
+  os.remove(prevfile)
+  cur.execute("""INSERT INTO agedu_changed
+  SELECT d.id FROM sf.dir_current d JOIN sf_volumes.volume v ON v.id = d.volume_id
+       JOIN agedu_previous p ON p.id = d.id
+  %s (p.volume <> v.name OR p.path <> d.path)
+  EXCEPT SELECT id FROM agedu_changed""" % (wand), wparams)
+  cur.execute("ANALYZE agedu_changed")
+  cur.execute("SELECT count(*) FROM agedu_changed")
+  print >> sys.stderr, "directories changed since last run: %d" % (cur.fetchone()[0])
+
+  dirs = conn.cursor(name="agedu_dirs")
+  dirs.itersize = itersize
+  dirs.execute("""SELECT d.id, v.name, d.path, c.id IS NOT NULL
+  FROM sf.dir_current d JOIN sf_volumes.volume v ON v.id = d.volume_id
+       LEFT JOIN agedu_changed c ON c.id = d.id
+  %s
+  %s""" % (wappend, qorder), wparams)
+
+  changed = conn.cursor(name="agedu_changed_files")
+  changed.itersize = itersize
+  changed.execute("""SELECT %s
+  FROM sf.file_current f JOIN sf_volumes.volume v ON v.id = f.volume_id 
+       JOIN sf.dir_current d ON f.parent_id = d.id
+       JOIN agedu_changed c ON c.id = d.id
+  %s
+  %s, f.name COLLATE "C" """ % (qfilecols, wappend, qorder), wparams)
+  changedrows = iter(changed)
+  pending = next(changedrows, None)
+
+  old = opendump(dumpfile, "rb", dumpfile.endswith(".gz"))
+  copied = 0
+  for dirid, vname, dpath, ischanged in dirs:
+    entry = previous.get(dirid)
+    if ischanged:
+      while pending is not None and pending[5] == dirid:
+        writer.row(pending)
+        pending = next(changedrows, None)
+    elif entry is not None and entry[0] == vname and entry[5] == dpath:
+      writer.copyblock(old, entry)
+      copied += 1
+    # an unchanged directory with no previous block has no files: adding,
+    # removing or moving anything in it would have moved its mtime/ctime, and
+    # a directory that was moved itself has a previous block under another
+    # path, so it is in agedu_changed
+  old.close()
+  print >> sys.stderr, "directory blocks copied from previous dump: %d" % (copied)
+
+#--------------------------------------------------------------------------------------------
 
 locale.setlocale(locale.LC_ALL, 'C')
 
@@ -83,15 +457,51 @@ locale.setlocale(locale.LC_ALL, 'C')
 parser = argparse.ArgumentParser()
 parser.add_argument("--volume")
 parser.add_argument("--path")
+parser.add_argument("--incremental", action="store_true", help="reuse the previous dump and its index, querying only changed directories")
+parser.add_argument("--slack", type=float, default=24, help="hours subtracted from the previous run time when looking for changes (default 24)")
+parser.add_argument("--jobs", type=int, default=1, help="split a full export by volume and top-level directory over this many processes")
+parser.add_argument("--output", default=dumpfile, help="dump file to write (default %s), gzip compressed if it ends in .gz, or - for stdout (e.g. to pipe into agedu -L)" % (dumpfile))
+parser.add_argument("--tree", action="store_true", help="also build a directory tree index (<output>.tree) for agedutree.py")
+parser.add_argument("--source", default="pg", help="pg (default) or snapshot:<dir> to read a local snapshot written by sfexport.py")
+parser.add_argument("--chunk", type=int, default=0, help="export this many directories at a time, saving a checkpoint (<output>.ckpt) after each range so a failed export can be finished with --resume")
+parser.add_argument("--resume", action="store_true", help="finish a --chunk export from its last checkpoint")
 parser.parse_args()
 
 args = parser.parse_args()
 
+try:
+  snapshot = sfsnapshot.parsesource(args.source)
+except ValueError, e:
+  parser.error(str(e))
+if args.tree and args.output == "-":
+  parser.error("--tree is built from the dump index, which is not kept when writing to stdout")
+if snapshot and args.incremental:
+  parser.error("--incremental looks for changes in the live database, it can not be used with a snapshot source")
+if args.chunk < 0:
+  parser.error("--chunk can not be negative")
+if args.chunk or args.resume:
+  if args.output == "-":
+    parser.error("--chunk and --resume need a dump file to checkpoint, not stdout")
+  if args.incremental or args.jobs > 1:
+    parser.error("--chunk and --resume can not be used with --incremental or --jobs")
+
+# connect to Postgres, or open the snapshot
+try:
+  conn = dbconnect()
+except ImportError, e:
+  print >> sys.stderr, e
+  sys.exit(1)
+except (IOError, psycopg2.DatabaseError), e:
+  print >> sys.stderr, "unable to connect to the database: %s" % (e)
+  sys.exit(1)
+
 # Setup DB cursor
 cur = conn.cursor()
 
-# optional string appends to WHERE clause
+# optional string appends to WHERE clause, with their values bound from
+# wparams
 wlist = []
+wparams = {}
 
 # where clause
 wappend = ""
@@ -99,13 +509,15 @@ wappend = ""
 # Check for volume
 if args.volume:
   volume = args.volume
-  wlist.append("v.name = '%s'" % (args.volume))
+  wlist.append("v.name = %(volume)s")
+  wparams['volume'] = args.volume
 else:
-  print "use of --volume is recommended"
+  print >> sys.stderr, "use of --volume is recommended"
 
 if args.path:
   dirname = args.path
-  wlist.append("d.path like '%s'" % (args.path))
+  wlist.append("d.path like %(path)s")
+  wparams['path'] = args.path
 
 if len(wlist) > 0:
   wappend = "WHERE " + " AND ".join(wlist)
@@ -122,7 +534,7 @@ if qdirs:
   %s
   ORDER BY d.path""" % (wappend)
 
-  cur.execute(qdirs)
+  cur.execute(qdirs, wparams)
   rows = cur.fetchall()
 
   # open temp file
@@ -132,40 +544,110 @@ if qdirs:
   d1.close()
     
 
-# now do file list
-qfiles = """SELECT f.size, extract(epoch from f.atime), v.name, d.path, f.name
-FROM sf.file_current f JOIN sf_volumes.volume v ON v.id = f.volume_id 
-     JOIN sf.dir_current d ON f.parent_id = d.id
-%s
-ORDER BY v.name, d.path COLLATE "C", d.name COLLATE "C", f.name COLLATE "C" """ % (wappend)
+# The index is only reusable for the same volume/path selection
+selection = "%s|%s" % (args.volume or "", args.path or "")
 
-# debugging
-print qfiles
-#os.exit(0)
+# Where the dump, its index and any parallel part files go. There is no
+# index for a dump written to stdout.
+dumpfile = args.output
+tostdout = (dumpfile == "-")
+compressed = dumpfile.endswith(".gz")
+if tostdout:
+  indexfile = os.devnull
+  workprefix = "/tmp/agedu-%d" % (os.getpid())
+else:
+  indexfile = dumpfile + ".idx"
+  workprefix = dumpfile
 
-cur.execute(qfiles)
-rows = cur.fetchall()
+# time this run started, by the database clock, or when the snapshot was taken
+if snapshot:
+  runtime = conn.meta['created']
+else:
+  cur.execute("SELECT extract(epoch from now())")
+  runtime = cur.fetchone()[0]
 
-# open temp file
-d2 = open("/tmp/d2", "w+")
-# print header
-d2.write("agedu dump file. pathsep=2f\n")
-# initialize path to do directory output when a new one is entered
-savepath = ""
-for row in rows:
-  dpath = row[3]
-  if dpath != savepath:
-    # note, this gets the atime of the first element in the directory and set
-    # the directory size to 1024. That's really ok to a reasonable approximation.
-    d2.write("1024 %d %s:/%s\n" % (row)[1:-1])
-    savepath = dpath
-  if dpath == "":
-    # absorb the / dir without doubling
-    d2.write("%d %d %s:/%s%s\n" % (row))
+# a resumed export goes on with the partial dump and index of the failed
+# run, cut back to its last checkpoint
+checkpoint = sfcheckpoint.Checkpoint(dumpfile + ".ckpt", checkpointversion)
+state = None
+if args.resume:
+  try:
+    state = checkpoint.load({'selection': selection, 'compressed': compressed})
+    sfcheckpoint.truncate(dumpfile + ".new", state['dumpsize'])
+    sfcheckpoint.truncate(indexfile + ".new", state['indexsize'])
+  except (ValueError, OSError), e:
+    print >> sys.stderr, "unable to resume: %s" % (e)
+    sys.exit(1)
+  runtime = state['runtime']
+  if args.chunk:
+    state['chunk'] = args.chunk
+  print >> sys.stderr, "resuming at %s:/%s" % (state['volume'], state['lo'])
+elif args.chunk:
+  state = {'selection': selection, 'compressed': compressed, 'runtime': runtime, 'chunk': args.chunk,
+           'volume': None, 'lo': "", 'done': False}
+
+since = None
+if args.incremental:
+  if tostdout:
+    print >> sys.stderr, "--incremental needs a dump file to update, not stdout"
+    sys.exit(1)
+  if os.path.exists(dumpfile) and os.path.exists(indexfile):
+    header, entries = readindex(indexfile)
+    if len(header) == 3 and header[0] == indexversion and header[2] == selection:
+      since = float(header[1]) - args.slack * 3600
+    else:
+      print >> sys.stderr, "previous index is for another selection or version, doing a full export"
   else:
-    d2.write("%d %d %s:/%s/%s\n" % (row))
+    print >> sys.stderr, "no previous dump and index, doing a full export"
+
+# write to temp files and move them into place once complete
+if tostdout:
+  d2 = sys.stdout
+  idx = open(os.devnull, "w")
+elif args.resume:
+  d2 = opendump(dumpfile + ".new", "ab", compressed)
+  idx = open(indexfile + ".new", "a")
+else:
+  d2 = opendump(dumpfile + ".new", "wb", compressed)
+  idx = open(indexfile + ".new", "w")
+writer = DumpWriter(d2, idx)
+if args.resume:
+  writer.offset = state['offset']
+else:
+  idx.write("%s\t%f\t%s\n" % (indexversion, runtime, selection))
+  # print header
+  writer.write("agedu dump file. pathsep=2f\n")
+
+if since is not None:
+  incrementalexport(conn, writer, since, entries)
+elif state is not None:
+  try:
+    chunkedexport(conn, writer, checkpoint, state)
+  except (ValueError, psycopg2.DatabaseError), e:
+    print >> sys.stderr, "export failed, run again with --resume to continue: %s" % (str(e).strip())
+    sys.exit(1)
+elif args.jobs > 1:
+  parallelexport(cur, writer, args.jobs)
+else:
+  fullexport(conn, writer)
+
+writer.close()
+idx.close()
+if tostdout:
+  d2.flush()
+else:
+  writer.dump.close()
+  os.rename(dumpfile + ".new", dumpfile)
+  os.rename(indexfile + ".new", indexfile)
+  checkpoint.remove()
+conn.rollback()
 
-d2.close()
+# roll the per-directory stats of the index up into the tree index; numpy
+# is only needed for this
+if args.tree:
+  import sftree
+  n = sftree.build(indexfile, dumpfile + ".tree")
+  print >> sys.stderr, "tree index of %d directories written to %s" % (n, dumpfile + ".tree")
     
 
 #d3 = open("/tmp/d3", "w")
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# What changed between two agedu dumps, or between a dump and the catalog:
+# files added, removed and resized, rolled up per directory, owner and
+# atime age bucket (see sfdiff.py). Each side is an agedu dump written by
+# agedu.py (gzip if it ends in .gz), pg for the live catalog or
+# snapshot:<dir> for a snapshot written by sfexport.py. Owners are only
+# known for catalog sides; changes seen in two dumps show as "unknown".
+
+import sys
+import time
+import gzip
+import argparse
+import ConfigParser
+import psycopg2
+import sfdiff
+import sfhist
+import sfnames
+import sfsnapshot
+
+def getpgauth():
+  config = ConfigParser.ConfigParser()
+  config.read("/opt/starfish/etc/99-local.ini")
+  return(config.get('pg','pg_uri'))
+
+def human(size):
+  for unit in ["B", "K", "M", "G", "T"]:
+    if abs(size) < 1024 or unit == "T":
+      return "%.1f%s" % (size, unit) if unit != "B" else "%d%s" % (size, unit)
+    size /= 1024.0
+
+def signed(size):
+  return ("+" if size >= 0 else "-") + human(abs(size))
+
+# Open one side of the diff: (entry stream, time it was taken, connection
+# to close or None)
+def openside(source, volume):
+  if source != "pg" and not source.startswith("snapshot:"):
+    if source.endswith(".gz"):
+      f = gzip.open(source, "rb")
+    else:
+      f = open(source, "rb")
+    return sfdiff.dumpentries(f, source, volume), sfdiff.dumptime(source), None
+  snapshot = sfsnapshot.parsesource(source)
+  if snapshot:
+    conn = sfsnapshot.connect(snapshot)
+    taken = conn.meta['created']
+  else:
+    conn = psycopg2.connect(getpgauth())
+    taken = time.time()
+  return sfdiff.catalogentries(conn, volume, args.itersize, source), taken, conn
+
+def printdelta(label, delta):
+  print "%-30s %+10d %10s  %8d %10s  %8d %10s  %8d %10s" % (label, sfdiff.netfiles(delta), signed(sfdiff.netbytes(delta)),
+    delta[0], signed(delta[1]), delta[2], signed(-delta[3]), delta[4], signed(delta[5]))
+
+def printheader(title):
+  print
+  print "%-30s %10s %10s  %8s %10s  %8s %10s  %8s %10s" % (title, "files", "bytes", "added", "", "removed", "", "resized", "")
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Show the files added, removed and resized between two agedu dumps or catalog snapshots")
+parser.add_argument("old", help="older side: agedu dump, pg or snapshot:<dir>")
+parser.add_argument("new", help="newer side: agedu dump, pg or snapshot:<dir>")
+parser.add_argument("--volume", help="only compare this volume")
+parser.add_argument("--depth", type=int, default=2, help="directory levels to roll changes up to, 0 for every directory (default 2)")
+parser.add_argument("--top", type=int, default=20, help="number of directories to show (default 20)")
+parser.add_argument("--by", default="bytes", choices=["bytes", "files"], help="rank directories by net change in bytes or files (default bytes)")
+parser.add_argument("--buckets", default="1m,3m,6m,1y,2y,3y", help="atime age bucket boundaries, with units d, w, m or y (default 1m,3m,6m,1y,2y,3y)")
+parser.add_argument("--files", help="write every changed file to this file (- for stdout) as kind, old size, new size, path")
+parser.add_argument("--dirs", help="write the change totals of every changed directory to this file (- for stdout), as the diff goes")
+parser.add_argument("--itersize", type=int, default=10000, help="rows fetched per round trip from a catalog side (default 10000)")
+parser.add_argument("--name-cache", help="file to keep resolved uid names in between runs")
+args = parser.parse_args()
+
+try:
+  edges, labels = sfhist.parsebuckets(args.buckets)
+  for source in (args.old, args.new):
+    if source.startswith("snapshot:"):
+      sfsnapshot.parsesource(source)
+except ValueError, e:
+  parser.error(str(e))
+if args.depth < 0:
+  parser.error("--depth can not be negative")
+
+try:
+  old, oldtime, oldconn = openside(args.old, args.volume)
+  new, newtime, newconn = openside(args.new, args.volume)
+except ImportError, e:
+  print >> sys.stderr, e
+  sys.exit(1)
+except (IOError, OSError), e:
+  print >> sys.stderr, "unable to open %s" % (e)
+  sys.exit(1)
+except ValueError, e:
+  print >> sys.stderr, e
+  sys.exit(1)
+except psycopg2.DatabaseError, e:
+  print >> sys.stderr, "unable to connect to the database: %s" % (e)
+  sys.exit(1)
+
+def output(path):
+  if path is None:
+    return None
+  if path == "-":
+    return sys.stdout
+  return open(path, "w")
+
+files = output(args.files)
+dirs = output(args.dirs)
+
+def onleaf(vname, dpath, delta):
+  dirs.write("%s:/%s\t%d\t%d\t%s\n" % (vname, dpath, sfdiff.netfiles(delta), sfdiff.netbytes(delta), "\t".join(str(v) for v in delta)))
+
+# ages are counted from the time the newer side was taken
+rollup = sfdiff.Rollup(args.depth, edges, newtime, onleaf if dirs is not None else None)
+started = time.time()
+try:
+  for kind, o, n in sfdiff.merge(old, new):
+    rollup.add(kind, o, n)
+    if files is not None and kind != "same":
+      entry = n if n is not None else o
+      path = "%s:/%s/%s" % entry[:3] if entry[1] else "%s:/%s%s" % entry[:3]
+      files.write("%s\t%s\t%s\t%s\n" % (kind, "-" if o is None else o[3], "-" if n is None else n[3], path))
+except ValueError, e:
+  print >> sys.stderr, e
+  sys.exit(1)
+except psycopg2.DatabaseError, e:
+  print >> sys.stderr, "query failed: %s" % (e)
+  sys.exit(1)
+rollup.close()
+for f in (files, dirs):
+  if f is not None and f is not sys.stdout:
+    f.close()
+for conn in (oldconn, newconn):
+  if conn is not None:
+    conn.close()
+
+# the summary goes to stderr when the file or directory lists go to stdout
+if sys.stdout in (files, dirs):
+  sys.stdout = sys.stderr
+
+names = sfnames.NameCache(cachefile=args.name_cache)
+compared = rollup.same + rollup.total[0] + rollup.total[2] + rollup.total[4]
+print "%s (%s) -> %s (%s): %d files compared, %d unchanged, in %.1f sec" % (args.old, time.strftime("%Y-%m-%d %H:%M", time.localtime(oldtime)),
+  args.new, time.strftime("%Y-%m-%d %H:%M", time.localtime(newtime)), compared, rollup.same, time.time() - started)
+printheader("total")
+printdelta("all files", rollup.total)
+
+printheader("directory (depth %d)" % (args.depth) if args.depth else "directory")
+for vname, dpath, delta in rollup.topdirs(args.top, args.by):
+  printdelta("%s:/%s" % (vname, dpath), delta)
+
+printheader("owner")
+for uid, delta in sorted(rollup.users.items(), key=lambda item: -abs(sfdiff.netbytes(item[1]))):
+  if uid is None:
+    printdelta("unknown", delta)
+  else:
+    printdelta(names.user(uid) or str(uid), delta)
+
+printheader("atime age")
+for label, delta in zip(labels, rollup.ages):
+  printdelta(label, delta)
+names.save()
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Drill into usage from the tree index written by agedu.py --tree, without
+# querying the catalog: the heaviest or oldest subtrees under a directory.
+
+import sys
+import time
+import argparse
+import sftree
+
+def human(size):
+  for unit in ["B", "K", "M", "G", "T"]:
+    if abs(size) < 1024 or unit == "T":
+      return "%.1f%s" % (size, unit) if unit != "B" else "%d%s" % (size, unit)
+    size /= 1024.0
+
+def day(epoch):
+  if epoch != epoch:
+    return "-"
+  return time.strftime("%Y-%m-%d", time.localtime(epoch))
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Show the top subtrees under a directory from an agedu.py tree index")
+parser.add_argument("--index", default="/tmp/d2.tree", help="tree index written by agedu.py --tree (default /tmp/d2.tree)")
+parser.add_argument("--path", help="directory as volume:/path (default: list the volumes)")
+parser.add_argument("--top", type=int, default=20, help="number of subtrees to show (default 20)")
+parser.add_argument("--by", default="bytes", choices=["bytes", "files", "atime", "mtime"], help="largest by bytes or files, or oldest by size-weighted atime or mtime (default bytes)")
+parser.add_argument("--depth", type=int, default=1, help="levels below --path to consider, 1 for immediate subdirectories, 0 for all (default 1)")
+args = parser.parse_args()
+
+try:
+  tree = sftree.TreeIndex(args.index)
+except (IOError, ValueError), e:
+  print >> sys.stderr, "unable to open tree index: %s" % (e)
+  sys.exit(1)
+
+started = time.time()
+try:
+  rows = tree.top(args.path, args.top, args.by, args.depth)
+except KeyError:
+  print >> sys.stderr, "%s is not in the index" % (args.path)
+  sys.exit(1)
+
+if args.path is not None:
+  here = tree.entry(tree.find(args.path))
+  print "%s: %s in %d files, mean atime %s, mean mtime %s" % (here['path'], human(here['bytes']), here['files'], day(here['atime'][2]), day(here['mtime'][2]))
+print "%10s %10s  %-10s %-10s %-10s  %s" % ("size", "files", "atime", "oldest", "mtime", "path")
+for row in rows:
+  print "%10s %10d  %-10s %-10s %-10s  %s" % (human(row['bytes']), row['files'], day(row['atime'][2]), day(row['atime'][0]), day(row['mtime'][2]), row['path'])
+print >> sys.stderr, "%d of %d directories, index built %s, query %.1f ms" % (len(rows), tree.count, time.strftime("%Y-%m-%d %H:%M", time.localtime(tree.created)), (time.time() - started) * 1000)
@@ -0,0 +1,173 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# File age histograms from a single scan of the catalog (see sfhist.py).
+# Every --time/--by combination asked for is computed from the same pass,
+# e.g. --time atime --time mtime --by user --by volume --by user+volume.
+# Output is csv, one line per time column, grouping and key, with file
+# counts and bytes per age bucket and age percentiles in days.
+
+import psycopg2
+import ConfigParser
+import sys
+import time
+import csv
+import argparse
+import sfhist
+import sfnames
+import sfsnapshot
+
+def getpgauth():
+  config = ConfigParser.ConfigParser()
+  config.read("/opt/starfish/etc/99-local.ini")
+  return(config.get('pg','pg_uri'))
+
+# report names for the key columns
+keynames = {"user": "uid", "group": "gid", "volume": "volume", "dir": "dir"}
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Compute file age histograms per user, group, volume or directory in one catalog scan")
+parser.add_argument("--volume", action="append", help="volume to scan, may be repeated (default: all volumes)")
+parser.add_argument("--time", action="append", choices=sfhist.timecolumns, help="time column to bucket on, may be repeated (default: atime)")
+parser.add_argument("--by", action="append", help="grouping: user, group, volume or dir, or several joined with + (e.g. user+volume); may be repeated (default: user)")
+parser.add_argument("--buckets", default="1m,3m,6m,1y,2y,3y", help="age bucket boundaries, with units d, w, m or y (default 1m,3m,6m,1y,2y,3y)")
+parser.add_argument("--percentiles", default="50,90", help="age percentiles to report, by file count and by bytes (default 50,90)")
+parser.add_argument("--output", help="write csv to this file instead of stdout")
+parser.add_argument("--itersize", type=int, default=100000, help="files fetched and binned per batch (default 100000)")
+parser.add_argument("--name-cache", help="file to keep resolved uid/gid names in between runs")
+parser.add_argument("--source", default="pg", help="pg (default) or snapshot:<dir> to scan a local snapshot written by sfexport.py")
+args = parser.parse_args()
+
+try:
+  edges, labels = sfhist.parsebuckets(args.buckets)
+  percentiles = [float(p) for p in args.percentiles.split(",") if p.strip()]
+  snapshot = sfsnapshot.parsesource(args.source)
+except ValueError, e:
+  parser.error(str(e))
+groupings = []
+for spec in args.by or ["user"]:
+  parts = spec.split("+")
+  for part in parts:
+    if part not in keynames:
+      parser.error("unknown grouping '%s', use user, group, volume or dir" % (part))
+  groupings.append(parts)
+
+try:
+  if snapshot:
+    conn = sfsnapshot.connect(snapshot)
+  else:
+    conn = psycopg2.connect(getpgauth())
+except ImportError, e:
+  print >> sys.stderr, e
+  sys.exit(1)
+except (IOError, psycopg2.DatabaseError), e:
+  print >> sys.stderr, "unable to connect to the database: %s" % (e)
+  sys.exit(1)
+cur = conn.cursor()
+
+cur.execute("SELECT id, name FROM sf_volumes.volume")
+volumes = dict(cur.fetchall())
+where = ""
+params = None
+if args.volume:
+  unknown = set(args.volume) - set(volumes.values())
+  if unknown:
+    print >> sys.stderr, "unknown volume(s): %s" % (", ".join(sorted(unknown)))
+    sys.exit(1)
+  # IN rather than = ANY(array), which a snapshot source does not take
+  params = [vid for vid, name in volumes.items() if name in args.volume]
+  where = "WHERE f.volume_id IN (%s)" % (", ".join(["%s"] * len(params)))
+
+# one histogram per time column and grouping, all fed from the same scan
+now = time.time()
+histograms = []
+for field in args.time or ["atime"]:
+  for parts in groupings:
+    by = tuple(keynames[part] for part in parts)
+    histograms.append(("+".join(parts), sfhist.AgeHistogram(edges, field, by, now)))
+
+started = time.time()
+files = conn.cursor(name="agehist")
+files.itersize = args.itersize
+files.execute(sfhist.scanquery(where), params)
+count = sfhist.scan(files, [h for name, h in histograms], args.itersize)
+files.close()
+print >> sys.stderr, "%d files binned into %d histogram(s) in %.1f sec" % (count, len(histograms), time.time() - started)
+
+# directory ids -> paths, only for the directories that were seen
+dirs = set()
+for name, h in histograms:
+  if "dir" in h.by:
+    col = h.by.index("dir")
+    dirs.update(key[col] for key in h.keys)
+paths = {}
+dirs = sorted(dirs)
+for i in range(0, len(dirs), 10000):
+  chunk = dirs[i:i + 10000]
+  cur.execute("SELECT id, path FROM sf.dir_current WHERE id IN (%s)" % (", ".join(["%s"] * len(chunk))), chunk)
+  paths.update(cur.fetchall())
+
+names = sfnames.NameCache(cachefile=args.name_cache)
+def keyname(column, value):
+  if column == "uid":
+    return names.user(value) or value
+  if column == "gid":
+    return names.group(value) or value
+  if column == "volume":
+    return volumes.get(value, value)
+  return paths.get(value, value)
+
+out = sys.stdout
+if args.output:
+  out = open(args.output, "w")
+writer = csv.writer(out, lineterminator="\n")
+header = ["time", "by", "key", "files", "bytes"]
+for label in labels:
+  header += ["%s files" % (label), "%s bytes" % (label)]
+for p in percentiles:
+  header += ["p%g age days" % (p), "p%g age days (bytes)" % (p)]
+writer.writerow(header)
+for name, h in histograms:
+  for key, counts, sizes in h.results():
+    line = [h.field, name, "/".join(str(keyname(column, value)) for column, value in zip(h.by, key)),
+            sum(counts), int(sum(sizes))]
+    for c, s in zip(counts, sizes):
+      line += [c, int(s)]
+    for p in percentiles:
+      line += ["%.1f" % (h.percentile(key, p)), "%.1f" % (h.percentile(key, p, True) or 0)]
+    writer.writerow(line)
+if args.output:
+  out.close()
+names.save()
+conn.rollback()
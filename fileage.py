@@ -0,0 +1,281 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# File age reporting engine for fileage.sh. Emails every user a summary of
+# the size and number of their files last accessed (or modified) more than
+# --age months ago, per volume and age range. All users are read from one
+# grouped query, streamed in user order, rendered here and delivered over
+# persistent SMTP sessions, instead of one psql, awk and mailx per user.
+# With --buckets the age ranges are chosen freely and computed from the file
+# catalog in one pass with sfhist, instead of read from the fixed ranges of
+# the summary table.
+
+import psycopg2
+import ConfigParser
+import sys
+import os
+import time
+import argparse
+import itertools
+import threading
+import Queue
+from email.mime.text import MIMEText
+import sfmail
+import sfhist
+import sfnames
+
+VERSION = "2.02 October 17, 2026"
+sfconfigfile = "/opt/starfish/etc/99-local.ini"
+logdir = "logs"
+reportsdir = "reports"
+
+# age ranges as stored in sf_reports.last_time_generic_current, youngest
+# first, with their report label and starting age in months
+buckets = [
+  ("Previous Months: 1-3", "1 to 3 Months", 1),
+  ("Previous Months: 3-6", "3 to 6 months", 3),
+  ("Previous Months: 6-12", "6 to 12 months", 6),
+  ("Previous Years: 1-2", "12 to 24 months", 12),
+  ("Previous Years: 2-3", "24 to 36 months", 24),
+  ("Previous Years: > 3", "36+ months", 36),
+]
+
+def getpgauth():
+  config = ConfigParser.ConfigParser()
+  config.read(sfconfigfile)
+  return(config.get('pg','pg_uri'))
+
+def logprint(msg):
+  with open(logfile, "a") as f:
+    f.write("%s: %s\n" % (time.strftime("%D-%T"), msg))
+
+def fatal(msg):
+  logprint(msg)
+  print >> sys.stderr, msg
+  sys.exit(1)
+
+# Render one user's report from their (volume, age range label, size GB,
+# count) rows, youngest range first within each volume
+def userreport(user, rows):
+  if args.mtime:
+    verb = "modified"
+  else:
+    verb = "accessed"
+  header = "Dear %s,\nThe following is a report showing size and number of files that were last %s prior to %s month(s) ago.\nThis report was generated on %s.\n" % (user, verb, args.age, time.strftime("%D"))
+  lines = []
+  for volume, vrows in itertools.groupby(rows, lambda row: row[0]):
+    lines.append("Volume:  %s    " % (volume))
+    for row in vrows:
+      if row[3] > 0:
+        lines.append("%s: %s(GB), %s items" % (row[1], row[2], row[3]))
+    lines.append("")
+  return header + "\n" + "\n".join(lines).rstrip("\n") + "\n"
+
+# Delivery thread: one persistent SMTP session per thread
+def deliver(todo, failed):
+  mailer = sfmail.Mailer()
+  while True:
+    item = todo.get()
+    if item is None:
+      break
+    address, body = item
+    msg = MIMEText(body)
+    msg['Subject'] = "Starfish File Age Report for %s" % (address)
+    msg['From'] = "root"
+    msg['To'] = address
+    try:
+      mailer.sendmail("root", [address], msg.as_string())
+      if args.verbose:
+        logprint("VERBOSE: Emailed %s" % (address))
+    except Exception, e:
+      logprint(" Emailing results for %s failed: %s" % (address, e))
+      failed.append(address)
+  mailer.close()
+
+# (user, rows for userreport) from the summary table, one user at a time
+def summaryusers(conn):
+  labels = dict((b[0], b[1]) for b in buckets)
+  order = dict((b[0], i) for i, b in enumerate(buckets))
+  cur = conn.cursor(name="fileage")
+  cur.itersize = 10000
+  cur.execute(query, params)
+  for user, rows in itertools.groupby(cur, lambda row: row[0]):
+    rows = sorted(rows, key=lambda row: (row[1], order[row[2]]))
+    yield user, [(row[1], labels[row[2]], row[3], row[4]) for row in rows]
+  cur.close()
+
+# (user, rows for userreport) for the --buckets ranges, binned from one scan
+# of the files older than --age
+def histogramusers(conn):
+  edges = sfhist.parsebuckets(args.buckets)[0]
+  shown = sfhist.olderbuckets(args.buckets, args.age)
+  now = time.time()
+  agedays = float(args.age) * sfhist.unitdays["m"]
+  cur = conn.cursor()
+  cur.execute("SELECT id, name FROM sf_volumes.volume")
+  volumes = dict(cur.fetchall())
+  where = "WHERE f.%s < to_timestamp(%%(before)s)" % (agecolumn[:5])
+  hparams = {'before': now - agedays * sfhist.dayseconds}
+  if args.volume:
+    where += " AND f.volume_id = (SELECT id FROM sf_volumes.volume WHERE name = %(volume)s)"
+    hparams['volume'] = args.volume
+  histogram = sfhist.AgeHistogram(edges, agecolumn[:5], ("uid", "volume"), now, resolution=0)
+  files = conn.cursor(name="fileage")
+  files.itersize = 100000
+  files.execute(sfhist.scanquery(where), hparams)
+  logprint("Binned %d files" % (sfhist.scan(files, [histogram], 100000)))
+  files.close()
+  names = sfnames.NameCache()
+  users = {}
+  for (uid, vid), counts, sizes in histogram.results():
+    user = names.user(uid) or str(uid)
+    for i, label in shown:
+      users.setdefault(user, []).append((volumes.get(vid, vid), i, label, round(sizes[i] / (1024 * 1024 * 1024.0), 2), counts[i]))
+  for user in sorted(users):
+    yield user, [(row[0], row[2], row[3], row[4]) for row in sorted(users[user])]
+
+#--------------------------------------------------------------------------------------------
+
+parser = argparse.ArgumentParser(description="File Age Reporting Script %s. Emails all users that have files with mtime or atime older than a specified age on a starfish volume. It can also be used to output data to files only." % (VERSION))
+parser.add_argument("--volume", help="Starfish volume to report on (defaults to all Starfish volumes)")
+parser.add_argument("--age", default="1", help="find files older than X months: 1, 3, 6, 12, 24 or 36 (default 1), or any number of months with --buckets")
+parser.add_argument("--buckets", help="age ranges to report instead of the standard ones, as boundaries with units d, w, m or y (e.g. 2w,1m,6m,2y,5y); computed from the file catalog")
+parser.add_argument("--mtime", action="store_true", help="use mtime instead of atime (Default = atime)")
+parser.add_argument("--format", default="text", choices=["text"], help="report format (only text is supported)")
+parser.add_argument("--noemail", action="store_true", help="Instead of emailing, output to files. Files will be named \"<username>.txt\"")
+parser.add_argument("--emaildomain", help="Appends email domain to username for mail delivery. Default is to email to username with no domain appended.")
+parser.add_argument("--concurrency", type=int, default=4, help="number of SMTP sessions used to deliver reports (default 4)")
+parser.add_argument("--verbose", action="store_true", help="Create verbose log, which includes email content.")
+args = parser.parse_args()
+if args.volume and args.volume.endswith(":"):
+  args.volume = args.volume[:-1]
+if args.buckets:
+  try:
+    sfhist.parsebuckets(args.buckets)
+    float(args.age)
+  except ValueError, e:
+    parser.error(str(e))
+elif args.age not in [str(b[2]) for b in buckets]:
+  parser.error("--age must be 1, 3, 6, 12, 24 or 36 (but is: %s)" % (args.age))
+
+# Check if logdir and logfile exists, and create if it doesnt
+logfile = os.path.join(logdir, "fileage-%s.log" % (time.strftime("%Y%m%d-%H%M%S")))
+if not os.path.exists(logdir):
+  os.mkdir(logdir)
+logprint("---------------------------------------------------------------")
+logprint("Script executing")
+logprint(VERSION)
+print "Script starting, in process"
+
+logprint(" volume: %s" % (args.volume or "[All]"))
+logprint(" age: %s" % (args.age))
+logprint(" buckets: %s" % (args.buckets or "[standard]"))
+logprint(" time: %s" % ("mtime" if args.mtime else "atime"))
+logprint(" format: %s" % (args.format))
+logprint(" email: %s" % ("false" if args.noemail else "true"))
+logprint(" emaildomain: %s" % (args.emaildomain or "[None]"))
+logprint(" concurrency: %d" % (args.concurrency))
+logprint(" verbose: %s" % ("true" if args.verbose else "false"))
+
+try:
+  conn = psycopg2.connect(getpgauth())
+except Exception, e:
+  fatal("unable to connect to the database: %s" % (e))
+
+if not os.path.exists(reportsdir):
+  os.mkdir(reportsdir)
+
+# One query for every user, already summed per volume and age range, in user
+# order so each user's rows arrive together
+if args.mtime:
+  agecolumn = "mtime_age"
+else:
+  agecolumn = "atime_age"
+params = {'buckets': [b[0] for b in buckets if b[2] >= float(args.age)]}
+where = "%s = ANY(%%(buckets)s)" % (agecolumn)
+if args.volume:
+  where = "volume_name = %(volume)s AND " + where
+  params['volume'] = args.volume
+query = """SELECT user_name, volume_name, %s,
+       ROUND(SUM(size) / (1024 * 1024 * 1024.0), 2) AS "SIZE(GB)",
+       SUM(count) AS "COUNT"
+  FROM sf_rollup.user_age_current
+ WHERE %s
+ GROUP BY user_name, volume_name, %s
+ ORDER BY user_name, volume_name""" % (agecolumn, where, agecolumn)
+if args.verbose:
+  logprint("VERBOSE: %s" % (query))
+
+# delivery runs alongside the query; the bounded queue keeps memory flat
+todo = Queue.Queue(maxsize=args.concurrency * 100)
+failed = []
+senders = []
+if not args.noemail:
+  for i in range(max(1, args.concurrency)):
+    sender = threading.Thread(target=deliver, args=(todo, failed))
+    sender.start()
+    senders.append(sender)
+
+logprint("Querying for users and file ages")
+users = 0
+if args.buckets:
+  userrows = histogramusers(conn)
+else:
+  userrows = summaryusers(conn)
+for user, rows in userrows:
+  body = userreport(user, rows)
+  users += 1
+  if args.verbose:
+    logprint("VERBOSE: User data is: %s" % (body))
+  address = user
+  if args.emaildomain:
+    address = "%s@%s" % (user, args.emaildomain)
+  if args.noemail:
+    with open(os.path.join(reportsdir, "%s.txt" % (address)), "w") as f:
+      f.write(body)
+  else:
+    logprint(" Emailing results for %s" % (address))
+    todo.put((address, body))
+conn.rollback()
+
+for sender in senders:
+  todo.put(None)
+for sender in senders:
+  sender.join()
+
+logprint("Reports generated for %d users, %d failed to send" % (users, len(failed)))
+logprint("Script completed")
+print "Script completed"
+if failed:
+  sys.exit(1)
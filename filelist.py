@@ -0,0 +1,93 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# List the files you own that are older than an age, through the
+# sffilelistd.py service. It takes the same options as filelist.sh but
+# needs no sudo: the service knows who is asking from the socket, and the
+# list is written here, as you. filelist.sh hands over to this script
+# when the service is running.
+
+import os
+import sys
+import pwd
+import socket
+import argparse
+import sffilelist
+
+VERSION = "1.02 October 17, 2026"
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Report the files you own that are older than a given age (File List Reporting Script %s)" % (VERSION))
+parser.add_argument("--volume", help="Starfish volume to report on, or volume:path (default: all Starfish volumes)")
+parser.add_argument("--age", type=int, default=1, choices=sffilelist.ages, help="find files older than this many months (default 1)")
+parser.add_argument("--mtime", action="store_true", help="use mtime instead of atime (default atime)")
+parser.add_argument("--tsv", action="store_true", help="output in tab separated format (default comma separated)")
+parser.add_argument("-o", dest="output", metavar="{filename}", help="output file (default ~/<user>-filelist.csv)")
+parser.add_argument("--verbose", action="store_true", help="include verbose output")
+parser.add_argument("--user", help=argparse.SUPPRESS)
+parser.add_argument("--socket", default=sffilelist.socketpath, help="socket of the file list service (default %(default)s)")
+args = parser.parse_args()
+
+# --user is how filelist.sh, run through sudo, asks for the invoking user;
+# the service only accepts it from root
+if args.user:
+  try:
+    entry = pwd.getpwnam(args.user)
+  except KeyError:
+    print >> sys.stderr, "unknown user %s" % (args.user)
+    sys.exit(1)
+else:
+  entry = pwd.getpwuid(os.getuid())
+output = args.output or os.path.join(entry.pw_dir, "%s-filelist.csv" % (entry.pw_name))
+
+print "Running query for %s, output directed to %s. This may take a few minutes" % (entry.pw_name, output)
+tmp = "%s.%d.part" % (output, os.getpid())
+try:
+  with open(tmp, "w") as out:
+    header = sffilelist.fetch(out, args.volume, args.age, "mtime" if args.mtime else "atime",
+                              "tsv" if args.tsv else "csv", args.user, args.socket)
+  os.rename(tmp, output)
+except socket.error, e:
+  print >> sys.stderr, "The file list service is not available (%s): %s" % (args.socket, e)
+  sys.exit(1)
+except (sffilelist.FileListError, IOError, OSError), e:
+  print >> sys.stderr, "Unable to produce the file list: %s" % (e)
+  sys.exit(1)
+finally:
+  if os.path.exists(tmp):
+    os.remove(tmp)
+
+if args.verbose:
+  print "%d bytes (%s) for %s" % (header["bytes"], header["source"], header["user"])
+print "Script completed"
@@ -39,7 +39,7 @@ set -euo pipefail
 #********************************************************
 
 # Set variables
-readonly VERSION="1.01 December 4, 2017"
+readonly VERSION="1.02 October 17, 2026"
 PROG="$0"
 readonly SFHOME="${SFHOME:-/opt/starfish}"
 readonly STARFISH_BIN_DIR="${SFHOME}/bin"
@@ -61,6 +61,7 @@ FORMAT="--csv -d,"
 VERBOSE=false
 VOLUME=""
 readonly OUTPUTFILE="$USER_HOME/${SUDO_USER}-filelist.csv"
+readonly SERVICE_SOCKET="$SFHOME/run/sffilelistd.sock"
 
 # logprint routine called to write to log file
 logprint() {
@@ -101,6 +102,8 @@ Prerequisites:
 - Add the following to /etc/sudoers:
   ## Starfish run filelist script for all users
   ALL ALL=NOPASSWD: /opt/starfish/scripts/filelist.sh
+- When the file list service (sffilelistd.py) is running, this script hands over to it, and
+  users can also run filelist.py with the same options directly, without sudo
 
 $PROG [options]
 
@@ -210,6 +213,19 @@ fi
 logprint " output file: $OUTPUTFILE"
 logprint " verbose: $VERBOSE"
 
+# Hand over to the file list service when it is running. It serves the list
+# from its cache, or builds it on a warm database connection, instead of
+# running a fresh sf query for every user.
+if [[ -S "$SERVICE_SOCKET" ]]; then
+   logprint "File list service found at $SERVICE_SOCKET, handing over to filelist.py"
+   CLIENT_ARGS=(--user "$SUDO_USER" --age "$AGE" --socket "$SERVICE_SOCKET" -o "$OUTPUTFILE")
+   [[ "$TIME" == "mtime_age" ]] && CLIENT_ARGS+=(--mtime)
+   [[ -n "$VOLUME" ]] && CLIENT_ARGS+=(--volume "$VOLUME")
+   [[ -z "$FORMAT" ]] && CLIENT_ARGS+=(--tsv)
+   [[ "$VERBOSE" == "true" ]] && CLIENT_ARGS+=(--verbose)
+   exec "$(dirname "${BASH_SOURCE[0]}")/filelist.py" "${CLIENT_ARGS[@]}"
+fi
+
 # Determine bigdate for sf query command
 BIGDATE=`date -d "now - $AGE months" "+%Y%m%d"`
 
@@ -35,57 +35,105 @@
 import psycopg2
 import ConfigParser
 import sys
-import pwd
-import grp
+import argparse
+import sfnames
+import sfdb
 
 def getpgauth():
   config = ConfigParser.ConfigParser()
   config.read("/opt/starfish/etc/99-local.ini")
   return(config.get('pg','pg_uri'))
 
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Find parent directories whose children have a different owner uid or gid")
+parser.add_argument("--volume", action="append", help="volume to scan, may be repeated (default: all volumes)")
+parser.add_argument("--limit", type=int, help="stop after this many mismatches of each type")
+parser.add_argument("--pagesize", type=int, default=10000, help="mismatches fetched per query (default 10000)")
+parser.add_argument("--summary", action="store_true", help="only print counts per parent uid -> child uid")
+parser.add_argument("--name-cache", help="file to keep resolved uid/gid names in between runs")
+parser.add_argument("--preload-names", action="store_true", help="load all users and groups with getent before scanning")
+args = parser.parse_args()
+
 try:
   conn = psycopg2.connect(getpgauth())
 except:
   print "I am unable to connect to the database"
   sys.exit(1)
 
+# every page is its own short transaction, so nothing holds a snapshot open
+# for the length of a whole-catalog scan
+conn.autocommit = True
 cur = conn.cursor()
 
+# uid/gid -> name, remembering misses so deleted users are only looked up once
+names = sfnames.NameCache(cachefile=args.name_cache)
+if args.preload_names:
+  names.preload()
+
+def uidname(uid):
+  return names.user(uid) or uid
+
+def gidname(gid):
+  return names.group(gid) or gid
+
+# volume id -> name for the volumes to scan
+if args.volume:
+  cur.execute("SELECT id, name FROM sf_volumes.volume WHERE name = ANY(%s) ORDER BY id", (args.volume,))
+else:
+  cur.execute("SELECT id, name FROM sf_volumes.volume ORDER BY id")
+volumes = dict(cur.fetchall())
+if args.volume and len(volumes) != len(set(args.volume)):
+  print "unknown volume(s): %s" % (", ".join(set(args.volume) - set(volumes.values())))
+  sys.exit(1)
+
+# (type, parent uid, child uid) -> number of mismatched children
+counts = {}
+
 # get table name/type for relationship for query
-def ctype(tname, volume):
-  # Find all parent/child relationships at least 3 deep from the parent in %volume where the owner uid 
-  # is different or the gid is different. Exclude any where the owner is root 
-
-  q = "SELECT a.path, b.name, a.uid as P_UID, b.uid as C_UID, a.gid as P_GID, b.gid as C_GID from sf.dir_current a INNER JOIN sf.%s_current b on a.id = b.parent_id INNER JOIN sf_volumes.volume v on a.volume_id = v.id where v.name = '%s' and a.volume_id = b.volume_id and a.name != '' and (a.uid != b.uid OR a.gid != b.gid) and a.uid != 0 and b.uid != 0 LIMIT 30;" % (tname, volume)
-  # print "executing " + q
-  cur.execute(q)
-  rows = cur.fetchall()
-
-  print "parents and mismatched %s children:\n"%(tname)
-  for row in rows:
-    try:
-      name1 = pwd.getpwuid(int(row[2]))[0]
-    except:
-      name1 = row[2]
-    try:
-      name2 = pwd.getpwuid(int(row[3]))[0]
-    except:
-      name2 = row[3]
-    try:
-      gid1 = grp.getgrgid(int(row[4]))[0]
-    except:
-      gid1 = row[4]
-    try:
-      gid2 = grp.getgrgid(int(row[5]))[0]
-    except:
-      gid2 = row[5]
-
-    print "%s/%s\t%-8s %-8s %-8s %-8s"%(row[0], row[1], name1, name2, gid1, gid2)
+def ctype(tname):
+  # Find all parent/child relationships in the selected volumes where the owner uid
+  # is different or the gid is different. Exclude any where the owner is root.
+  # Mismatches are read a page at a time, keyed on (volume_id, parent_id, id),
+  # so each query picks up where the last one stopped instead of using OFFSET.
+
+  # The page query is prepared once and executed for every page, so the
+  # plan is not rebuilt each time.
+  q = """SELECT b.volume_id, b.parent_id, b.id, a.path, b.name, a.uid as P_UID, b.uid as C_UID, a.gid as P_GID, b.gid as C_GID
+  FROM sf.dir_current a INNER JOIN sf.%s_current b on a.id = b.parent_id
+  WHERE b.volume_id = ANY($1) and a.volume_id = b.volume_id and a.name != ''
+    and (a.uid != b.uid OR a.gid != b.gid) and a.uid != 0 and b.uid != 0
+    and (b.volume_id, b.parent_id, b.id) > ($2, $3, $4)
+  ORDER BY b.volume_id, b.parent_id, b.id
+  LIMIT $5""" % (tname)
+  params = [volumes.keys(), -1, -1, -1, args.pagesize]
 
+  if not args.summary:
+    print "parents and mismatched %s children:\n"%(tname)
+  found = 0
+  while args.limit is None or found < args.limit:
+    if args.limit is not None:
+      params[4] = min(args.pagesize, args.limit - found)
+    # print "executing " + q
+    sfdb.executeprepared(cur, q, params)
+    rows = cur.fetchall()
+    if not rows:
+      break
+    for row in rows:
+      key = (tname, row[5], row[6])
+      counts[key] = counts.get(key, 0) + 1
+      if not args.summary:
+        print "%s:%s/%s\t%-8s %-8s %-8s %-8s"%(volumes[row[0]], row[3], row[4], uidname(row[5]), uidname(row[6]), gidname(row[7]), gidname(row[8]))
+    sys.stdout.flush()
+    found += len(rows)
+    params[1:4] = rows[-1][0:3]
 
 # get dir/dir pairs
-rows = ctype("dir", "nfs1")
+ctype("dir")
 # get dir/file pairs
-rows = ctype("file", "nfs1")
+ctype("file")
 
+print "\nmismatched children per parent uid -> child uid:\n"
+for key in sorted(counts, key=lambda k: (k[0], -counts[k])):
+  print "%-4s %-8s -> %-8s %d"%(key[0], uidname(key[1]), uidname(key[2]), counts[key])
 
+names.save()
@@ -37,14 +37,36 @@
 # Run simple sql queries while removing the need to find the auth key or
 # format the query
 # This query outputs the query results, whatever they are, in a CSV output
-# format. It does not currently take care of quoting.
+# format. With --csv, fields are quoted as needed. With --copy, the query is
+# run through COPY ... TO STDOUT so the server does the formatting and quoting,
+# which is much faster for large exports. With --volume (repeatable) the
+# query is run once per volume, several at a time on their own connections,
+# with the volume bound to %(volume)s; results are printed in volume order
+# and a volume whose query fails is reported without stopping the others.
+# With --keyset the query is run in chunks ordered on the given columns,
+# each in its own transaction, with a checkpoint saved after every chunk so
+# an export that fails part way can be finished with --resume.
+# --approx PCT runs the query on a sample of its file scan, with counts and
+# sums scaled back up and 95% bounds added (see sfapprox.py); --estimate
+# only asks the planner what the query would cost, and --max-cost refuses
+# (or warns about) queries the planner puts over a budget.
 
 import psycopg2
+import psycopg2.pool
 import ConfigParser
 import sys
+import os
+import time
+import hashlib
 import pwd
 import grp
 import argparse
+import csv
+import sfdb
+import sfcheckpoint
+import sfapprox
+import sfnames
+import sfsnapshot
 
 def getpgauth():
   try:
@@ -55,21 +77,115 @@ def getpgauth():
     print "can't read config file to get connection uri. check permissions."
     sys.exit(1)
 
-try:
-  conn = psycopg2.connect(getpgauth())
-except psycopg2.DatabaseError, e:
-  print "unable to connect to the database: %s" % self.fmt_errmsg(e)
-  sys.exit(1)
+checkpointversion = "runquery checkpoint v1"
+costhistory = "/opt/starfish/log/runquery-costs.jsonl"
+
+# Key values as saved in the checkpoint; types JSON does not have are kept
+# as text, which Postgres casts back when comparing with the column
+def keyvalue(value):
+  if value is None:
+    raise ValueError("a --keyset column is null")
+  if isinstance(value, (int, long, float, basestring)):
+    return value
+  return str(value)
+
+# swap ids for names in uid/gid columns, leaving unknown ids as they are
+def decorate(columns, rows):
+  lookups = []
+  for i, column in enumerate(columns):
+    if column.lower().endswith("uid"):
+      lookups.append((i, names.user))
+    elif column.lower().endswith("gid"):
+      lookups.append((i, names.group))
+  if not lookups:
+    return rows
+  decorated = []
+  for row in rows:
+    row = list(row)
+    for i, lookup in lookups:
+      row[i] = lookup(row[i]) or row[i]
+    decorated.append(row)
+  return decorated
+
+def writerows(out, columns, rows, header):
+  if args.names:
+    rows = decorate(columns, rows)
+  if args.csv:
+    writer = csv.writer(out, delimiter=delimeter, lineterminator="\n")
+    if header:
+      writer.writerow(columns)
+    writer.writerows(rows)
+  else:
+    if header:
+      out.write(delimeter.join(columns) + "\n")
+    for row in rows:
+      out.write(delimeter.join(str(el) for el in row) + "\n")
 
 # Parse Arguments
 parser = argparse.ArgumentParser()
 parser.add_argument("--csv", action="store_true")
 parser.add_argument("--delimeter")
 parser.add_argument("--query")
+parser.add_argument("--copy", action="store_true", help="export through COPY ... TO STDOUT WITH CSV")
+parser.add_argument("--header", action="store_true", help="print column names as the first line")
+parser.add_argument("--output", help="write results to this file instead of stdout")
+parser.add_argument("--names", action="store_true", help="show user/group names instead of ids in columns named *uid/*gid")
+parser.add_argument("--name-cache", help="file to keep resolved uid/gid names in between runs")
+parser.add_argument("--volume", action="append", help="run the query once per volume, bound to %%(volume)s (literal %% must then be written %%%%); may be repeated")
+parser.add_argument("--concurrency", type=int, default=4, help="volumes queried at once with --volume (default 4)")
+parser.add_argument("--timeout", type=float, help="statement timeout in seconds for each volume's query with --volume")
+parser.add_argument("--source", default="pg", help="pg (default) or snapshot:<dir> to query a local snapshot written by sfexport.py")
+parser.add_argument("--keyset", help="export in chunks ordered on these output columns (comma separated, together unique and never null), saving a checkpoint to <output>.ckpt after each chunk; needs --output")
+parser.add_argument("--chunk", type=int, default=100000, help="rows per chunk with --keyset (default 100000)")
+parser.add_argument("--resume", action="store_true", help="finish a --keyset export from its last checkpoint")
+parser.add_argument("--approx", type=float, metavar="PCT", help="run on a PCT%% TABLESAMPLE SYSTEM sample of the sf.file_current (or sf_reports) scan, scaling count() and sum() back up, with 95%% bounds in <column>_low/<column>_high")
+parser.add_argument("--estimate", action="store_true", help="only print the planner's row and cost estimates and a predicted runtime, without running the query")
+parser.add_argument("--max-cost", type=float, help="refuse to run a query the planner estimates over this cost")
+parser.add_argument("--over-budget", default="refuse", choices=["refuse", "warn"], help="what to do when --max-cost is exceeded (default refuse)")
+parser.add_argument("--cost-history", default=costhistory, help="file of past query costs and runtimes, that runtimes are predicted from (default %s)" % (costhistory))
 parser.parse_args()
 
 args = parser.parse_args()
 
+try:
+  snapshot = sfsnapshot.parsesource(args.source)
+except ValueError, e:
+  parser.error(str(e))
+if snapshot and args.copy:
+  parser.error("--copy reads from the live database, it can not be used with a snapshot source")
+if args.volume and args.copy:
+  parser.error("--copy can not be used with --volume")
+if args.copy and args.names:
+  parser.error("--names can not be used with --copy")
+if args.concurrency < 1:
+  parser.error("--concurrency must be at least 1")
+if args.resume and not args.keyset:
+  parser.error("--resume continues a --keyset export, give the same --keyset")
+if args.keyset and not args.output:
+  parser.error("--keyset needs --output, the file the checkpoint refers to")
+if args.keyset and (args.copy or args.volume):
+  parser.error("--keyset can not be used with --copy or --volume")
+if args.chunk < 1:
+  parser.error("--chunk must be at least 1")
+if snapshot and (args.approx is not None or args.estimate or args.max_cost is not None):
+  parser.error("--approx, --estimate and --max-cost need the live database, not a snapshot")
+
+try:
+  if args.volume and snapshot:
+    pool = sfsnapshot.SnapshotPool(snapshot)
+  elif args.volume:
+    pool = psycopg2.pool.ThreadedConnectionPool(1, args.concurrency, getpgauth())
+  elif snapshot:
+    conn = sfsnapshot.connect(snapshot)
+  else:
+    conn = psycopg2.connect(getpgauth())
+except ImportError, e:
+  print e
+  sys.exit(1)
+except (IOError, psycopg2.DatabaseError), e:
+  print "unable to connect to the database: %s" % (e)
+  sys.exit(1)
+
 delimeter = " "
 if args.csv:
   delimeter = ","
@@ -77,14 +193,152 @@ if args.delimeter:
   delimeter = args.delimeter
 
 
-cur = conn.cursor()
+out = sys.stdout
+if args.output and not args.keyset:
+  out = open(args.output, "w")
 
 #q = sys.argv[1]
 q = args.query
 #print "executing query " + q
-cur.execute(q)
-rows = cur.fetchall()
 
-for row in rows:
-  print delimeter.join(str(el) for el in row)
+if args.names:
+  names = sfnames.NameCache(cachefile=args.name_cache)
+
+if args.approx is not None:
+  try:
+    sample = sfapprox.sample(q, args.approx)
+  except ValueError, e:
+    print "unable to sample the query: %s" % (e)
+    sys.exit(1)
+  q = sample.sql
+  print >> sys.stderr, "approximate: " + sample.describe()
+  for note in sample.notes:
+    print >> sys.stderr, "  note: " + note
+
+# The planner's estimate, for --estimate and --max-cost. With --volume the
+# query is estimated for the first volume.
+est = None
+history = sfapprox.CostHistory(args.cost_history)
+queryname = hashlib.sha1(q).hexdigest()[:12]
+if args.estimate or args.max_cost is not None:
+  try:
+    if args.volume:
+      econn = pool.getconn()
+      params = {'volume': args.volume[0]}
+    else:
+      econn = conn
+      params = None
+    with econn.cursor() as cur:
+      est = sfapprox.estimate(cur, q, params)
+    econn.rollback()
+    if args.volume:
+      pool.putconn(econn)
+  except psycopg2.DatabaseError, e:
+    print "unable to estimate the query: %s" % (str(e).strip())
+    sys.exit(1)
+  line = sfapprox.summary(est, history.predict(queryname, est['cost']))
+  if args.volume:
+    line += ", per volume"
+  if args.estimate:
+    print line
+    sys.exit(0)
+  print >> sys.stderr, line
+  if est['cost'] > args.max_cost:
+    if args.over_budget == "refuse":
+      print "estimated cost %.0f is over the --max-cost budget of %.0f, not running the query" % (est['cost'], args.max_cost)
+      sys.exit(3)
+    print >> sys.stderr, "warning: estimated cost %.0f is over the --max-cost budget of %.0f" % (est['cost'], args.max_cost)
+started = time.time()
+
+failed = []
+if args.copy:
+  try:
+    sfdb.copyexport(conn, q, out, delimeter, args.header)
+  except ValueError, e:
+    print "unable to export with --copy: %s" % (e)
+    sys.exit(1)
+elif args.keyset:
+  # chunks go to <output>.part, which is renamed into place once complete
+  keyset = [c.strip() for c in args.keyset.split(",") if c.strip()]
+  partfile = args.output + ".part"
+  checkpoint = sfcheckpoint.Checkpoint(args.output + ".ckpt", checkpointversion)
+  expect = {'query': q, 'keyset': keyset, 'format': [delimeter, args.csv, args.header, args.names]}
+  if args.resume:
+    try:
+      state = checkpoint.load(expect)
+      sfcheckpoint.truncate(partfile, state['size'])
+    except (ValueError, OSError), e:
+      print "unable to resume: %s" % (e)
+      sys.exit(1)
+    out = open(partfile, "ab")
+    print >> sys.stderr, "resuming after %d rows" % (state['rows'])
+  else:
+    state = dict(expect, last=None, size=0, rows=0)
+    out = open(partfile, "wb")
+  cur = conn.cursor()
+  try:
+    while True:
+      if state['last'] is None:
+        cur.execute(sfdb.keysetquery(q, keyset, first=True), (args.chunk,))
+      else:
+        cur.execute(sfdb.keysetquery(q, keyset), state['last'] + [args.chunk])
+      rows = cur.fetchall()
+      columns = [desc[0] for desc in cur.description]
+      writerows(out, columns, rows, args.header and state['size'] == 0)
+      if rows:
+        state['last'] = [keyvalue(rows[-1][columns.index(c)]) for c in keyset]
+      state['rows'] += len(rows)
+      sfcheckpoint.sync(out)
+      state['size'] = out.tell()
+      checkpoint.save(state)
+      conn.rollback()
+      if len(rows) < args.chunk:
+        break
+  except (psycopg2.DatabaseError, ValueError), e:
+    print "export failed after %d rows, run again with --resume to continue: %s" % (state['rows'], str(e).strip())
+    sys.exit(1)
+  out.close()
+  os.rename(partfile, args.output)
+  checkpoint.remove()
+  if args.names:
+    names.save()
+else:
+  if args.volume:
+    columns = None
+    timeout = args.timeout
+    if snapshot:
+      timeout = None
+    # each volume is written as its turn comes, straight from its spool
+    for part in sfdb.fanout(pool, q, args.volume, None, args.concurrency, timeout):
+      if part.error is not None:
+        print >> sys.stderr, "volume %s failed: %s" % (part.volume, str(part.error).strip())
+        failed.append(part.volume)
+        continue
+      if columns is None:
+        columns = part.columns
+        writerows(out, columns, [], args.header)
+      for batch in part.batches():
+        writerows(out, columns, batch, False)
+    pool.closeall()
+    if columns is None:
+      sys.exit(1)
+  else:
+    cur = conn.cursor()
+    cur.execute(q)
+    rows = cur.fetchall()
+    columns = [desc[0] for desc in cur.description]
+    writerows(out, columns, rows, args.header)
+
+  if args.names:
+    names.save()
 
+if args.output and not args.keyset:
+  out.close()
+# runs with an estimate are what later runtimes are predicted from
+if est is not None and not failed:
+  try:
+    history.record(queryname, est['cost'], time.time() - started)
+  except IOError:
+    pass
+if not args.copy and failed:
+  sys.exit(2)
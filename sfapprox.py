@@ -0,0 +1,328 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Fast previews of expensive queries, before committing to a full run.
+#
+# sample() rewrites a query to read a PCT% TABLESAMPLE SYSTEM sample of its
+# sf.file_current scan (or, failing that, of an sf_reports table) and to
+# scale the count() and sum() aggregates computed over that scan back up by
+# 100/PCT, wherever they are at that level: output columns, expressions
+# such as sum(size)/1024, HAVING and ORDER BY, so thresholds compare
+# estimates too. For every output column that is exactly one aggregate it
+# adds <column>_low and <column>_high, a 95% confidence interval from the
+# Horvitz-Thompson variance estimate (sum of squares of the sampled values).
+# Everything is done in the SQL, so the result can be read any way the full
+# query could (cursor, COPY, a report). SYSTEM samples whole pages, and
+# files on a page tend to be alike (same directory, same owner), so the
+# intervals are on the narrow side; they show the scale of the error, not a
+# guarantee.
+#
+# estimate() asks the planner (EXPLAIN, without running the query) for the
+# row count and cost, and CostHistory turns the cost into a predicted
+# runtime from the seconds per cost unit of earlier runs.
+
+import re
+import json
+import math
+import time
+import sfdb
+
+# z for 95% confidence intervals
+z = 1.96
+
+# Tables whose scans can be sampled, in order of preference
+scanpattern = re.compile(r"(?:\bFROM|\bJOIN|,)\s*(sf\.file_current|sf_reports\.\w+)\b(\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+selectpattern = re.compile(r"\bSELECT\b", re.IGNORECASE)
+frompattern = re.compile(r"\bFROM\b", re.IGNORECASE)
+aggregatepattern = re.compile(r"\b(count|sum)\s*\(", re.IGNORECASE)
+nestedpattern = re.compile(r"\b(count|sum|avg|min|max)\s*\(", re.IGNORECASE)
+subquerypattern = re.compile(r"\(\s*(SELECT|WITH|VALUES)\b", re.IGNORECASE)
+setpattern = re.compile(r"\b(UNION|INTERSECT|EXCEPT)\b", re.IGNORECASE)
+aliaspattern = re.compile(r"(?:\s+AS)?\s+(\w+)\s*$", re.IGNORECASE)
+
+# Words that can follow a table name and are not an alias
+keywords = set("""where join inner left right full cross natural on using group order
+  limit offset having window union intersect except for fetch tablesample""".split())
+
+# The query with string literals, quoted identifiers and comments blanked
+# out, so positions still match but nothing in them is mistaken for SQL
+def masked(query):
+  return "".join(text if kind is None else " " * len(text) for text, kind in sfdb.sqlsegments(query))
+
+# Parenthesis depth at every position of a masked query; a parenthesis has
+# the depth of what is around it
+def depths(mask):
+  level = 0
+  out = []
+  for c in mask:
+    if c == ")":
+      level -= 1
+    out.append(level)
+    if c == "(":
+      level += 1
+  return out
+
+# The position just past the parenthesis closing the one at start
+def closing(mask, depth, start):
+  for i in range(start + 1, len(mask)):
+    if mask[i] == ")" and depth[i] == depth[start]:
+      return i + 1
+  raise ValueError("unbalanced parentheses")
+
+# The outermost count() and sum() calls between start and end, leaving out
+# subqueries, as (start, end of the argument list, end of the call with its
+# FILTER and OVER clauses, function) lists of plain calls and distinct counts.
+# A call inside another, as in sum(count(*)) OVER (), is part of the outer.
+def levelcalls(mask, depth, start, end):
+  calls = []
+  distinct = []
+  subqueries = []
+  i = start
+  while i < end:
+    c = mask[i]
+    if c == "(":
+      subqueries.append(subquerypattern.match(mask, i) is not None)
+    elif c == ")" and subqueries:
+      subqueries.pop()
+    m = aggregatepattern.match(mask, i)
+    if m is None or any(subqueries) or (i > 0 and (mask[i - 1].isalnum() or mask[i - 1] in "_.")):
+      i += 1
+      continue
+    paren = m.end() - 1
+    close = closing(mask, depth, paren)
+    callend = close
+    while True:
+      more = re.match(r"\s*(FILTER|OVER)\s*\(", mask[callend:end], re.IGNORECASE)
+      if more is None:
+        break
+      callend = closing(mask, depth, callend + more.end() - 1)
+    if re.match(r"\s*DISTINCT\b", mask[paren + 1:close], re.IGNORECASE):
+      distinct.append((i, close, callend, m.group(1).lower()))
+    else:
+      calls.append((i, close, callend, m.group(1).lower()))
+    # the call's parentheses are balanced, so the stack is as before
+    i = callend
+  return calls, distinct
+
+class Sample(object):
+
+  def __init__(self, sql, pct, table, scaled, bounds, notes):
+    self.sql = sql
+    self.pct = pct
+    self.table = table
+    self.scaled = scaled
+    self.bounds = bounds
+    self.notes = notes
+
+  def describe(self):
+    text = "%g%% sample of %s, %d aggregate(s) scaled by %g" % (self.pct, self.table, self.scaled, 100.0 / self.pct)
+    if self.bounds:
+      text += ", 95%% bounds in %s" % (", ".join("%s_low/%s_high" % (b, b) for b in self.bounds))
+    return text
+
+# Rewrite query to run on a pct% sample. Raises ValueError if there is no
+# scan to sample or the query can not be taken apart.
+def sample(query, pct):
+  if not 0 < pct <= 100:
+    raise ValueError("the sample must be more than 0 and at most 100 percent")
+  query = query.strip().rstrip(";")
+  mask = masked(query)
+  depth = depths(mask)
+  scans = list(scanpattern.finditer(mask))
+  scan = None
+  for m in scans:
+    if m.group(1).lower() == "sf.file_current":
+      scan = m
+      break
+  if scan is None and scans:
+    scan = scans[0]
+  if scan is None:
+    raise ValueError("no sf.file_current or sf_reports scan to sample")
+  table = scan.group(1)
+  if scan.group(3) is not None and scan.group(3).lower() not in keywords:
+    samplepos = scan.end(2)
+    table += " " + scan.group(3)
+  else:
+    samplepos = scan.end(1)
+  p = pct / 100.0
+  factor = repr(100.0 / pct)
+  edits = [(samplepos, samplepos, " TABLESAMPLE SYSTEM (%r)" % (float(pct)))]
+  notes = []
+
+  # the query level that reads the scan: its aggregates are over the sample,
+  # those of outer levels over scaled values already
+  level = depth[scan.start(1)]
+  select = None
+  for m in selectpattern.finditer(mask, 0, scan.start(1)):
+    if depth[m.start()] == level and min(depth[m.start():scan.start(1)]) >= level:
+      select = m
+  end = None
+  if select is not None:
+    for m in frompattern.finditer(mask, select.end()):
+      if depth[m.start()] == level:
+        end = m.start()
+        break
+  if select is None or end is None or end > scan.start(1):
+    raise ValueError("can not find the SELECT list reading %s" % (table))
+  # the level runs to the parenthesis closing it or to a set operation
+  levelend = len(mask)
+  for i in range(end, len(mask)):
+    if depth[i] < level:
+      levelend = i
+      break
+  for m in setpattern.finditer(mask, end, levelend):
+    if depth[m.start()] == level:
+      levelend = m.start()
+      break
+
+  # every count() and sum() of the level is scaled, in the SELECT list,
+  # inside expressions, in HAVING and ORDER BY alike
+  calls, distinct = levelcalls(mask, depth, select.end(), levelend)
+  for cstart, close, callend, fn in distinct:
+    notes.append("%s is a distinct count, which does not scale with the sample and is left as is" % (query[cstart:close]))
+  for cstart, close, callend, fn in calls:
+    edits.append((cstart, callend, "(%s * %s)" % (factor, query[cstart:callend])))
+  scaled = len(calls)
+
+  # split the SELECT list into its items
+  items = []
+  start = select.end()
+  for i in range(select.end(), end):
+    if mask[i] == "," and depth[i] == level:
+      items.append((start, i))
+      start = i + 1
+  items.append((start, end))
+
+  bounds = []
+  extra = []
+  for start, stop in items:
+    # bounds for an item that is a single aggregate of plain values, named
+    # after its alias
+    expr = mask[start:stop]
+    alias = aliaspattern.search(expr)
+    name = None
+    if alias is not None and alias.group(1).lower() not in keywords:
+      name = alias.group(1)
+      expr = expr[:alias.start()]
+    inside = [c for c in calls if start <= c[0] < stop]
+    if len(inside) != 1 or setpattern.search(mask):
+      continue
+    cstart, close, callend, fn = inside[0]
+    if expr.strip() != mask[cstart:callend].strip() or nestedpattern.search(mask, mask.index("(", cstart) + 1, close):
+      continue
+    call = query[cstart:callend]
+    suffix = query[close:callend]
+    if fn == "count":
+      squares = call
+    else:
+      args = query[query.index("(", cstart) + 1:close - 1]
+      squares = "sum(power((%s)::float8, 2))%s" % (args, suffix)
+    estimate = "(%s * %s)" % (factor, call)
+    error = "%r * sqrt(%r * %s) / %r" % (z, 1 - p, squares, p)
+    name = name or fn
+    low = "%s - %s" % (estimate, error)
+    if fn == "count":
+      low = "greatest(0, %s)" % (low)
+    extra.append(", %s AS %s_low, %s + %s AS %s_high" % (low, name, estimate, error, name))
+    bounds.append(name)
+  if extra:
+    edits.append((end, end, "".join(extra) + " "))
+  if scaled == 0:
+    notes.append("no count() or sum() at the level of the sampled scan, the rows are only a sample")
+
+  sql = query
+  for start, stop, text in sorted(edits, reverse=True):
+    sql = sql[:start] + text + sql[stop:]
+  return Sample(sql, pct, table, scaled, bounds, notes)
+
+#--------------------------------------------------------------------------------------------
+# Estimates
+
+# The planner's estimate for a query, without running it: a dict with rows,
+# cost (total cost, in the planner's arbitrary units) and the top plan node
+def estimate(cur, query, params=None):
+  plan = sfdb.explain(cur, query, params)['Plan']
+  return {'rows': plan['Plan Rows'], 'cost': plan['Total Cost'], 'node': plan['Node Type']}
+
+def duration(seconds):
+  if seconds < 90:
+    return "%.0f sec" % (seconds)
+  if seconds < 5400:
+    return "%.0f min" % (seconds / 60)
+  return "%.1f hours" % (seconds / 3600)
+
+# Planner cost and measured runtime of past runs, as JSON lines, used to
+# predict how long a query will take from its cost
+class CostHistory(object):
+
+  def __init__(self, path, keep=20):
+    self.path = path
+    self.keep = keep
+
+  def record(self, name, cost, seconds):
+    with open(self.path, "a") as f:
+      f.write(json.dumps({'time': time.time(), 'name': name, 'cost': cost, 'seconds': seconds}) + "\n")
+
+  # (predicted seconds, runs it is based on, whether they were runs of name)
+  # from the median seconds per cost unit of the last keep runs of name, or
+  # of any query if name has none; None with no usable history
+  def predict(self, name, cost):
+    runs = []
+    try:
+      with open(self.path) as f:
+        for line in f:
+          try:
+            run = json.loads(line)
+          except ValueError:
+            continue
+          if run.get('cost', 0) > 0 and run.get('seconds') is not None:
+            runs.append(run)
+    except IOError:
+      return None
+    same = [r for r in runs if r.get('name') == name]
+    chosen = (same or runs)[-self.keep:]
+    if not chosen:
+      return None
+    ratios = sorted(r['seconds'] / r['cost'] for r in chosen)
+    middle = len(ratios) // 2
+    if len(ratios) % 2:
+      ratio = ratios[middle]
+    else:
+      ratio = (ratios[middle - 1] + ratios[middle]) / 2.0
+    return cost * ratio, len(chosen), bool(same)
+
+# One line summary of an estimate and its predicted runtime
+def summary(est, prediction):
+  text = "estimated rows %d, cost %.0f (%s)" % (est['rows'], est['cost'], est['node'])
+  if prediction is None:
+    return text + ", no past runs to predict the runtime from"
+  seconds, runs, same = prediction
+  return text + ", predicted runtime %s (from %d past run%s of %s)" % (duration(seconds), runs, "" if runs == 1 else "s",
+                                                                        "this query" if same else "other queries")
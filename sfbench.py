@@ -0,0 +1,246 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Benchmark agedu.py, parentcheck.py, runquery.py and sfreport.py end to end
+# against synthetic catalogs (sfsynth.py) at several scales. Each tool runs
+# as its own process against the database in 99-local.ini, so run this on a
+# test host pointed at a scratch database; the catalog is regenerated
+# whenever the scale changes. Wall time, throughput (catalog entries a
+# second) and peak RSS of every run are recorded, and the median of the
+# repeats is kept. With --baseline the results are compared against an
+# earlier --output file, and the run fails if any tool got slower, or
+# bigger, than the threshold allows.
+
+import psycopg2
+import ConfigParser
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import datetime
+import tempfile
+import shutil
+import subprocess
+import sfsynth
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# runquery: one aggregate over every file, and a COPY of every file row
+aggquery = "SELECT f.uid, f.gid, COUNT(*), SUM(f.size) FROM sf.file_current f GROUP BY f.uid, f.gid ORDER BY f.uid, f.gid"
+listquery = "SELECT f.volume_id, f.parent_id, f.name, f.size, f.atime FROM sf.file_current f"
+
+# sfreport: per user totals from sf_reports, as the example report does
+reportconfig = """[reportoptions]
+subject=sfbench
+format=csv
+order_by="bytes" DESC
+totals=bytes,files
+
+[queryvars]
+
+[sqlquery]
+query=SELECT user_name, group_name, SUM(size) AS bytes, SUM(count) AS files FROM sf_reports.last_time_generic_current GROUP BY user_name, group_name
+"""
+
+# name -> argv, given the work directory
+tools = [
+  ("agedu", lambda work: [sys.executable, os.path.join(here, "agedu.py"), "--output", os.path.join(work, "agedu.dump")]),
+  ("parentcheck", lambda work: [sys.executable, os.path.join(here, "parentcheck.py"), "--summary"]),
+  ("runquery", lambda work: [sys.executable, os.path.join(here, "runquery.py"), "--query", aggquery, "--csv"]),
+  ("runquery-copy", lambda work: [sys.executable, os.path.join(here, "runquery.py"), "--query", listquery, "--copy", "--output", os.devnull]),
+  ("sfreport", lambda work: [sys.executable, os.path.join(here, "sfreport.py"), os.path.join(work, "sfbench.sql"), "--no-cache", "--no-email"]),
+]
+
+def getpgauth():
+  config = ConfigParser.ConfigParser()
+  config.read("/opt/starfish/etc/99-local.ini")
+  return(config.get('pg','pg_uri'))
+
+def log(msg):
+  print >> sys.stderr, msg
+
+# scales can be given as 1e6
+def scalelist(text):
+  try:
+    return sorted(set(int(float(s)) for s in text.split(",") if s.strip()))
+  except ValueError:
+    raise argparse.ArgumentTypeError("not a list of entry counts: %s" % (text))
+
+# Run argv in work, with stdout discarded and stderr kept in <name>.log.
+# Returns (seconds, peak RSS in KB, exit status) of that process alone.
+def runtool(name, argv, work):
+  with open(os.devnull, "w") as devnull:
+    with open(os.path.join(work, name + ".log"), "a") as errors:
+      started = time.time()
+      p = subprocess.Popen(argv, stdout=devnull, stderr=errors, cwd=work)
+      pid, status, usage = os.wait4(p.pid, 0)
+      elapsed = time.time() - started
+  if os.WIFEXITED(status):
+    p.returncode = os.WEXITSTATUS(status)
+  else:
+    p.returncode = -os.WTERMSIG(status)
+  return elapsed, usage.ru_maxrss, p.returncode
+
+# Remove what a run left in work, except the logs
+def cleanwork(work):
+  for name in os.listdir(work):
+    path = os.path.join(work, name)
+    if name.endswith(".log") or name == "sfbench.sql":
+      continue
+    if os.path.isdir(path):
+      shutil.rmtree(path)
+    else:
+      os.remove(path)
+
+# Results of an earlier run, keyed by (tool, scale)
+def readbaseline(path):
+  with open(path) as f:
+    results = json.load(f)["results"]
+  return dict(((r["tool"], r["scale"]), r) for r in results)
+
+# Regressions of results against baseline: slower by more than threshold
+# percent (and more than noise seconds), or a peak RSS more than threshold
+# percent larger
+def compare(results, baseline, threshold, noise):
+  regressions = []
+  limit = 1 + threshold / 100.0
+  for r in results:
+    b = baseline.get((r["tool"], r["scale"]))
+    if b is None or r["exit"] != 0 or b["exit"] != 0:
+      continue
+    if r["seconds"] > b["seconds"] * limit and r["seconds"] - b["seconds"] > noise:
+      regressions.append("%s at %d entries: %.2f sec, was %.2f sec (+%.0f%%)" % (
+        r["tool"], r["scale"], r["seconds"], b["seconds"], (r["seconds"] / b["seconds"] - 1) * 100))
+    if r["peak_rss_kb"] > b["peak_rss_kb"] * limit:
+      regressions.append("%s at %d entries: peak RSS %d KB, was %d KB (+%.0f%%)" % (
+        r["tool"], r["scale"], r["peak_rss_kb"], b["peak_rss_kb"], (float(r["peak_rss_kb"]) / b["peak_rss_kb"] - 1) * 100))
+  return regressions
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Benchmark the report tools against synthetic catalogs")
+parser.add_argument("--scales", type=scalelist, default=scalelist("1e4,1e5,1e6"), help="comma separated catalog sizes in entries (default 1e4,1e5,1e6)")
+parser.add_argument("--tools", default=",".join(t[0] for t in tools), help="comma separated tools to run (default: %(default)s)")
+parser.add_argument("--repeat", type=int, default=3, help="runs of each tool at each scale, the median is kept (default 3)")
+parser.add_argument("--volumes", type=int, default=2, help="volumes in the catalog (default 2)")
+parser.add_argument("--seed", type=int, default=1, help="catalog random seed (default 1)")
+parser.add_argument("--regenerate", action="store_true", help="regenerate the catalog even if it already matches the scale")
+parser.add_argument("--output", help="write the results as JSON to this file, e.g. to use as a later --baseline")
+parser.add_argument("--baseline", help="results of an earlier run to compare against")
+parser.add_argument("--threshold", type=float, default=20, help="percent slower, or larger peak RSS, than the baseline that fails the run (default 20)")
+parser.add_argument("--noise", type=float, default=0.5, help="seconds of slowdown always tolerated, for short runs (default 0.5)")
+parser.add_argument("--keep", action="store_true", help="keep the work directory with the tool logs")
+args = parser.parse_args()
+
+selected = [t.strip() for t in args.tools.split(",") if t.strip()]
+unknown = set(selected) - set(t[0] for t in tools)
+if unknown:
+  parser.error("unknown tool(s): %s" % (", ".join(sorted(unknown))))
+if args.repeat < 1:
+  parser.error("--repeat must be at least 1")
+baseline = None
+if args.baseline:
+  try:
+    baseline = readbaseline(args.baseline)
+  except (IOError, ValueError, KeyError), e:
+    parser.error("unable to read baseline %s: %s" % (args.baseline, e))
+
+try:
+  conn = psycopg2.connect(getpgauth())
+except psycopg2.DatabaseError, e:
+  print >> sys.stderr, "unable to connect to the database: %s" % (e)
+  sys.exit(1)
+cur = conn.cursor()
+
+work = tempfile.mkdtemp(prefix="sfbench-")
+with open(os.path.join(work, "sfbench.sql"), "w") as f:
+  f.write(reportconfig)
+
+results = []
+failed = []
+try:
+  for scale in args.scales:
+    model = sfsynth.Model(scale, args.volumes, seed=args.seed)
+    try:
+      catalog = sfsynth.existing(cur)
+      conn.rollback()
+      if args.regenerate or not sfsynth.matches(catalog, model):
+        log("generating a catalog of %d entries" % (scale))
+        catalog = sfsynth.generate(conn, model, log=log)
+    except (RuntimeError, psycopg2.Error), e:
+      print >> sys.stderr, "unable to generate the catalog: %s" % (str(e).strip())
+      sys.exit(1)
+    for name, command in tools:
+      if name not in selected:
+        continue
+      runs = []
+      for i in range(args.repeat):
+        runs.append(runtool(name, command(work), work))
+        cleanwork(work)
+      runs.sort()
+      seconds, rss, status = runs[len(runs) // 2]
+      if any(run[2] != 0 for run in runs):
+        status = [run[2] for run in runs if run[2] != 0][0]
+        failed.append("%s at %d entries exited with %d, see %s" % (name, scale, status, os.path.join(work, name + ".log")))
+      results.append({"tool": name, "scale": scale, "entries": catalog["entries"], "seconds": round(seconds, 3),
+                      "rate": round(catalog["entries"] / max(seconds, 0.001), 1), "peak_rss_kb": rss, "exit": status,
+                      "runs": [round(run[0], 3) for run in runs]})
+      log("%-14s %10d entries %9.2f sec %12.0f entries/sec %9d KB peak RSS%s" % (
+        name, scale, seconds, catalog["entries"] / max(seconds, 0.001), rss, "" if status == 0 else "  FAILED (%d)" % (status)))
+finally:
+  conn.close()
+  if args.keep or failed:
+    log("tool logs are in %s" % (work))
+  else:
+    shutil.rmtree(work)
+
+if args.output:
+  with open(args.output, "w") as f:
+    json.dump({"created": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "host": socket.gethostname(),
+               "seed": args.seed, "volumes": args.volumes, "repeat": args.repeat, "results": results},
+              f, indent=1, sort_keys=True)
+    f.write("\n")
+
+for msg in failed:
+  print >> sys.stderr, "FAILED: " + msg
+regressions = []
+if baseline is not None:
+  regressions = compare(results, baseline, args.threshold, args.noise)
+  for msg in regressions:
+    print >> sys.stderr, "REGRESSION: " + msg
+  if not regressions:
+    log("no regressions against %s (threshold %g%%)" % (args.baseline, args.threshold))
+if failed or regressions:
+  sys.exit(1)
@@ -0,0 +1,141 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# On-disk result cache for sfreport.py. Entries are plain files named by a
+# sha1 of the rendered query, the output kind and a catalog snapshot marker,
+# so a new scan (new run_time) naturally produces a new key. Entries expire
+# a per-lookup TTL after they were written (their mtime, which is never
+# touched again) and the whole cache is trimmed back to a size limit, least
+# recently used first (hits move the atime forward).
+
+import os
+import time
+import errno
+import hashlib
+import tempfile
+import threading
+
+class ResultCache(object):
+
+  def __init__(self, cachedir, maxbytes, refresh=False):
+    self.cachedir = cachedir
+    self.maxbytes = maxbytes
+    # refresh: never serve entries, but still store fresh results
+    self.refresh = refresh
+    self.lock = threading.Lock()
+    if not os.path.exists(cachedir):
+      try:
+        os.makedirs(cachedir)
+      except OSError, e:
+        if e.errno != errno.EEXIST:
+          raise
+
+  def key(self, *parts):
+    h = hashlib.sha1()
+    for part in parts:
+      h.update(str(part))
+      h.update("\0")
+    return h.hexdigest()
+
+  def path(self, key):
+    return os.path.join(self.cachedir, key)
+
+  # Return the path of a live entry for key, or None. Expired entries are
+  # removed; hits get a new atime, keeping the mtime they were written with,
+  # so size eviction is least recently used and the TTL still runs out.
+  def get(self, key, ttl):
+    if self.refresh:
+      return None
+    p = self.path(key)
+    now = time.time()
+    try:
+      st = os.stat(p)
+    except OSError:
+      return None
+    if now - st.st_mtime > ttl:
+      self.remove(p)
+      return None
+    try:
+      os.utime(p, (now, st.st_mtime))
+    except OSError:
+      return None
+    return p
+
+  # Open a temp file in the cache directory. Fill it, then call put() to
+  # publish it under key, or discard() to throw it away.
+  def newentry(self):
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=self.cachedir)
+    return os.fdopen(fd, "w+"), tmp
+
+  def put(self, key, tmp):
+    os.rename(tmp, self.path(key))
+    self.evict()
+
+  def discard(self, tmp):
+    self.remove(tmp)
+
+  def remove(self, p):
+    try:
+      os.remove(p)
+    except OSError:
+      pass
+
+  # Trim the cache to maxbytes, dropping the least recently used entries
+  def evict(self):
+    with self.lock:
+      entries = []
+      total = 0
+      for name in os.listdir(self.cachedir):
+        if name.startswith(".tmp-"):
+          continue
+        p = os.path.join(self.cachedir, name)
+        try:
+          st = os.stat(p)
+        except OSError:
+          continue
+        entries.append((st.st_atime, st.st_size, p))
+        total += st.st_size
+      entries.sort()
+      for atime, size, p in entries:
+        if total <= self.maxbytes:
+          break
+        self.remove(p)
+        total -= size
+
+# File-like object that writes to several files at once, used to fill a
+# cache entry while the report itself is being written
+class Tee(object):
+
+  def __init__(self, *files):
+    self.files = files
+
+  def write(self, data):
+    for f in self.files:
+      f.write(data)
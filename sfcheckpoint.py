@@ -0,0 +1,95 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Checkpoints for long exports that write their output in ordered chunks
+# (agedu.py --chunk, runquery.py --keyset). After each chunk the tool syncs
+# its output to disk and saves a small JSON state next to it: where the next
+# chunk starts and how long every output file was. --resume reads the state
+# back, cuts the output files to those lengths and carries on, so a failed
+# export picks up from its last complete chunk and ends up with the same
+# output as a run that never failed.
+
+import os
+import json
+
+class Checkpoint(object):
+
+  def __init__(self, path, version):
+    self.path = path
+    self.version = version
+
+  def exists(self):
+    return os.path.exists(self.path)
+
+  # The saved state, checked against the run about to resume: every key of
+  # expect must have the same value in the state (the query, the selection
+  # ...). Raises ValueError if there is no usable checkpoint.
+  def load(self, expect={}):
+    try:
+      with open(self.path) as f:
+        state = json.load(f)
+    except IOError:
+      raise ValueError("no checkpoint to resume from (%s)" % (self.path))
+    except ValueError:
+      raise ValueError("checkpoint %s is not readable" % (self.path))
+    if state.get('version') != self.version:
+      raise ValueError("checkpoint %s was written by another version" % (self.path))
+    for key, value in expect.items():
+      if state.get(key) != value:
+        raise ValueError("checkpoint %s is for another %s" % (self.path, key))
+    return state
+
+  # Save the state, written to a temporary file and renamed into place so a
+  # crash leaves either the old or the new checkpoint
+  def save(self, state):
+    state = dict(state)
+    state['version'] = self.version
+    tmp = self.path + ".tmp"
+    with open(tmp, "w") as f:
+      json.dump(state, f)
+      f.flush()
+      os.fsync(f.fileno())
+    os.rename(tmp, self.path)
+
+  def remove(self):
+    if os.path.exists(self.path):
+      os.remove(self.path)
+
+# Flush an open output file down to the disk
+def sync(f):
+  f.flush()
+  os.fsync(f.fileno())
+
+# Cut a file back to the length recorded in a checkpoint
+def truncate(path, size):
+  if os.path.getsize(path) < size:
+    raise ValueError("%s is shorter than its checkpoint, it can not be resumed" % (path))
+  with open(path, "r+b") as f:
+    f.truncate(size)
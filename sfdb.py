@@ -0,0 +1,323 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Shared database helpers for the Starfish report tools. Scripts in this
+# directory import it directly (import sfdb).
+
+import re
+import json
+import time
+import Queue
+import cPickle
+import hashlib
+import tempfile
+import threading
+import psycopg2
+
+placeholder = re.compile(r"\{\{(\w+)\}\}")
+
+# Split SQL into (text, kind) segments, kind being None for plain SQL, or
+# "'" (string literal), '"' (quoted identifier) or "-" (comment)
+def sqlsegments(query):
+  segments = []
+  i = 0
+  start = 0
+  n = len(query)
+  while i < n:
+    c = query[i]
+    if c in "'\"":
+      end = i + 1
+      while end < n:
+        if query[end] == c:
+          # a doubled quote is an escaped quote
+          if end + 1 < n and query[end + 1] == c:
+            end += 2
+            continue
+          break
+        end += 1
+      kind = c
+    elif query.startswith("--", i):
+      end = query.find("\n", i)
+      if end == -1:
+        end = n - 1
+      kind = "-"
+    elif query.startswith("/*", i):
+      end = query.find("*/", i)
+      if end == -1:
+        end = n - 1
+      else:
+        end += 1
+      kind = "-"
+    else:
+      i += 1
+      continue
+    if start < i:
+      segments.append((query[start:i], None))
+    segments.append((query[i:end + 1], kind))
+    i = end + 1
+    start = i
+  if start < n:
+    segments.append((query[start:], None))
+  return segments
+
+# Turn {{var}} placeholders into bound parameters. Placeholders in plain SQL
+# become %(var)s (or $n with positional=True, for PREPARE) and the value is
+# returned in params. Parameters can not appear inside string literals or
+# quoted identifiers, so placeholders there, and any var listed in raw (for
+# vars that hold SQL text such as a column name), are substituted as text.
+# Placeholders with no value are left alone.
+def compilequery(query, values, raw=(), positional=False):
+  if positional:
+    params = []
+    order = {}
+  else:
+    params = {}
+
+  def bind(m):
+    name = m.group(1)
+    if name not in values:
+      return m.group(0)
+    if name in raw:
+      return escape(values[name])
+    if positional:
+      if name not in order:
+        params.append(values[name])
+        order[name] = len(params)
+      return "$%d" % (order[name])
+    params[name] = values[name]
+    return "%%(%s)s" % (name)
+
+  def inline(quote):
+    def sub(m):
+      name = m.group(1)
+      if name not in values:
+        return m.group(0)
+      return escape(values[name].replace(quote, quote + quote))
+    return sub
+
+  # pyformat queries are %-interpolated by psycopg2, so a literal % is %%
+  def escape(text):
+    if positional:
+      return text
+    return text.replace("%", "%%")
+
+  out = []
+  for text, kind in sqlsegments(query):
+    if kind is None:
+      out.append(placeholder.sub(bind, escape(text)))
+    elif kind in "'\"":
+      out.append(placeholder.sub(inline(kind), escape(text)))
+    else:
+      out.append(escape(text))
+  return "".join(out), params
+
+# Names of the statements prepared on each backend, by backend pid. A
+# prepared statement belongs to the session, not the transaction: it is not
+# undone by a rollback and lasts until the connection is closed, so names are
+# only ever added.
+prepared = {}
+preparedlock = threading.Lock()
+
+# Run a positional ($n) query through PREPARE/EXECUTE, preparing it only the
+# first time it is seen on this connection, so repeated runs reuse the plan.
+# Note that the result can not be read through a named cursor or COPY.
+def executeprepared(cur, query, params):
+  name = "sfq_" + hashlib.sha1(query).hexdigest()[:16]
+  pid = cur.connection.get_backend_pid()
+  with preparedlock:
+    names = prepared.setdefault(pid, set())
+    isnew = name not in names
+  if isnew:
+    cur.execute("PREPARE %s AS %s" % (name, query))
+    with preparedlock:
+      names.add(name)
+  if params:
+    cur.execute("EXECUTE %s (%s)" % (name, ", ".join(["%s"] * len(params))), params)
+  else:
+    cur.execute("EXECUTE %s" % (name))
+
+# Wrap a SELECT in a COPY ... TO STDOUT statement that produces quoted CSV.
+# COPY only accepts a single character delimiter.
+def copyquery(cur, query, delimiter=",", header=True):
+  if len(delimiter) != 1:
+    raise ValueError("COPY requires a single character delimiter, got '%s'" % (delimiter))
+  query = query.strip().rstrip(";")
+  options = cur.mogrify("FORMAT csv, DELIMITER %s, HEADER %s", (delimiter, bool(header)))
+  return "COPY (%s) TO STDOUT WITH (%s)" % (query, options)
+
+# Stream the results of query to outfile through COPY and return the row count.
+# Quoting and NULL handling are done by the server, so there is no per-row
+# Python work; data is written to outfile as it arrives.
+# params, if given, are bound into query (pyformat) before it is wrapped.
+def copyexport(conn, query, outfile, delimiter=",", header=True, bufsize=65536, params=None):
+  with conn.cursor() as cur:
+    if params is not None:
+      query = cur.mogrify(query, params)
+    cur.copy_expert(copyquery(cur, query, delimiter, header), outfile, size=bufsize)
+    return cur.rowcount
+
+# Wrap a SELECT so it returns one chunk of its rows in keyset order: ordered
+# on the key columns (output columns of query that together identify a row,
+# and are never null), starting after the key of the previous chunk. The
+# wrapped query takes the previous key values (omitted with first=True) and
+# then the chunk size as %s parameters. A literal % in query is escaped, as
+# it is meant to be run without parameters.
+def keysetquery(query, columns, first=False):
+  query = query.strip().rstrip(";").replace("%", "%%")
+  keys = ", ".join('"%s"' % (c.replace('"', '""')) for c in columns)
+  where = ""
+  if not first:
+    where = " WHERE (%s) > (%s)" % (keys, ", ".join(["%s"] * len(columns)))
+  return "SELECT * FROM (%s) AS keyset%s ORDER BY %s LIMIT %%s" % (query, where, keys)
+
+# Run EXPLAIN on query and return its plan, parsed from FORMAT JSON: a dict
+# with "Plan", and with analyze also "Planning Time" and "Execution Time"
+# (ms). analyze runs the query, which costs as much again as the query.
+def explain(cur, query, params=None, analyze=False):
+  if analyze:
+    options = "ANALYZE, BUFFERS, FORMAT JSON"
+  else:
+    options = "FORMAT JSON"
+  cur.execute("EXPLAIN (%s) %s" % (options, query.strip().rstrip(";")), params)
+  plan = cur.fetchone()[0]
+  if isinstance(plan, basestring):
+    plan = json.loads(plan)
+  return plan[0]
+
+# One partition of a fanout(): its rows, or the error that stopped it. The
+# rows are spooled to an unnamed temp file as they are fetched, so neither
+# a big volume nor volumes finished ahead of their turn are held in memory;
+# batches() reads them back, count is how many there are.
+class Partition(object):
+
+  def __init__(self, volume):
+    self.volume = volume
+    self.columns = None
+    self.count = 0
+    self.spool = None
+    self.error = None
+    self.elapsed = 0.0
+    self.done = threading.Event()
+
+  # The rows, in lists of up to itersize as they were fetched
+  def batches(self):
+    if self.spool is None:
+      return
+    self.spool.seek(0)
+    while True:
+      try:
+        batch = cPickle.load(self.spool)
+      except EOFError:
+        return
+      yield batch
+
+  def close(self):
+    if self.spool is not None:
+      self.spool.close()
+      self.spool = None
+
+def runpartition(pool, query, params, timeout, part, itersize):
+  values = dict(params or {})
+  values['volume'] = part.volume
+  started = time.time()
+  conn = None
+  try:
+    conn = pool.getconn()
+    if timeout:
+      with conn.cursor() as cur:
+        # LOCAL: the timeout ends with the transaction, not the connection
+        cur.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+    part.spool = tempfile.TemporaryFile(prefix="sffanout-")
+    with conn.cursor(name="fanout") as cur:
+      cur.execute(query, values)
+      while True:
+        batch = cur.fetchmany(itersize)
+        if part.columns is None:
+          part.columns = [desc[0] for desc in cur.description]
+        if not batch:
+          break
+        cPickle.dump(batch, part.spool, cPickle.HIGHEST_PROTOCOL)
+        part.count += len(batch)
+  except Exception, e:
+    # not only database errors: spooling can fail too (disk full, a value
+    # that does not pickle), and the connection must go back either way
+    part.error = e
+    part.close()
+  finally:
+    if conn is not None:
+      try:
+        conn.rollback()
+        pool.putconn(conn)
+      except psycopg2.Error:
+        pool.putconn(conn, close=True)
+    part.elapsed = time.time() - started
+
+# Run query once per volume, each on its own connection from pool, with at
+# most limit running at once (the pool must allow that many connections)
+# and every statement cancelled after timeout seconds. The query takes the
+# volume as %(volume)s, next to params. Partitions are yielded in the order
+# of volumes, each as soon as it and all before it are done, and their
+# spooled rows are dropped when the next one is asked for. A failed
+# partition carries its error instead of rows, so one bad volume does not
+# stop the others.
+def fanout(pool, query, volumes, params=None, limit=4, timeout=None, itersize=10000):
+  parts = [Partition(volume) for volume in volumes]
+  todo = Queue.Queue()
+  for part in parts:
+    todo.put(part)
+  def worker():
+    while True:
+      try:
+        part = todo.get_nowait()
+      except Queue.Empty:
+        return
+      try:
+        runpartition(pool, query, params, timeout, part, itersize)
+      except Exception, e:
+        part.error = e
+        part.close()
+      part.done.set()
+  threads = [threading.Thread(target=worker) for i in range(max(1, min(limit, len(parts))))]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+  try:
+    for part in parts:
+      # wait in steps, so an interrupt is not held up
+      while not part.done.wait(1):
+        pass
+      yield part
+      part.close()
+    for thread in threads:
+      thread.join()
+  finally:
+    for part in parts:
+      if part.done.is_set():
+        part.close()
@@ -0,0 +1,223 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Streaming diff of two file listings: agedu dumps written by agedu.py, or
+# the catalog itself (live or a local snapshot). Both sides are read in the
+# order agedu.py writes them: by volume, directory path and file name, all
+# compared bytewise (COLLATE "C"). merge() walks the two sorted streams side
+# by side, so a diff takes one linear pass and constant memory whatever the
+# size of the dumps. Rollup totals the changes per directory (cut at a
+# given depth), per owner and per atime age bucket.
+#
+# Entries are (volume, dir path, file name, size, atime, uid). agedu dumps
+# do not carry the owner, so uid is None for them.
+
+import os
+import bisect
+
+dumpheader = "agedu dump file."
+
+# Same rows and order as agedu.py, with the owner added
+catalogquery = """SELECT f.size, extract(epoch from f.atime), v.name, d.path, f.name, f.uid
+  FROM sf.file_current f JOIN sf_volumes.volume v ON v.id = f.volume_id
+       JOIN sf.dir_current d ON f.parent_id = d.id
+  %s
+  ORDER BY v.name COLLATE "C", d.path COLLATE "C", f.name COLLATE "C" """
+
+kinds = ["added", "removed", "resized"]
+
+# Check that entries come in merge order; a dump that is not (hand edited,
+# or written by an older agedu.py that sorted volumes in the database
+# collation) would silently give a wrong diff.
+def ordered(entries, name):
+  last = None
+  for entry in entries:
+    key = entry[:3]
+    if last is not None and key <= last:
+      raise ValueError("%s is not in agedu order at %s:/%s" % (name, key[0], "/".join(key[1:]).lstrip("/")))
+    last = key
+    yield entry
+
+# Files of an agedu dump. Every directory block starts with a line for the
+# directory itself, which is not a file: it is told apart by the next line,
+# which is always a file directly inside it (blocks are only written for
+# directories with files, and a file can not have entries under it).
+def dumpentries(f, name="dump", volume=None):
+  header = f.readline()
+  if not header.startswith(dumpheader):
+    raise ValueError("%s is not an agedu dump" % (name))
+  def entries():
+    pending = None
+    for line in f:
+      fields = line.rstrip("\n").split(" ", 2)
+      if len(fields) != 3:
+        raise ValueError("%s: bad line '%s'" % (name, line.rstrip("\n")))
+      vname, sep, rest = fields[2].partition(":/")
+      dpath, sep, fname = rest.rpartition("/")
+      # the pending line was the directory line of this file's block
+      if pending is not None and (pending[0], pending[5]) != (vname, dpath):
+        if volume is None or pending[0] == volume:
+          yield pending[:5] + (None,)
+      pending = (vname, dpath, fname, int(fields[0]), int(fields[1]), rest)
+    if pending is not None and (volume is None or pending[0] == volume):
+      yield pending[:5] + (None,)
+  return ordered(entries(), name)
+
+# Files of the catalog, through a named cursor so memory does not grow with
+# the number of files. conn is a psycopg2 connection or a snapshot opened
+# with sfsnapshot.connect().
+def catalogentries(conn, volume=None, itersize=10000, name="catalog"):
+  where = ""
+  params = {}
+  if volume is not None:
+    where = "WHERE v.name = %(volume)s"
+    params['volume'] = volume
+  def entries():
+    cur = conn.cursor(name="sfdiff")
+    cur.itersize = itersize
+    cur.execute(catalogquery % (where), params)
+    for row in cur:
+      yield (row[2], row[3] or "", row[4], int(row[0]), int(row[1] or 0), row[5])
+    cur.close()
+  return ordered(entries(), name)
+
+# When a dump was taken: the run time recorded in its sidecar index, or the
+# time the dump file was written
+def dumptime(path):
+  try:
+    with open(path + ".idx") as f:
+      return float(f.readline().split("\t")[1])
+  except (IOError, IndexError, ValueError):
+    return os.path.getmtime(path)
+
+# Merge-join two entry streams in agedu order. Yields (kind, old, new) for
+# every file on either side, kind being "added", "removed", "resized" or
+# "same"; old or new is None for a file only on the other side.
+def merge(old, new):
+  old = iter(old)
+  new = iter(new)
+  o = next(old, None)
+  n = next(new, None)
+  while o is not None or n is not None:
+    if n is None or (o is not None and o[:3] < n[:3]):
+      yield "removed", o, None
+      o = next(old, None)
+    elif o is None or n[:3] < o[:3]:
+      yield "added", None, n
+      n = next(new, None)
+    else:
+      yield ("resized" if o[3] != n[3] else "same"), o, n
+      o = next(old, None)
+      n = next(new, None)
+
+# A delta is [files added, bytes added, files removed, bytes removed, files
+# resized, bytes gained by resized files (negative if they shrank)]
+def newdelta():
+  return [0, 0, 0, 0, 0, 0]
+
+def netfiles(delta):
+  return delta[0] - delta[2]
+
+def netbytes(delta):
+  return delta[1] - delta[3] + delta[5]
+
+# Totals of the changes of one diff: overall, per directory (the directory
+# path cut to depth components, 0 for the full path), per uid (None when the
+# owner is not known) and per age bucket of the file's atime, edges being
+# the bucket boundaries in days as from sfhist.parsebuckets(). A file is
+# aged by its new atime, or its old one if it was removed.
+#
+# The directory totals grow with the number of directories at depth. With
+# onleaf set, the totals of every directory that has changes are also
+# passed to onleaf(volume, dir path, delta) as soon as the merge moves past
+# it, which takes no memory at all.
+class Rollup(object):
+
+  def __init__(self, depth, edges, now, onleaf=None):
+    self.depth = depth
+    self.edges = edges
+    self.now = now
+    self.onleaf = onleaf
+    self.total = newdelta()
+    self.same = 0
+    self.dirs = {}
+    self.users = {}
+    self.ages = [newdelta() for i in range(len(edges) + 1)]
+    self.leaf = None
+    self.leafdelta = None
+
+  def dirkey(self, vname, dpath):
+    if self.depth > 0:
+      dpath = "/".join(dpath.split("/")[:self.depth])
+    return (vname, dpath)
+
+  def add(self, kind, old, new):
+    if kind == "same":
+      self.same += 1
+      return
+    entry = new if new is not None else old
+    if kind == "added":
+      cells = ((0, 1), (1, new[3]))
+    elif kind == "removed":
+      cells = ((2, 1), (3, old[3]))
+    else:
+      cells = ((4, 1), (5, new[3] - old[3]))
+    uid = entry[5]
+    if uid is None and old is not None:
+      uid = old[5]
+    age = (self.now - entry[4]) / 86400.0
+    key = self.dirkey(entry[0], entry[1])
+    if self.onleaf is not None and self.leaf != entry[:2]:
+      self.flushleaf()
+      self.leaf = entry[:2]
+      self.leafdelta = newdelta()
+    for delta in (self.total, self.dirs.setdefault(key, newdelta()), self.users.setdefault(uid, newdelta()),
+                  self.ages[bisect.bisect_right(self.edges, age)], self.leafdelta):
+      if delta is None:
+        continue
+      for i, v in cells:
+        delta[i] += v
+
+  def flushleaf(self):
+    if self.leaf is not None:
+      self.onleaf(self.leaf[0], self.leaf[1], self.leafdelta)
+      self.leaf = None
+
+  # all changes added
+  def close(self):
+    if self.onleaf is not None:
+      self.flushleaf()
+
+  # the directories with the largest net change in bytes (or files), as
+  # (volume, dir path, delta)
+  def topdirs(self, n, by="bytes"):
+    net = netbytes if by == "bytes" else netfiles
+    rows = sorted(self.dirs.items(), key=lambda item: (-abs(net(item[1])), item[0]))
+    return [(key[0], key[1], delta) for key, delta in rows[:n]]
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Export a consistent snapshot of the catalog tables the reports read into
+# local Parquet files (see sfsnapshot.py). sfreport.py, agedu.py and
+# runquery.py can then run against it with --source snapshot:<dir>, so
+# repeated reports read the production database once per snapshot.
+
+import psycopg2
+import ConfigParser
+import sys
+import time
+import argparse
+import sfsnapshot
+
+def getpgauth():
+  config = ConfigParser.ConfigParser()
+  config.read("/opt/starfish/etc/99-local.ini")
+  return(config.get('pg','pg_uri'))
+
+def log(msg):
+  print >> sys.stderr, msg
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Export a local Parquet snapshot of the catalog for --source snapshot:<dir>")
+parser.add_argument("--output", required=True, help="snapshot directory, replaced once the new snapshot is complete")
+parser.add_argument("--volume", action="append", help="volume to export, may be repeated (default: all volumes)")
+parser.add_argument("--itersize", type=int, default=100000, help="rows fetched per round trip and written per row group (default 100000)")
+args = parser.parse_args()
+
+try:
+  conn = psycopg2.connect(getpgauth())
+except psycopg2.DatabaseError, e:
+  print >> sys.stderr, "unable to connect to the database: %s" % (e)
+  sys.exit(1)
+
+started = time.time()
+try:
+  meta = sfsnapshot.export(conn, args.output, args.volume, args.itersize, log)
+except ImportError, e:
+  print >> sys.stderr, e
+  sys.exit(1)
+except psycopg2.Error, e:
+  print >> sys.stderr, "snapshot export failed: %s" % (e)
+  sys.exit(1)
+conn.close()
+log("snapshot of %d tables written to %s in %.1f sec" % (len(meta['tables']), args.output, time.time() - started))
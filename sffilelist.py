@@ -0,0 +1,93 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Protocol between sffilelistd.py and its clients (filelist.py, and
+# filelist.sh when the service is running). A client sends one JSON request
+# line over the Unix socket:
+#   {"volume": "vol" or "vol:path" or null, "age": months, "time": "atime" or
+#    "mtime", "format": "csv" or "tsv", "user": name (root only)}
+# and the daemon answers with one JSON header line, {"ok": true, "bytes": n,
+# ...} followed by the n bytes of the file list, or {"ok": false, "error":
+# "..."}. The daemon takes the user from the peer credentials of the
+# connection, so only root can ask for another user's files.
+
+import json
+import socket
+
+socketpath = "/opt/starfish/run/sffilelistd.sock"
+ages = (1, 3, 6, 12, 24, 36)
+times = ("atime", "mtime")
+formats = ("csv", "tsv")
+# longest request or header line
+maxline = 4096
+
+class FileListError(Exception):
+  pass
+
+def readheader(f):
+  line = f.readline(maxline + 1)
+  if not line.endswith("\n"):
+    raise FileListError("connection closed before a complete message was received")
+  try:
+    message = json.loads(line)
+  except ValueError:
+    raise FileListError("malformed message")
+  if not isinstance(message, dict):
+    raise FileListError("malformed message")
+  return message
+
+def writeheader(sock, message):
+  sock.sendall(json.dumps(message, sort_keys=True) + "\n")
+
+# Ask the daemon at path for a file list and copy it to out. Returns the
+# response header; a refused request raises FileListError, and a daemon
+# that is not running socket.error.
+def fetch(out, volume=None, age=1, time="atime", format="csv", user=None, path=socketpath, bufsize=65536):
+  request = {"volume": volume, "age": age, "time": time, "format": format}
+  if user is not None:
+    request["user"] = user
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(path)
+    writeheader(sock, request)
+    f = sock.makefile("rb")
+    header = readheader(f)
+    if not header.get("ok"):
+      raise FileListError(header.get("error", "request refused"))
+    left = header["bytes"]
+    while left > 0:
+      data = f.read(min(bufsize, left))
+      if not data:
+        raise FileListError("connection closed after %d of %d bytes" % (header["bytes"] - left, header["bytes"]))
+      out.write(data)
+      left -= len(data)
+    return header
+  finally:
+    sock.close()
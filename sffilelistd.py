@@ -0,0 +1,396 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# sffilelistd: file list service for filelist.py (and filelist.sh). Users
+# ask it over a Unix socket for the files they own that are older than an
+# age, instead of each running a fresh sf query through sudo. The user is
+# taken from the peer credentials of the connection (SO_PEERCRED), so no
+# sudo is needed and nobody can ask for someone else's files, except root.
+#
+# Lists are built by a fixed number of workers on warm database connections.
+# Identical requests that arrive while one is queued or running wait for it
+# instead of running again, and finished lists are kept in a result cache
+# (sfcache) until the catalog changes (--marker-query) or --ttl passes, so
+# the rush after a deadline email costs one query per user. When more than
+# --max-queue lists are waiting, new requests are turned away.
+
+import psycopg2
+import psycopg2.pool
+import ConfigParser
+import os
+import sys
+import csv
+import pwd
+import json
+import time
+import errno
+import signal
+import socket
+import struct
+import calendar
+import datetime
+import argparse
+import threading
+import Queue
+import sfcache
+import sfnames
+import sffilelist
+
+SO_PEERCRED = getattr(socket, "SO_PEERCRED", 17)
+
+headertimes = {"atime": "last accessed", "mtime": "last modified"}
+delimiters = {"csv": ",", "tsv": "\t"}
+
+# Seconds a client gets to send its request, and then to take each chunk
+# of its list; a client that stops reading is dropped, so it can not hold
+# a handler thread
+readtimeout = 10
+sendtimeout = 60
+
+def getpgauth():
+  config = ConfigParser.ConfigParser()
+  config.read("/opt/starfish/etc/99-local.ini")
+  return(config.get('pg','pg_uri'))
+
+loglock = threading.Lock()
+
+def log(msg):
+  with loglock:
+    line = "%s:  %s\n" % (datetime.datetime.now().strftime("%Y%m%d-%H%M%S"), msg)
+    if args.log:
+      with open(args.log, "a") as f:
+        f.write(line)
+    else:
+      sys.stderr.write(line)
+
+# The date age months before day, as `date -d "now - N months"` gives it
+def cutoff(day, age):
+  month = day.month - 1 - age
+  year = day.year + month // 12
+  month = month % 12 + 1
+  return datetime.date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+# Validate a request from a peer with uid. Returns the request with the
+# user (name, uid) filled in, or raises FileListError.
+def checkrequest(request, uid):
+  if request.get("age") not in sffilelist.ages:
+    raise sffilelist.FileListError("age must be one of %s" % (", ".join(str(a) for a in sffilelist.ages)))
+  if request.get("time") not in sffilelist.times:
+    raise sffilelist.FileListError("time must be atime or mtime")
+  if request.get("format") not in sffilelist.formats:
+    raise sffilelist.FileListError("format must be csv or tsv")
+  volume = request.get("volume")
+  if volume is not None and (not isinstance(volume, basestring) or volume.strip(":") == ""):
+    raise sffilelist.FileListError("invalid volume")
+  checked = {"age": request["age"], "time": request["time"], "format": request["format"]}
+  checked["volume"], checked["path"] = None, None
+  if volume is not None:
+    name, sep, path = volume.encode("utf-8").partition(":")
+    checked["volume"] = name
+    if path.strip("/"):
+      checked["path"] = path.strip("/")
+  user = request.get("user")
+  if user is not None and not isinstance(user, basestring):
+    raise sffilelist.FileListError("invalid user")
+  if user and uid != 0:
+    raise sffilelist.FileListError("only root can list the files of another user")
+  try:
+    if user:
+      entry = pwd.getpwnam(user.encode("utf-8"))
+    else:
+      entry = pwd.getpwuid(uid)
+    checked["user"], checked["uid"] = entry.pw_name, entry.pw_uid
+  except KeyError:
+    if user:
+      raise sffilelist.FileListError("unknown user %s" % (user))
+    checked["user"], checked["uid"] = str(uid), uid
+  return checked
+
+# SQL and parameters for the files of a request. A volume:path restricts
+# the list to that directory and everything below it.
+def listquery(request, before):
+  where = ["f.uid = %(uid)s", "f.%s < %%(before)s" % (request["time"])]
+  params = {"uid": request["uid"], "before": before}
+  if request["volume"] is not None:
+    where.append("v.name = %(volume)s")
+    params["volume"] = request["volume"]
+  if request["path"] is not None:
+    where.append("(d.path = %(path)s OR d.path LIKE %(prefix)s)")
+    params["path"] = request["path"]
+    params["prefix"] = request["path"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%"
+  return """SELECT v.name, d.path, f.name, to_char(f.%s, 'YYYY-MM-DD'), f.size, f.gid
+  FROM sf.file_current f JOIN sf_volumes.volume v ON v.id = f.volume_id
+       JOIN sf.dir_current d ON d.id = f.parent_id
+  WHERE %s""" % (request["time"], " AND ".join(where)), params
+
+# One file list being built, shared by every request that asked for it
+class Job(object):
+
+  def __init__(self, key, request, before):
+    self.key = key
+    self.request = request
+    self.before = before
+    self.done = threading.Event()
+    self.path = None
+    self.error = None
+    self.waiting = 1
+
+class FileListService(object):
+
+  def __init__(self, pool, cache, names, workers, maxqueue, ttl, markerquery, markerinterval, itersize):
+    self.pool = pool
+    self.cache = cache
+    self.names = names
+    self.nameslock = threading.Lock()
+    self.maxqueue = maxqueue
+    self.ttl = ttl
+    self.markerquery = markerquery
+    self.markerinterval = markerinterval
+    self.itersize = itersize
+    self.markerlock = threading.Lock()
+    self.markervalue = None
+    self.markertime = 0
+    self.lock = threading.Lock()
+    self.jobs = {}
+    self.todo = Queue.Queue()
+    for i in range(workers):
+      t = threading.Thread(target=self.worker)
+      t.daemon = True
+      t.start()
+
+  # A value that changes with every catalog scan, looked up at most once
+  # every markerinterval seconds
+  def marker(self):
+    with self.markerlock:
+      if time.time() - self.markertime > self.markerinterval:
+        conn = self.pool.getconn()
+        try:
+          with conn.cursor() as cur:
+            cur.execute(self.markerquery)
+            self.markervalue = repr(cur.fetchone())
+          conn.rollback()
+        finally:
+          self.pool.putconn(conn)
+        self.markertime = time.time()
+      return self.markervalue
+
+  # Path of the finished list for request, and how it was found: "cached",
+  # "joined" (another request was already building it) or "queued"
+  def submit(self, request):
+    before = cutoff(datetime.date.today(), request["age"])
+    key = self.cache.key("filelist", request["uid"], request["volume"], request["path"], request["age"],
+                         request["time"], request["format"], before, self.marker())
+    path = self.cache.get(key, self.ttl)
+    if path is not None:
+      return path, "cached"
+    with self.lock:
+      job = self.jobs.get(key)
+      if job is not None:
+        job.waiting += 1
+        how = "joined"
+      else:
+        if self.todo.qsize() >= self.maxqueue:
+          raise sffilelist.FileListError("the file list service is busy, please try again later")
+        job = Job(key, request, before)
+        self.jobs[key] = job
+        self.todo.put(job)
+        how = "queued"
+    job.done.wait()
+    if job.error is not None:
+      raise sffilelist.FileListError("the file list could not be built: %s" % (job.error))
+    return job.path, how
+
+  def worker(self):
+    while True:
+      job = self.todo.get()
+      started = time.time()
+      try:
+        rows = self.build(job)
+        log("built list for %s (%d rows, %d request(s)) in %.1f sec" % (job.request["user"], rows, job.waiting, time.time() - started))
+      except Exception, e:
+        job.error = str(e).strip()
+        log("list for %s failed: %s" % (job.request["user"], job.error))
+      with self.lock:
+        del self.jobs[job.key]
+      job.done.set()
+
+  def groupname(self, gid):
+    with self.nameslock:
+      return self.names.group(gid) or gid
+
+  # Run the query of job into a new cache entry, itersize rows at a time
+  def build(self, job):
+    request = job.request
+    query, params = listquery(request, job.before)
+    delimiter = delimiters[request["format"]]
+    entry, tmp = self.cache.newentry()
+    rows = 0
+    conn = self.pool.getconn()
+    try:
+      with entry:
+        entry.write(delimiter.join(["volume", "path", "filename", headertimes[request["time"]],
+                                    "Size(bytes)", "groupname", "username"]) + "\n")
+        writer = csv.writer(entry, delimiter=delimiter, lineterminator="\n")
+        cur = conn.cursor(name="filelist")
+        cur.itersize = self.itersize
+        cur.execute(query, params)
+        batch = cur.fetchmany(self.itersize)
+        while batch:
+          writer.writerows([(v, p, n, t, s, self.groupname(g), request["user"]) for v, p, n, t, s, g in batch])
+          rows += len(batch)
+          batch = cur.fetchmany(self.itersize)
+        cur.close()
+      conn.rollback()
+    except:
+      self.cache.discard(tmp)
+      if not conn.closed:
+        conn.rollback()
+      raise
+    finally:
+      # a connection the server dropped is not handed out again
+      self.pool.putconn(conn, close=bool(conn.closed))
+    self.cache.put(job.key, tmp)
+    job.path = self.cache.path(job.key)
+    return rows
+
+# Serve one connection: read the request, wait for the list and stream it
+def handle(sock, service):
+  started = time.time()
+  user = "?"
+  try:
+    sock.settimeout(readtimeout)
+    pid, uid, gid = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, SO_PEERCRED, struct.calcsize("3i")))
+    user = "uid %d (pid %d)" % (uid, pid)
+    try:
+      request = checkrequest(sffilelist.readheader(sock.makefile("rb")), uid)
+      user = request["user"]
+      path, how = service.submit(request)
+      data = open(path, "rb")
+    except sffilelist.FileListError, e:
+      log("refused request from %s: %s" % (user, e))
+      sffilelist.writeheader(sock, {"ok": False, "error": str(e)})
+      return
+    except (IOError, psycopg2.Error), e:
+      log("request from %s failed: %s" % (user, str(e).strip()))
+      sffilelist.writeheader(sock, {"ok": False, "error": "the file list service failed, please try again later"})
+      return
+    sock.settimeout(sendtimeout)
+    with data:
+      size = os.fstat(data.fileno()).st_size
+      sffilelist.writeheader(sock, {"ok": True, "bytes": size, "source": how, "user": request["user"]})
+      while True:
+        chunk = data.read(65536)
+        if not chunk:
+          break
+        sock.sendall(chunk)
+    log("sent %s list for %s (%d bytes, %s) in %.1f sec" % (request["format"], user, size, how, time.time() - started))
+  except socket.error, e:
+    log("connection from %s lost: %s" % (user, e))
+  finally:
+    sock.close()
+
+# Bind the socket at path, unless a daemon is already listening there
+def listen(path):
+  if os.path.exists(path):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      probe.connect(path)
+      probe.close()
+      print >> sys.stderr, "another sffilelistd is already listening on %s" % (path)
+      sys.exit(1)
+    except socket.error:
+      os.remove(path)
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  sock.bind(path)
+  # anyone may connect, the peer credentials say who they are
+  os.chmod(path, 0666)
+  sock.listen(128)
+  return sock
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="File list service for filelist.py, on a Unix socket")
+parser.add_argument("--socket", default=sffilelist.socketpath, help="socket to listen on (default %(default)s)")
+parser.add_argument("--workers", type=int, default=4, help="lists built at once, each on its own database connection (default 4)")
+parser.add_argument("--max-queue", type=int, default=500, help="lists waiting for a worker before new requests are turned away (default 500)")
+parser.add_argument("--cache-dir", default="/opt/starfish/cache/filelist/", help="where finished lists are kept (default %(default)s)")
+parser.add_argument("--cache-size", type=int, default=10*1024*1024*1024, help="bytes of finished lists to keep (default 10 GB)")
+parser.add_argument("--ttl", type=int, default=86400, help="seconds a finished list is served for at most (default 86400)")
+parser.add_argument("--marker-query", default="SELECT MAX(run_time) FROM sf_reports.last_time_generic_current", help="query whose result changes with every catalog scan; lists are rebuilt when it does (default: %(default)s)")
+parser.add_argument("--marker-interval", type=int, default=60, help="seconds between runs of the marker query (default 60)")
+parser.add_argument("--itersize", type=int, default=10000, help="rows fetched per round trip (default 10000)")
+parser.add_argument("--name-cache", help="file to keep resolved group names in between runs")
+parser.add_argument("--log", default="/opt/starfish/log/sffilelistd.log", help="log file, or '' for stderr (default %(default)s)")
+args = parser.parse_args()
+if args.workers < 1:
+  parser.error("--workers must be at least 1")
+
+try:
+  pool = psycopg2.pool.ThreadedConnectionPool(1, args.workers + 1, getpgauth())
+except psycopg2.DatabaseError, e:
+  print >> sys.stderr, "unable to connect to the database: %s" % (e)
+  sys.exit(1)
+
+try:
+  cache = sfcache.ResultCache(args.cache_dir, args.cache_size)
+  # lists are only handed out through the socket
+  os.chmod(args.cache_dir, 0700)
+except OSError, e:
+  print >> sys.stderr, "unable to open the cache directory %s: %s" % (args.cache_dir, e)
+  sys.exit(1)
+
+names = sfnames.NameCache(cachefile=args.name_cache)
+service = FileListService(pool, cache, names, args.workers, args.max_queue, args.ttl,
+                          args.marker_query, args.marker_interval, args.itersize)
+server = listen(args.socket)
+# exit through the finally below on SIGTERM, so the socket is removed
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+log("listening on %s with %d workers" % (args.socket, args.workers))
+try:
+  while True:
+    try:
+      client, address = server.accept()
+    except socket.error, e:
+      if e.errno == errno.EINTR:
+        continue
+      raise
+    t = threading.Thread(target=handle, args=(client, service))
+    t.daemon = True
+    t.start()
+finally:
+  server.close()
+  os.remove(args.socket)
+  with service.nameslock:
+    names.save()
+  pool.closeall()
+  log("stopped")
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Fill a scratch database with a synthetic Starfish catalog (see sfsynth.py)
+# to benchmark the report tools without a live Starfish install. By default
+# the database is the one in 99-local.ini, which the tools also read, so
+# run this on a test host. A database holding a real catalog is never
+# replaced. Generation runs at about 70k entries a second.
+
+import psycopg2
+import ConfigParser
+import sys
+import argparse
+import sfsynth
+
+def getpgauth():
+  config = ConfigParser.ConfigParser()
+  config.read("/opt/starfish/etc/99-local.ini")
+  return(config.get('pg','pg_uri'))
+
+def log(msg):
+  print >> sys.stderr, msg
+
+# entries can be given as 1e6
+def count(text):
+  return int(float(text))
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Generate a synthetic Starfish catalog in a scratch database")
+parser.add_argument("--entries", type=count, required=True, help="files and directories to generate, e.g. 1e6")
+parser.add_argument("--volumes", type=int, default=2, help="volumes to spread the entries over (default 2)")
+parser.add_argument("--users", type=int, default=200, help="number of owners (default 200)")
+parser.add_argument("--groups", type=int, default=20, help="number of groups (default 20)")
+parser.add_argument("--seed", type=int, default=1, help="random seed; the same entries and seed give the same catalog (default 1)")
+parser.add_argument("--history", type=int, default=8, help="weekly sf_reports history snapshots (default 8)")
+parser.add_argument("--cost-per-tb", type=float, default=10.0, help="cost of a TB for the sf_reports cost column (default 10)")
+parser.add_argument("--dsn", help="database to fill (default: pg_uri from 99-local.ini)")
+args = parser.parse_args()
+
+try:
+  model = sfsynth.Model(args.entries, args.volumes, args.users, args.groups, args.seed)
+except ValueError, e:
+  parser.error(str(e))
+
+try:
+  conn = psycopg2.connect(args.dsn or getpgauth())
+except psycopg2.DatabaseError, e:
+  print >> sys.stderr, "unable to connect to the database: %s" % (e)
+  sys.exit(1)
+
+try:
+  catalog = sfsynth.generate(conn, model, args.history, args.cost_per_tb, log)
+except RuntimeError, e:
+  print >> sys.stderr, e
+  sys.exit(1)
+except psycopg2.Error, e:
+  print >> sys.stderr, "catalog generation failed: %s" % (e)
+  sys.exit(1)
+conn.close()
+log("%d files and %d directories on %d volume(s) generated in %.1f sec" % (
+  catalog['files'], catalog['dirs'], catalog['volumes'], catalog['elapsed']))
@@ -0,0 +1,234 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Age histograms for the file age reports. Files are streamed from the
+# catalog in batches of (size, atime, mtime, ctime, uid, gid, volume, dir)
+# and every AgeHistogram fed from the same scan is updated with a few NumPy
+# operations per batch, so one pass over the files answers any number of
+# age reports: per user, group, volume or directory (or a combination), on
+# atime, mtime or ctime, with any bucket boundaries. Each histogram keeps
+# file counts and bytes per bucket, plus a finer log-scale histogram of
+# ages from which percentiles are read.
+
+import re
+import time
+import numpy
+
+# Columns of a scan batch, in query order. Times are epoch seconds.
+columns = ["size", "atime", "mtime", "ctime", "uid", "gid", "volume", "dir"]
+keycolumns = ["uid", "gid", "volume", "dir"]
+timecolumns = ["atime", "mtime", "ctime"]
+
+dayseconds = 86400.0
+unitdays = {"d": 1.0, "w": 7.0, "m": 365.25 / 12, "y": 365.25}
+
+# Parse bucket boundaries such as "1m,3m,6m,1y,2y,3y" (units d, w, m or y;
+# a bare number is months). Returns (boundaries in days, their names as
+# written, with the unit).
+def boundaries(spec):
+  edges = []
+  names = []
+  for part in spec.split(","):
+    part = part.strip().lower()
+    m = re.match(r"^(\d+(?:\.\d+)?)([dwmy]?)$", part)
+    if not m:
+      raise ValueError("invalid bucket boundary '%s'" % (part))
+    edges.append(float(m.group(1)) * unitdays[m.group(2) or "m"])
+    names.append(part if m.group(2) else part + "m")
+  if not edges or edges != sorted(set(edges)):
+    raise ValueError("bucket boundaries must be given in increasing order")
+  return edges, names
+
+# Returns (boundaries in days, labels) for a boundaries() spec; the buckets
+# are below the first boundary, between each pair, and above the last.
+def parsebuckets(spec):
+  edges, names = boundaries(spec)
+  labels = ["< " + names[0]]
+  labels += ["%s-%s" % (names[i], names[i + 1]) for i in range(len(names) - 1)]
+  labels.append("> " + names[-1])
+  return edges, labels
+
+# The buckets of spec that hold files older than age months, as (bucket
+# index, label). A bucket that starts younger than age only holds its files
+# older than that, so its label starts at age instead.
+def olderbuckets(spec, age):
+  edges, names = boundaries(spec)
+  agedays = float(age) * unitdays["m"]
+  agename = "%gm" % (float(age))
+  lows = [0.0] + edges
+  highs = edges + [float("inf")]
+  labels = parsebuckets(spec)[1]
+  out = []
+  for i in range(len(labels)):
+    if highs[i] <= agedays + 0.5:
+      continue
+    if lows[i] < agedays - 0.5:
+      if i == len(edges):
+        labels[i] = "> " + agename
+      else:
+        labels[i] = "%s-%s" % (agename, names[i])
+    out.append((i, labels[i]))
+  return out
+
+# The scan query, with epoch times so a batch converts straight to floats.
+# A missing time counts as the epoch, i.e. oldest.
+def scanquery(where=""):
+  return """SELECT f.size,
+       COALESCE(extract(epoch from f.atime), 0),
+       COALESCE(extract(epoch from f.mtime), 0),
+       COALESCE(extract(epoch from f.ctime), 0),
+       f.uid, f.gid, f.volume_id, f.parent_id
+  FROM sf.file_current f
+  %s""" % (where)
+
+class AgeHistogram(object):
+
+  # edges: bucket boundaries in days. by: a key column, or a tuple of them.
+  # resolution: number of log-scale bins (1 day to 100 years) used for
+  # percentiles, 0 to keep none.
+  def __init__(self, edges, field="atime", by="uid", now=None, resolution=64):
+    if field not in timecolumns:
+      raise ValueError("unknown time column '%s'" % (field))
+    if isinstance(by, basestring):
+      by = (by,)
+    for column in by:
+      if column not in keycolumns:
+        raise ValueError("unknown key column '%s'" % (column))
+    self.edges = numpy.asarray(edges, dtype=numpy.float64)
+    self.field = field
+    self.by = tuple(by)
+    self.now = now if now is not None else time.time()
+    self.nbuckets = len(edges) + 1
+    self.keys = {}
+    self.counts = numpy.zeros((0, self.nbuckets), dtype=numpy.int64)
+    self.bytes = numpy.zeros((0, self.nbuckets), dtype=numpy.float64)
+    if resolution:
+      self.fineedges = numpy.concatenate(([0.0], numpy.logspace(0, numpy.log10(36525.0), resolution - 1)))
+    else:
+      self.fineedges = None
+    self.finecounts = numpy.zeros((0, resolution), dtype=numpy.int64)
+    self.finebytes = numpy.zeros((0, resolution), dtype=numpy.float64)
+
+  # Row number of every key in the batch, adding rows for new keys
+  def _rows(self, batch):
+    if len(self.by) == 1:
+      uniq, inverse = numpy.unique(batch[self.by[0]], return_inverse=True)
+      uniq = [(k,) for k in uniq.tolist()]
+    else:
+      stacked = numpy.column_stack([batch[column] for column in self.by])
+      uniq, inverse = numpy.unique(stacked, axis=0, return_inverse=True)
+      uniq = [tuple(k) for k in uniq.tolist()]
+    rows = numpy.empty(len(uniq), dtype=numpy.int64)
+    for i, key in enumerate(uniq):
+      row = self.keys.get(key)
+      if row is None:
+        row = len(self.keys)
+        self.keys[key] = row
+      rows[i] = row
+    grow = len(self.keys) - len(self.counts)
+    if grow > 0:
+      self.counts = numpy.vstack((self.counts, numpy.zeros((grow, self.nbuckets), dtype=numpy.int64)))
+      self.bytes = numpy.vstack((self.bytes, numpy.zeros((grow, self.nbuckets), dtype=numpy.float64)))
+      if self.fineedges is not None:
+        width = self.finecounts.shape[1]
+        self.finecounts = numpy.vstack((self.finecounts, numpy.zeros((grow, width), dtype=numpy.int64)))
+        self.finebytes = numpy.vstack((self.finebytes, numpy.zeros((grow, width), dtype=numpy.float64)))
+    return rows[inverse.reshape(-1)]
+
+  # Sum one batch (column -> array, see batch()) into the histogram
+  def add(self, batch):
+    if len(batch["size"]) == 0:
+      return
+    rows = self._rows(batch)
+    age = (self.now - batch[self.field]) / dayseconds
+    size = batch["size"]
+    cells = rows * self.nbuckets + numpy.searchsorted(self.edges, age, side="right")
+    n = len(self.keys) * self.nbuckets
+    self.counts += numpy.bincount(cells, minlength=n).reshape(-1, self.nbuckets)
+    self.bytes += numpy.bincount(cells, weights=size, minlength=n).reshape(-1, self.nbuckets)
+    if self.fineedges is not None:
+      width = self.finecounts.shape[1]
+      cells = rows * width + numpy.searchsorted(self.fineedges, age, side="right") - 1
+      cells = numpy.maximum(cells, rows * width)
+      n = len(self.keys) * width
+      self.finecounts += numpy.bincount(cells, minlength=n).reshape(-1, width)
+      self.finebytes += numpy.bincount(cells, weights=size, minlength=n).reshape(-1, width)
+
+  # Age in days below which q percent of the files (or of the bytes, with
+  # weighted) fall, interpolated within a log-scale bin
+  def percentile(self, key, q, weighted=False):
+    if self.fineedges is None:
+      raise ValueError("histogram was built without percentile bins")
+    row = self.keys[key]
+    hist = self.finebytes[row] if weighted else self.finecounts[row]
+    total = hist.sum()
+    if total == 0:
+      return None
+    cum = numpy.cumsum(hist)
+    target = total * q / 100.0
+    i = int(numpy.searchsorted(cum, target, side="left"))
+    i = min(i, len(hist) - 1)
+    lower = self.fineedges[i]
+    if i + 1 >= len(self.fineedges):
+      return float(lower)
+    upper = self.fineedges[i + 1]
+    before = cum[i - 1] if i > 0 else 0
+    frac = (target - before) / float(hist[i]) if hist[i] else 0.0
+    return float(lower + (upper - lower) * frac)
+
+  # (key, counts per bucket, bytes per bucket) for every key, in key order
+  def results(self):
+    for key in sorted(self.keys):
+      row = self.keys[key]
+      yield key, self.counts[row].tolist(), self.bytes[row].tolist()
+
+# Convert fetched rows (see scanquery) into a batch: column -> array
+def batch(rows):
+  data = numpy.array(rows, dtype=numpy.float64).reshape(-1, len(columns))
+  out = {}
+  for i, column in enumerate(columns):
+    if column in keycolumns:
+      out[column] = data[:, i].astype(numpy.int64)
+    else:
+      out[column] = data[:, i]
+  return out
+
+# Feed every histogram from one pass over an executed cursor. Returns the
+# number of files read.
+def scan(cursor, histograms, itersize=100000):
+  files = 0
+  rows = cursor.fetchmany(itersize)
+  while rows:
+    data = batch(rows)
+    for histogram in histograms:
+      histogram.add(data)
+    files += len(rows)
+    rows = cursor.fetchmany(itersize)
+  return files
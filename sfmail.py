@@ -0,0 +1,152 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# SMTP delivery shared by the report tools. A Mailer keeps one SMTP session
+# open for all the messages it sends instead of connecting per message.
+# Large reports are written to disk as MIME with writemessage() and streamed
+# to the server with Mailer.sendfile().
+
+import os
+import uuid
+import base64
+import smtplib
+import threading
+
+class Mailer(object):
+  # sendmail calls are serialized, and a dropped session is reopened once
+  # before giving up. Use one Mailer per thread for parallel delivery.
+
+  def __init__(self, host='localhost'):
+    self.host = host
+    self.smtp = None
+    self.lock = threading.Lock()
+
+  def sendmail(self, sender, recipients, msg):
+    with self.lock:
+      try:
+        if self.smtp is None:
+          self.smtp = smtplib.SMTP(self.host)
+        self.smtp.sendmail(sender, recipients, msg)
+      except smtplib.SMTPServerDisconnected:
+        self.smtp = smtplib.SMTP(self.host)
+        self.smtp.sendmail(sender, recipients, msg)
+
+  def close(self):
+    with self.lock:
+      if self.smtp is not None:
+        try:
+          self.smtp.quit()
+        except smtplib.SMTPException:
+          pass
+        self.smtp = None
+
+  # Send a complete message that is already written to the file at path,
+  # streaming it through DATA instead of holding it in memory
+  def sendfile(self, sender, recipients, path):
+    with self.lock:
+      try:
+        self.senddata(sender, recipients, path)
+      except smtplib.SMTPServerDisconnected:
+        self.smtp = None
+        self.senddata(sender, recipients, path)
+
+  def senddata(self, sender, recipients, path):
+    if self.smtp is None:
+      self.smtp = smtplib.SMTP(self.host)
+    smtp = self.smtp
+    smtp.ehlo_or_helo_if_needed()
+    code, resp = smtp.mail(sender)
+    if code != 250:
+      smtp.rset()
+      raise smtplib.SMTPSenderRefused(code, resp, sender)
+    refused = {}
+    for recipient in recipients:
+      code, resp = smtp.rcpt(recipient)
+      if code not in (250, 251):
+        refused[recipient] = (code, resp)
+    if len(refused) == len(recipients):
+      smtp.rset()
+      raise smtplib.SMTPRecipientsRefused(refused)
+    code, resp = smtp.docmd("data")
+    if code != 354:
+      smtp.rset()
+      raise smtplib.SMTPDataError(code, resp)
+    # CRLF line endings and dot-stuffing, sent in large chunks
+    chunk = []
+    chunklen = 0
+    with open(path) as f:
+      for line in f:
+        line = line.rstrip("\r\n")
+        if line.startswith("."):
+          line = "." + line
+        chunk.append(line + "\r\n")
+        chunklen += len(line) + 2
+        if chunklen >= 65536:
+          smtp.send("".join(chunk))
+          chunk = []
+          chunklen = 0
+    chunk.append(".\r\n")
+    smtp.send("".join(chunk))
+    code, resp = smtp.getreply()
+    if code != 250:
+      raise smtplib.SMTPDataError(code, resp)
+
+# Write a multipart MIME message to out without loading any attachment into
+# memory. attachments is a list of (path, content type, disposition); summary
+# is an optional text/plain part placed before them.
+def writemessage(out, sender, recipients, subject, attachments, summary=None):
+  boundary = "===============%s==" % (uuid.uuid4().hex)
+  out.write("Content-Type: multipart/mixed; boundary=\"%s\"\n" % (boundary))
+  out.write("MIME-Version: 1.0\n")
+  out.write("Subject: %s\n" % (subject))
+  out.write("From: %s\n" % (sender))
+  out.write("To: %s\n" % (", ".join(recipients)))
+  out.write("\n")
+  if summary is not None:
+    out.write("--%s\n" % (boundary))
+    out.write("Content-Type: text/plain; charset=\"us-ascii\"\n")
+    out.write("MIME-Version: 1.0\n")
+    out.write("Content-Transfer-Encoding: 7bit\n\n")
+    out.write(summary + "\n")
+  for path, ctype, disposition in attachments:
+    name = os.path.basename(path)
+    out.write("--%s\n" % (boundary))
+    out.write("Content-Type: %s; Name=\"%s\"\n" % (ctype, name))
+    out.write("MIME-Version: 1.0\n")
+    out.write("Content-Transfer-Encoding: base64\n")
+    out.write("Content-Disposition: %s;filename=\"%s\"\n\n" % (disposition, name))
+    with open(path, "rb") as f:
+      while True:
+        # a multiple of 57 bytes encodes to whole 76 character lines
+        data = f.read(57 * 1024)
+        if not data:
+          break
+        out.write(base64.encodestring(data))
+  out.write("--%s--\n" % (boundary))
@@ -0,0 +1,174 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Per-stage run metrics for sfreport.py. Each stage of a report run
+# (connect, checkout, cache, explain, execute, fetch, render, totals,
+# compress, smtp) is written as one JSON line to <log>.metrics.jsonl, next
+# to the report log, with its wall time, rows, bytes written and the
+# process peak RSS.
+# The totals of the last run can also be written as a Prometheus
+# textfile-collector file, to alert on report runtime regressions.
+
+import os
+import json
+import time
+import resource
+import tempfile
+
+# Metrics file that goes with a report logfile
+def metricspath(logfile):
+  return os.path.splitext(logfile)[0] + ".metrics.jsonl"
+
+def peakrss():
+  # ru_maxrss is reported in kilobytes on Linux
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class RunMetrics(object):
+
+  # path None keeps the records in memory only
+  def __init__(self, report, run, path=None):
+    self.report = report
+    self.run = run
+    self.path = path
+    self.started = time.time()
+    self.records = []
+    # Added to every record, e.g. the variable set of a --fanout run
+    self.context = {}
+
+  def stage(self, name, **extra):
+    return Stage(self, name, extra)
+
+  # Record a stage that was timed elsewhere
+  def add(self, name, seconds, rows=None, nbytes=None, ok=True, error=None, **extra):
+    record = {"time": round(time.time(), 3), "report": self.report, "run": self.run,
+              "stage": name, "seconds": round(seconds, 6), "rows": rows, "bytes": nbytes,
+              "peak_rss_kb": peakrss(), "ok": ok}
+    if error is not None:
+      record["error"] = str(error).strip()
+    record.update(self.context)
+    record.update(extra)
+    self.records.append(record)
+    if self.path is not None:
+      with open(self.path, "a") as f:
+        f.write(json.dumps(record, sort_keys=True, default=str) + "\n")
+    return record
+
+  # Record the run as a whole, as the last line of the run
+  def finish(self, ok, **extra):
+    rows = sum(r["rows"] for r in self.records if r["stage"] in ("fetch", "copy", "cache", "merge") and r["rows"])
+    nbytes = sum(r["bytes"] for r in self.records if r["stage"] in ("render", "copy", "cache", "merge", "totals") and r["bytes"])
+    return self.add("run", time.time() - self.started, rows, nbytes, ok, **extra)
+
+  # Sum the records of one stage: seconds, rows, bytes, peak RSS and whether
+  # every one of them succeeded
+  def totals(self):
+    stages = {}
+    for r in self.records:
+      t = stages.setdefault(r["stage"], [0.0, 0, 0, 0, 1])
+      t[0] += r["seconds"]
+      t[1] += r["rows"] or 0
+      t[2] += r["bytes"] or 0
+      t[3] = max(t[3], r["peak_rss_kb"])
+      if not r["ok"]:
+        t[4] = 0
+    return stages
+
+  # Write the last run to <directory>/sfreport_<report>.prom for the node
+  # exporter textfile collector. The file is replaced atomically, so the
+  # collector never reads a partly written file.
+  def writeprometheus(self, directory):
+    label = self.report.replace("\\", "\\\\").replace('"', '\\"')
+    stages = self.totals()
+    lines = []
+    for metric, i, scale, text in (("sfreport_stage_seconds", 0, 1, "Wall time of each stage of the last report run"),
+                                   ("sfreport_stage_rows", 1, 1, "Rows handled by each stage of the last report run"),
+                                   ("sfreport_stage_bytes", 2, 1, "Bytes written by each stage of the last report run"),
+                                   ("sfreport_stage_peak_rss_bytes", 3, 1024, "Process peak RSS at the end of each stage of the last report run"),
+                                   ("sfreport_stage_success", 4, 1, "1 if every run of the stage succeeded in the last report run")):
+      lines.append("# HELP %s %s." % (metric, text))
+      lines.append("# TYPE %s gauge" % (metric))
+      for name in sorted(stages):
+        lines.append('%s{report="%s",stage="%s"} %s' % (metric, label, name, repr(stages[name][i] * scale)))
+    lines.append("# HELP sfreport_last_run_timestamp_seconds Time the last report run started.")
+    lines.append("# TYPE sfreport_last_run_timestamp_seconds gauge")
+    lines.append('sfreport_last_run_timestamp_seconds{report="%s"} %.3f' % (label, self.started))
+    name = "sfreport_" + "".join(c if c.isalnum() or c in "_-" else "_" for c in self.report) + ".prom"
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+      with os.fdopen(fd, "w") as f:
+        f.write("\n".join(lines) + "\n")
+      os.chmod(tmp, 0644)
+      os.rename(tmp, os.path.join(directory, name))
+    except:
+      os.remove(tmp)
+      raise
+
+# One timed stage, used as a context manager. Set rows, nbytes or extra
+# inside the block; a stage that raises is recorded as failed.
+class Stage(object):
+
+  def __init__(self, metrics, name, extra):
+    self.metrics = metrics
+    self.name = name
+    self.extra = extra
+    self.rows = None
+    self.nbytes = None
+
+  def __enter__(self):
+    self.start = time.time()
+    return self
+
+  def __exit__(self, etype, value, tb):
+    self.metrics.add(self.name, time.time() - self.start, self.rows, self.nbytes,
+                     etype is None, value, **self.extra)
+    return False
+
+# Cursor wrapper that times fetchmany(), so fetching rows from the database
+# can be told apart from rendering them. A server-side cursor only runs the
+# query when the first rows are asked for, so the first fetch is kept apart.
+class TimedCursor(object):
+
+  def __init__(self, cursor):
+    self.cursor = cursor
+    self.first = None
+    self.seconds = 0.0
+
+  def fetchmany(self, size):
+    start = time.time()
+    rows = self.cursor.fetchmany(size)
+    elapsed = time.time() - start
+    if self.first is None:
+      self.first = elapsed
+    else:
+      self.seconds += elapsed
+    return rows
+
+  def __getattr__(self, name):
+    return getattr(self.cursor, name)
@@ -0,0 +1,136 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# uid/gid -> name resolution shared by the report tools. On LDAP/SSSD hosts
+# every getpwuid/getgrgid is a network round trip, and lookups of deleted
+# users are the slowest of all, so both hits and misses are remembered:
+#  - in process, in a bounded LRU
+#  - optionally on disk (cachefile), for ttl seconds, across runs
+# preload() fills the cache in bulk from getent passwd / getent group.
+
+import os
+import pwd
+import grp
+import json
+import time
+import subprocess
+import collections
+
+class NameCache(object):
+
+  def __init__(self, maxsize=100000, cachefile=None, ttl=86400):
+    self.maxsize = maxsize
+    self.cachefile = cachefile
+    self.ttl = ttl
+    # kind ("user"/"group") -> OrderedDict of id -> (name or None, lookup time)
+    self.entries = {"user": collections.OrderedDict(), "group": collections.OrderedDict()}
+    self.dirty = False
+    if cachefile is not None:
+      self.load()
+
+  # uid -> user name, or None if there is no such user
+  def user(self, uid):
+    return self.lookup("user", uid)
+
+  # gid -> group name, or None if there is no such group
+  def group(self, gid):
+    return self.lookup("group", gid)
+
+  def lookup(self, kind, id):
+    try:
+      id = int(id)
+    except (ValueError, TypeError):
+      return None
+    entries = self.entries[kind]
+    entry = entries.pop(id, None)
+    if entry is None or time.time() - entry[1] > self.ttl:
+      try:
+        if kind == "user":
+          name = pwd.getpwuid(id)[0]
+        else:
+          name = grp.getgrgid(id)[0]
+      except KeyError:
+        name = None
+      entry = (name, time.time())
+      self.dirty = True
+    # most recently used entries live at the end
+    entries[id] = entry
+    if len(entries) > self.maxsize:
+      entries.popitem(last=False)
+    return entry[0]
+
+  # Fill the cache from the full passwd and group databases in one call each
+  def preload(self):
+    now = time.time()
+    for kind, db in (("user", "passwd"), ("group", "group")):
+      try:
+        out = subprocess.check_output(["getent", db])
+      except (OSError, subprocess.CalledProcessError):
+        continue
+      entries = self.entries[kind]
+      for line in out.splitlines():
+        fields = line.split(":")
+        if len(fields) < 3:
+          continue
+        try:
+          entries[int(fields[2])] = (fields[0], now)
+        except ValueError:
+          continue
+      while len(entries) > self.maxsize:
+        entries.popitem(last=False)
+    self.dirty = True
+
+  def load(self):
+    try:
+      with open(self.cachefile) as f:
+        saved = json.load(f)
+    except (IOError, ValueError):
+      return
+    now = time.time()
+    for kind in self.entries:
+      for id, entry in saved.get(kind, {}).items():
+        if now - entry[1] <= self.ttl:
+          name = entry[0]
+          if name is not None:
+            name = name.encode("utf-8")
+          self.entries[kind][int(id)] = (name, entry[1])
+
+  # Write the cache back to cachefile, if there is one and it changed
+  def save(self):
+    if self.cachefile is None or not self.dirty:
+      return
+    saved = {}
+    for kind in self.entries:
+      saved[kind] = dict((str(id), entry) for id, entry in self.entries[kind].items())
+    tmp = "%s.%d" % (self.cachefile, os.getpid())
+    with open(tmp, "w") as f:
+      json.dump(saved, f)
+    os.rename(tmp, self.cachefile)
+    self.dirty = False
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+#
+# 
+#
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# sfreport-refresh: builds and refreshes the sf_rollup summary tables that the
+# shell reports and fileage.py read instead of re-aggregating sf_reports on
+# every run. Each rollup is kept per volume. A volume of a *_current rollup is
+# only rebuilt when its source run_time has moved, and a history rollup only
+# adds the run_times that are newer than the last one rolled up. Run it after
+# the sf_reports tables are updated, e.g. from cron.
+
+import psycopg2
+import ConfigParser
+import sys
+import time
+import argparse
+
+schema = "sf_rollup"
+
+# (rollup, source table, kind, grouping columns, summed columns). A "current"
+# rollup mirrors its source and is rebuilt per volume when the source
+# run_time changes; a "history" rollup keeps one snapshot per run_time.
+rollups = [
+  ("user_age_current", "sf_reports.last_time_generic_current", "current",
+   ["user_name", "group_name", "atime_age", "mtime_age"], ["size", "count", "cost"]),
+  ("user_history", "sf_reports.last_time_generic_history", "history",
+   ["user_name", "group_name"], ["size", "count", "cost"]),
+  ("tag_age_current", "sf_reports.tags_current", "current",
+   ["tag", "atime_age"], ["size"]),
+]
+
+# any two refreshes would rebuild the same volumes, so only one runs at a time
+lockkey = 0x5f726f6c
+
+def getpgauth():
+  config = ConfigParser.ConfigParser()
+  config.read("/opt/starfish/etc/99-local.ini")
+  return(config.get('pg','pg_uri'))
+
+def createtables(cur):
+  cur.execute("CREATE SCHEMA IF NOT EXISTS %s" % (schema))
+  cur.execute("""CREATE TABLE IF NOT EXISTS %s.refresh_state (
+    rollup text NOT NULL,
+    volume_name text NOT NULL,
+    run_time timestamp with time zone,
+    refreshed timestamp with time zone NOT NULL DEFAULT now(),
+    PRIMARY KEY (rollup, volume_name))""" % (schema))
+  for name, source, kind, keys, sums in rollups:
+    columns = ["volume_name text NOT NULL", "run_time timestamp with time zone NOT NULL"]
+    columns += ["%s text" % (k) for k in keys]
+    columns += ["%s numeric" % (s) for s in sums]
+    cur.execute("CREATE TABLE IF NOT EXISTS %s.%s (%s)" % (schema, name, ", ".join(columns)))
+    cur.execute("CREATE INDEX IF NOT EXISTS %s_volume_run_time ON %s.%s (volume_name, run_time)" % (name, schema, name))
+    cur.execute("CREATE INDEX IF NOT EXISTS %s_run_time ON %s.%s (run_time)" % (name, schema, name))
+
+# Roll up the rows of source for one volume, only those after since if given
+def rollupquery(name, source, keys, sums, since):
+  groups = ", ".join(["volume_name", "run_time"] + keys)
+  where = "volume_name = %(volume)s"
+  if since is not None:
+    where += " AND run_time > %(since)s"
+  return """INSERT INTO %s.%s (%s, %s)
+  SELECT %s, %s
+    FROM %s
+   WHERE %s
+   GROUP BY %s""" % (schema, name, groups, ", ".join(sums),
+                     groups, ", ".join("SUM(%s)" % (s) for s in sums),
+                     source, where, groups)
+
+def setstate(cur, name, volume, run_time):
+  cur.execute("DELETE FROM " + schema + ".refresh_state WHERE rollup = %s AND volume_name = %s", (name, volume))
+  if run_time is not None:
+    cur.execute("INSERT INTO " + schema + ".refresh_state (rollup, volume_name, run_time) VALUES (%s, %s, %s)",
+                (name, volume, run_time))
+
+# Bring one volume of one rollup up to date, in its own transaction so
+# readers always see either the old or the new totals for the volume.
+# Returns the number of rows added, or None if nothing had to be done.
+def refreshvolume(cur, rollup, volume, state, full):
+  name, source, kind, keys, sums = rollup
+  params = {'volume': volume, 'since': state}
+  if kind == "current":
+    cur.execute("SELECT MAX(run_time) FROM " + source + " WHERE volume_name = %(volume)s", params)
+    newest = cur.fetchone()[0]
+    if newest == state and not full:
+      return None
+    cur.execute("DELETE FROM " + schema + "." + name + " WHERE volume_name = %(volume)s", params)
+    if newest is None:
+      setstate(cur, name, volume, None)
+      return 0
+    cur.execute(rollupquery(name, source, keys, sums, None), params)
+    added = cur.rowcount
+  else:
+    if full:
+      cur.execute("DELETE FROM " + schema + "." + name + " WHERE volume_name = %(volume)s", params)
+      params['since'] = None
+    cur.execute(rollupquery(name, source, keys, sums, params['since']), params)
+    added = cur.rowcount
+    if added == 0 and not full:
+      return None
+    cur.execute("SELECT MAX(run_time) FROM " + schema + "." + name + " WHERE volume_name = %(volume)s", params)
+    newest = cur.fetchone()[0]
+  setstate(cur, name, volume, newest)
+  return added
+
+# Parse Arguments
+parser = argparse.ArgumentParser(description="Build and refresh the %s summary tables used by the reports" % (schema))
+parser.add_argument("--volume", action="append", help="volume to refresh, may be repeated (default: all volumes)")
+parser.add_argument("--rollup", action="append", choices=[r[0] for r in rollups], help="rollup to refresh, may be repeated (default: all)")
+parser.add_argument("--full", action="store_true", help="rebuild the selected rollups instead of refreshing them")
+parser.add_argument("--prune", action="store_true", help="drop history snapshots older than the oldest run_time left in their source")
+args = parser.parse_args()
+
+try:
+  conn = psycopg2.connect(getpgauth())
+except:
+  print "I am unable to connect to the database"
+  sys.exit(1)
+cur = conn.cursor()
+
+cur.execute("SELECT pg_try_advisory_lock(%s)", (lockkey,))
+if not cur.fetchone()[0]:
+  print "another refresh is already running"
+  sys.exit(1)
+
+createtables(cur)
+conn.commit()
+
+if args.volume:
+  volumes = sorted(set(args.volume))
+else:
+  cur.execute("SELECT name FROM sf_volumes.volume ORDER BY name")
+  volumes = [row[0] for row in cur.fetchall()]
+
+for rollup in rollups:
+  name, source, kind = rollup[0:3]
+  if args.rollup and name not in args.rollup:
+    continue
+  started = time.time()
+  cur.execute("SELECT volume_name, run_time FROM " + schema + ".refresh_state WHERE rollup = %s", (name,))
+  states = dict(cur.fetchall())
+  refreshed = 0
+  for volume in volumes:
+    try:
+      added = refreshvolume(cur, rollup, volume, states.get(volume), args.full)
+      conn.commit()
+    except psycopg2.Error, e:
+      conn.rollback()
+      print "%s: refresh of volume %s failed: %s" % (name, volume, str(e).strip())
+      sys.exit(1)
+    if added is not None:
+      refreshed += 1
+      print "%s: %s: %d rows" % (name, volume, added)
+  # volumes that no longer exist
+  if not args.volume:
+    cur.execute("DELETE FROM " + schema + "." + name + " WHERE volume_name <> ALL(%s)", (volumes,))
+    cur.execute("DELETE FROM " + schema + ".refresh_state WHERE rollup = %s AND volume_name <> ALL(%s)", (name, volumes))
+  if args.prune and kind == "history":
+    cur.execute("DELETE FROM " + schema + "." + name + " WHERE run_time < (SELECT MIN(run_time) FROM " + source + ")")
+    print "%s: pruned %d rows" % (name, cur.rowcount)
+  if refreshed:
+    cur.execute("ANALYZE " + schema + "." + name)
+  conn.commit()
+  print "%s: %d of %d volumes refreshed in %.1f sec" % (name, refreshed, len(volumes), time.time() - started)
+
+conn.close()
@@ -37,20 +37,49 @@
 #********************************************************
 #  Version History
 #  1.0
+#  1.1 - Stream query results through a server-side cursor (itersize option)
+#  1.2 - Bind {{var}} placeholders as query parameters (raw_vars for SQL text);
+#        --fanout runs one report over many variable sets with PREPARE/EXECUTE
+#  1.3 - --source snapshot:<dir> runs reports against a local snapshot written
+#        by sfexport.py instead of the live database
+#  1.4 - volumes option: run the query once per volume, concurrently, and
+#        merge the results in volume order (fan_concurrency, statement_timeout)
+#  1.5 - Per-stage metrics (time, rows, bytes, peak RSS) written as JSON lines
+#        next to the log, --prometheus-dir, and the explain option
+#  1.6 - --no-email, to only write the report (e.g. for sfbench.py)
+#  1.7 - --approx PCT previews a report from a sample of its file scan,
+#        --estimate only reports the planner's estimates, and the max_cost /
+#        over_budget options (or --max-cost) keep costly queries from running
 
 
 #********************************************************
 #Import required modules
 
 import psycopg2 # Postgres SQL DB adapter
+import psycopg2.pool
 import ConfigParser # Config file parser
 import sys
 import os
 import time
 import datetime
 import argparse # Parser for command line options
-import smtplib
 import email.message
+import resource
+import glob
+import cgi
+import gzip
+import zipfile
+import csv
+import threading
+import Queue
+import re
+import shutil
+import sfdb
+import sfcache
+import sfmail
+import sfsnapshot
+import sfmetrics
+import sfapprox
 
 #********************************************************
 # Define fixed variables (Use sparingly!)
@@ -58,24 +87,36 @@ import email.message
 sfconfigfile="/opt/starfish/etc/99-local.ini"  
 logroot="/opt/starfish/log/sfreports/"        # NEEDS TRAILING '/'
 reports_dir="reports/"                        # NEEDS TRAILING '/'
+cache_root="/opt/starfish/cache/sfreports/"   # NEEDS TRAILING '/'
+cache_max_bytes=2*1024*1024*1024              # Size limit for cached results
+cost_history_file=logroot+"costs.jsonl"       # Planner cost and runtime of past reports
 
 #********************************************************
 # Define defaults (these can be overridden in the sql config file)
 
-report_options = {'delimiter':',', 'format':'html', 'from':'root', 'disposition':'inline', 'subject':'No subject set in report config file!'}
+report_options = {'delimiter':',', 'format':'html', 'from':'root', 'disposition':'inline', 'subject':'No subject set in report config file!', 'itersize':'10000', 'cache_ttl':'3600', 'attach_threshold':'10485760', 'compression':'gzip', 'limit':'', 'order_by':'', 'page_size':'0', 'totals':'', 'raw_vars':'', 'volumes':'', 'fan_concurrency':'4', 'statement_timeout':'0', 'explain':'', 'max_cost':'', 'over_budget':'refuse'}
 
 #********************************************************
 # Define functions
 
-def readconfigfile(__configfile,*argv):
+class ReportError(Exception):
+    pass
+
+def fatal(__logfile,__txtin,__e=None):
+    # Log a fatal error for one report and abandon it. In single report mode
+    # this ends the script; in batch mode only the failing report is dropped.
+    logentry(__logfile,'FATAL: '+__txtin)
+    if __e is not None:
+        logentry(__logfile,__e)
+    raise ReportError(__txtin)
+
+def readconfigfile(__logfile,__configfile,*argv):
     try:
         config = ConfigParser.ConfigParser()
         config.read(__configfile)
         return(config.get(*argv))
     except Exception, e:
-        logentry(logfile,'FATAL: Can\'t read config file '+str(__configfile))
-        logentry(logfile,e)
-        sys.exit(1)
+        fatal(__logfile,'Can\'t read config file '+str(__configfile),e)
 
 def logentry(__filein,__txtin):
     with open(__filein, "a") as f:
@@ -84,6 +125,789 @@ def logentry(__filein,__txtin):
         f.write(__ds+":  "+str(__txtin)+'\n')
         print (__txtin)
 
+def peakrss():
+    # ru_maxrss is reported in kilobytes on Linux
+    return(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+def reportname(__queryfile):
+    return(os.path.basename(__queryfile).split(".",1)[0])
+
+def createlog(__logfile,__st,__args):
+    if not os.path.exists(__logfile):
+        try:
+            with open(__logfile, "w") as l:
+                logentry(__logfile,"*"*40)
+                logentry(__logfile,"Script Initiated at "+__st)
+                logentry(__logfile,"Command Line Parameters:")
+                for arg in vars(__args):
+                    logentry(__logfile,"    "+str(arg)+": "+str(getattr(__args,arg)))
+        except Exception, e:
+            print ("FATAL: Can't create log file - "+__logfile)
+            print (e)
+            raise ReportError("Can't create log file - "+__logfile)
+
+def writetitle(__rf,__options):
+    __rf.write('\n<img src="http://starfishstorage.com/wp-content/uploads/2016/01/StarFishLogo.png" alt="Starfish" id="logo" height="22" width="88.6">')
+    __rf.write('\n<p></p><b>'+cgi.escape(__options['subject'],True)+'</b><p></p>')
+
+def writeheader(__rf,__column_names):
+    __out=['\n<table border="1">','\n  <tr>']
+    for column in __column_names:
+        __out.append('\n    <th align="center">'+cgi.escape(str(column),True)+'</th>')
+    __out.append('\n  </tr>')
+    __rf.write(''.join(__out))
+
+def writerows(__rf,__rows):
+    # Render a whole batch of rows and write it in one call
+    __out=[]
+    for row in __rows:
+        __out.append('\n  <tr valign="top">')
+        for element in row:
+            __out.append('\n    <td align="center">'+cgi.escape(str(element),True)+'</td>')
+        __out.append('\n  </tr>')
+    __rf.write(''.join(__out))
+
+def writetotals(__rf,__row):
+    __out=['\n  <tr valign="top">']
+    for element in __row:
+        if element is None:
+            element=''
+        __out.append('\n    <th align="center">'+cgi.escape(str(element),True)+'</th>')
+    __out.append('\n  </tr>')
+    __rf.write(''.join(__out))
+
+def writepagetitle(__rf,__page):
+    __rf.write('\n<p></p><b>Page '+str(__page)+'</b><p></p>')
+
+def writefooter(__rf):
+    __rf.write('\n</table>')
+
+def renderhtml(__out,__cursor,__itersize,__page_size):
+    # Render html tables from an executed cursor, itersize rows at a time.
+    # With page_size set, every page_size rows start a new table.
+    # A named cursor only has a description once the first batch is fetched
+    rows=__cursor.fetchmany(__itersize)
+    column_names = [desc[0] for desc in __cursor.description]
+    __row_count=0
+    __page=1
+    __in_page=0
+    if __page_size:
+        writepagetitle(__out,__page)
+    writeheader(__out,column_names)
+    while rows:
+        if __page_size and __in_page == __page_size:
+            writefooter(__out)
+            __page+=1
+            __in_page=0
+            writepagetitle(__out,__page)
+            writeheader(__out,column_names)
+        __n=len(rows)
+        if __page_size:
+            __n=min(__n,__page_size-__in_page)
+        writerows(__out,rows[:__n])
+        __in_page+=__n
+        __row_count+=__n
+        rows=rows[__n:] or __cursor.fetchmany(__itersize)
+    return(column_names,__row_count)
+
+def rendercsv(__out,__cursor,__itersize,__delimiter):
+    # Render csv from an executed cursor, for results COPY can not export
+    writer=csv.writer(__out,delimiter=__delimiter,lineterminator='\n')
+    writer.writerow([desc[0] for desc in __cursor.description])
+    __row_count=0
+    rows=__cursor.fetchmany(__itersize)
+    while rows:
+        writer.writerows(rows)
+        __row_count+=len(rows)
+        rows=__cursor.fetchmany(__itersize)
+    return(__row_count)
+
+def runcursor(__out,__rf,__cursor,__execute,__options,__metrics):
+    # Run __execute() and render the cursor as csv or html, recording the
+    # execute, fetch and render stages. The first fetch counts as execution,
+    # as a server-side cursor only runs the query once rows are asked for.
+    __timed=sfmetrics.TimedCursor(__cursor)
+    __offset=__rf.tell()
+    __start=time.time()
+    __execute()
+    __executed=time.time()
+    if __options['format'] == "csv":
+        column_names=[desc[0] for desc in __cursor.description]
+        __row_count=rendercsv(__out,__timed,int(__options['itersize']),__options['delimiter'])
+    else:
+        column_names,__row_count=renderhtml(__out,__timed,int(__options['itersize']),int(__options['page_size']))
+    __done=time.time()
+    __metrics.add('execute',__executed-__start+(__timed.first or 0))
+    __metrics.add('fetch',__timed.seconds,__row_count)
+    __metrics.add('render',__done-__executed-(__timed.first or 0)-__timed.seconds,__row_count,__rf.tell()-__offset)
+    return(column_names,__row_count)
+
+def explainreport(__conn,__sql,__params,__options,__logfile,__metrics):
+    # Capture the plan of the report query (explain = plan), or run it under
+    # EXPLAIN (ANALYZE, BUFFERS) (explain = analyze, which runs the query an
+    # extra time). The plan goes into the metrics record, a summary into the log.
+    __analyze=__options['explain'] == "analyze"
+    logentry(__logfile,'Capturing query plan'+(' (EXPLAIN ANALYZE, BUFFERS)' if __analyze else ''))
+    with __metrics.stage('explain',analyze=__analyze) as stage:
+        with __conn.cursor() as cursor:
+            __plan=sfdb.explain(cursor,__sql,__params,__analyze)
+        stage.extra['plan']=__plan
+    __top=__plan['Plan']
+    logentry(__logfile,'  plan: '+__top['Node Type']+', estimated cost '+str(__top['Total Cost'])+', estimated rows '+str(__top['Plan Rows']))
+    if __analyze:
+        logentry(__logfile,'  planning: %.2f ms, execution: %.2f ms' % (__plan.get('Planning Time',0),__plan.get('Execution Time',0)))
+        logentry(__logfile,'  buffers: '+str(__top.get('Shared Hit Blocks',0))+' hit, '+str(__top.get('Shared Read Blocks',0))+' read')
+
+def estimatereport(__conn,__options,__query,__vars,__logfile,__metrics):
+    # Ask the planner what the report query will cost, without running it,
+    # and predict the runtime from past runs of the report. Over the
+    # max_cost budget the report is refused (over_budget = refuse) or run
+    # with a warning (over_budget = warn). With the volumes option the query
+    # is estimated for the first volume. Returns the estimated cost.
+    __vars=dict(__vars)
+    __note=''
+    if __options['volumes'] != '':
+        __volumes=fanvolumes(__conn,__options)
+        __vars['volume']=__volumes[0] if __volumes else ''
+        __note=', per volume'
+    __sql,__params=sfdb.compilequery(pushdown(__query,__options),__vars,rawvars(__options))
+    try:
+        with __metrics.stage('estimate') as stage:
+            with __conn.cursor() as cursor:
+                __est=sfapprox.estimate(cursor,__sql,__params)
+            stage.extra['planner']=__est
+    except psycopg2.Error, e:
+        fatal(__logfile,'Unable to estimate the SQL query',e)
+    logentry(__logfile,'Planner estimate: '+sfapprox.summary(__est,cost_history.predict(__metrics.report,__est['cost']))+__note)
+    if __options['max_cost'] != '' and __est['cost'] > float(__options['max_cost']):
+        __msg='Estimated cost %.0f is over the max_cost budget of %s' % (__est['cost'],__options['max_cost'])
+        if __options['over_budget'] == 'refuse':
+            fatal(__logfile,__msg+', report not run')
+        logentry(__logfile,'WARNING: '+__msg)
+    return(__est['cost'])
+
+def recordcost(__name,__cost,__seconds,__logfile):
+    # Keep the cost and runtime of a run for later runtime predictions
+    try:
+        cost_history.record(__name,__cost,__seconds)
+    except IOError, e:
+        logentry(__logfile,'Unable to record the query cost in '+cost_history.path)
+        logentry(__logfile,e)
+
+def checkreport(__conn,__options,__query,__vars,__logfile,__metrics):
+    # Run estimatereport when a budget is set or only estimates are asked
+    # for. A local snapshot has no planner to ask.
+    if __options['max_cost'] == '' and not estimate_only:
+        return(None)
+    if isinstance(__conn,sfsnapshot.SnapshotConnection):
+        logentry(__logfile,'A local snapshot has no planner estimate, max_cost not checked')
+        return(None)
+    return(estimatereport(__conn,__options,__query,__vars,__logfile,__metrics))
+
+def readreport(__queryfile,__logfile):
+    # Read report options from config file
+    # ------------------------------------
+    __options=dict(report_options)
+    try:
+        config=ConfigParser.ConfigParser()
+        config.read(__queryfile)
+        logentry(__logfile,'Report parameters read from sql config file:')
+        for option in config.options('reportoptions'):
+            __options[option]=config.get('reportoptions',option)
+            logentry(__logfile,'  '+option+": "+__options[option])
+        if __options['format'] == "csv":
+            logentry(__logfile,'CSV output requested, changing disposition to attachment')
+            __options['disposition'] = 'attachment'
+        logentry(__logfile,'All report parameters:')
+        for option in __options:
+            logentry(__logfile,'  '+option+": "+__options[option])
+    except Exception, e:
+        fatal(__logfile,'Unable to read report parameters in '+__queryfile)
+
+    # Read SQL query from config file
+    # -------------------------------
+    try:
+        __query=config.get('sqlquery','query')
+        logentry(__logfile,'SQL Query read')
+    except Exception, e:
+        fatal(__logfile,'Unable to read SQL query in '+__queryfile,e)
+
+    # Read SQL variables from config file
+    # -----------------------------------
+    try:
+        qv=(config.options('queryvars'))
+        logentry(__logfile,'SQL variables read')
+    except Exception, e:
+        fatal(__logfile,'Unable to read SQL variables in '+__queryfile,e)
+
+    # Variable placeholders are bound as query parameters when the query runs
+    # -------------------------------------------------------------------------
+    __vars={}
+    for qvar in qv:
+        __vars[qvar]=config.get('queryvars',qvar)
+
+    # Validate report format and itersize before touching the database
+    # ----------------------------------------------------------------
+    if __options['format'] not in ("csv","html"):
+        fatal(__logfile,'Invalid log format specified')
+    try:
+        if int(__options['itersize']) < 1:
+            raise ValueError('itersize must be a positive integer')
+    except Exception, e:
+        fatal(__logfile,'Invalid itersize specified: '+str(__options['itersize']),e)
+    try:
+        int(__options['cache_ttl'])
+    except Exception, e:
+        fatal(__logfile,'Invalid cache_ttl specified: '+str(__options['cache_ttl']),e)
+    try:
+        int(__options['attach_threshold'])
+    except Exception, e:
+        fatal(__logfile,'Invalid attach_threshold specified: '+str(__options['attach_threshold']),e)
+    if __options['compression'] not in ("gzip","zip","none"):
+        fatal(__logfile,'Invalid compression specified: '+__options['compression'])
+    if __options['explain'] not in ("","plan","analyze"):
+        fatal(__logfile,'Invalid explain specified: '+__options['explain'])
+    for option in ('limit','page_size','statement_timeout'):
+        try:
+            if __options[option] != '' and int(__options[option]) < 0:
+                raise ValueError(option+' can not be negative')
+        except Exception, e:
+            fatal(__logfile,'Invalid '+option+' specified: '+str(__options[option]),e)
+    try:
+        if int(__options['fan_concurrency']) < 1:
+            raise ValueError('fan_concurrency must be a positive integer')
+    except Exception, e:
+        fatal(__logfile,'Invalid fan_concurrency specified: '+str(__options['fan_concurrency']),e)
+    if __options['volumes'] != '' and '{{volume}}' not in __query:
+        fatal(__logfile,'The volumes option needs a {{volume}} placeholder in the query')
+    if __options['max_cost'] == '' and default_max_cost is not None:
+        __options['max_cost']=str(default_max_cost)
+    try:
+        if __options['max_cost'] != '' and float(__options['max_cost']) < 0:
+            raise ValueError('max_cost can not be negative')
+    except Exception, e:
+        fatal(__logfile,'Invalid max_cost specified: '+str(__options['max_cost']),e)
+    if __options['over_budget'] not in ("refuse","warn"):
+        fatal(__logfile,'Invalid over_budget specified: '+__options['over_budget'])
+
+    # With --approx the report reads a sample of its file scan, and says so
+    # -----------------------------------------------------------------------
+    if approx_pct is not None:
+        try:
+            __sample=sfapprox.sample(__query,approx_pct)
+        except ValueError, e:
+            fatal(__logfile,'Unable to sample the SQL query for --approx',e)
+        __query=__sample.sql
+        __options['subject']='[approx %g%%] ' % (approx_pct)+__options['subject']
+        logentry(__logfile,'Approximate run: '+__sample.describe())
+        for __note in __sample.notes:
+            logentry(__logfile,'  note: '+__note)
+    return(__options,__query,__vars)
+
+def rawvars(__options):
+    return([v.strip() for v in __options['raw_vars'].split(',') if v.strip()])
+
+def snapshotmarker(__conn,__query,__options):
+    # Return a value that changes whenever the data behind __query does, or
+    # None if there is no way to tell. A cache_marker query in the report
+    # options wins; otherwise use the latest run_time of every sf_reports
+    # or sf_rollup table the query reads.
+    if 'cache_marker' in __options:
+        __marker_query=__options['cache_marker']
+    else:
+        __tables=sorted(set(t.lower() for t in re.findall(r'\b(sf_reports\.\w+|sf_rollup\.\w+)',__query,re.IGNORECASE)))
+        __tables=[t for t in __tables if t != 'sf_rollup.refresh_state']
+        if not __tables:
+            return(None)
+        __marker_query="SELECT "+", ".join("(SELECT MAX(run_time) FROM %s)" % (t) for t in __tables)
+    with __conn.cursor() as cursor:
+        cursor.execute(__marker_query)
+        return(repr(cursor.fetchone()))
+
+def pushdown(__query,__options):
+    # Wrap the report query so ordering and the top-N limit are applied by
+    # the database and only the rows that are reported are sent back
+    __query=__query.strip().rstrip(';')
+    if __options['order_by'] == '' and __options['limit'] == '':
+        return(__query)
+    __query="SELECT * FROM ("+__query+") AS report"
+    if __options['order_by'] != '':
+        __query+=" ORDER BY "+__options['order_by']
+    if __options['limit'] != '':
+        __query+=" LIMIT "+str(int(__options['limit']))
+    return(__query)
+
+def totalsquery(__query,__column_names,__options):
+    # Sum the columns listed in the totals option over every row of the
+    # report query (not just the top-N), labelling the first column 'Total'
+    __totals=[t.strip() for t in __options['totals'].split(',') if t.strip()]
+    __exprs=[]
+    for i,column in enumerate(__column_names):
+        __ident='report."'+column.replace('"','""')+'"'
+        if column in __totals:
+            __exprs.append('SUM('+__ident+')')
+        elif i == 0:
+            __exprs.append("'Total'")
+        else:
+            __exprs.append('NULL')
+    return("SELECT "+", ".join(__exprs)+" FROM ("+__query.strip().rstrip(';')+") AS report")
+
+def fanvolumes(__conn,__options):
+    # Volumes to fan a report out over: a comma separated list, or all
+    if __options['volumes'].strip().lower() == 'all':
+        with __conn.cursor() as cursor:
+            cursor.execute("SELECT name FROM sf_volumes.volume ORDER BY name")
+            return([row[0] for row in cursor.fetchall()])
+    return([v.strip() for v in __options['volumes'].split(',') if v.strip()])
+
+def generatefanout(__conn,__report_file,__options,__query,__vars,__logfile,__metrics):
+    # Run the query once per volume ({{volume}}), up to fan_concurrency at a
+    # time on their own connections, and write the results into one report
+    # in volume order. ordering and limit apply within each volume; totals
+    # are summed in SQL over each whole volume and added up. A volume that
+    # fails is logged and listed in the report, and the other volumes are
+    # still reported. Fan-out results are not cached, as a run may be
+    # incomplete.
+    # ----------------------------------------------------------------------
+    # {{volume}} has to be a bound value: quoted or raw it would be inlined
+    # as the empty string and every volume would quietly return no rows
+    if 'volume' in rawvars(__options):
+        fatal(__logfile,'volume can not be a raw_var with volumes, it is bound to each volume in turn')
+    for __text,__kind in sfdb.sqlsegments(__query):
+        if __kind in ("'",'"') and 'volume' in sfdb.placeholder.findall(__text):
+            fatal(__logfile,'{{volume}} is inside quotes ('+__text.strip()+'); with volumes it is bound as a value, write it without quotes')
+    __volumes=fanvolumes(__conn,__options)
+    __limit=int(__options['fan_concurrency'])
+    __timeout=int(__options['statement_timeout']) or None
+    __local=isinstance(__conn,sfsnapshot.SnapshotConnection)
+    __fanvars=dict(__vars)
+    __fanvars['volume']=''
+    __sql,__params=sfdb.compilequery(pushdown(__query,__options),__fanvars,rawvars(__options))
+    __totals=[c.strip() for c in __options['totals'].split(',') if c.strip()]
+    __pool=None
+    __row_count=0
+    __failed=[]
+    column_names=None
+    __sums=None
+    try:
+        with __metrics.stage('connect'):
+            if __local:
+                __pool=sfsnapshot.SnapshotPool(__conn.directory)
+                __timeout=None
+            else:
+                __pool=psycopg2.pool.ThreadedConnectionPool(1,__limit,readconfigfile(__logfile,sfconfigfile,'pg','pg_uri'))
+        logentry(__logfile,'Executing SQL Query for '+str(len(__volumes))+' volume(s), '+str(__limit)+' at a time')
+        __query_start=time.time()
+        with open(__report_file, "w+") as rf:
+            if __options['format'] == "html":
+                writetitle(rf,__options)
+            else:
+                writer=csv.writer(rf,delimiter=__options['delimiter'],lineterminator='\n')
+            for part in sfdb.fanout(__pool,__sql,__volumes,__params,__limit,__timeout,int(__options['itersize'])):
+                if part.error is not None:
+                    logentry(__logfile,'  volume '+part.volume+': FAILED after %.2f sec: ' % (part.elapsed)+str(part.error).strip())
+                    __metrics.add('volume',part.elapsed,ok=False,error=part.error,volume=part.volume)
+                    __failed.append(part.volume)
+                    continue
+                __metrics.add('volume',part.elapsed,part.count,volume=part.volume)
+                logentry(__logfile,'  volume '+part.volume+': '+str(part.count)+' rows in %.2f sec' % (part.elapsed))
+                if column_names is None:
+                    column_names=part.columns
+                    if __options['format'] == "html":
+                        writeheader(rf,column_names)
+                    else:
+                        writer.writerow(column_names)
+                # the volume's rows come back from its spool file in batches
+                for __batch in part.batches():
+                    if __options['format'] == "html":
+                        writerows(rf,__batch)
+                    else:
+                        writer.writerows(__batch)
+                __row_count+=part.count
+            if column_names is None:
+                raise Exception('the query failed for every volume')
+            if __totals:
+                # totalsquery per volume, over all its rows (not the top-N),
+                # and the partial sums added up here
+                __tsql,__tparams=sfdb.compilequery(totalsquery(__query,column_names,__options),__fanvars,rawvars(__options))
+                __sums=[None]*len(column_names)
+                if column_names[0] not in __totals:
+                    __sums[0]='Total'
+                with __metrics.stage('totals'):
+                    for part in sfdb.fanout(__pool,__tsql,[v for v in __volumes if v not in __failed],__tparams,__limit,__timeout):
+                        if part.error is not None:
+                            logentry(__logfile,'  volume '+part.volume+': totals FAILED: '+str(part.error).strip())
+                            __failed.append(part.volume)
+                            continue
+                        for __batch in part.batches():
+                            for row in __batch:
+                                for i,name in enumerate(column_names):
+                                    if name in __totals and row[i] is not None:
+                                        __sums[i]=(__sums[i] or 0)+row[i]
+                if __options['format'] == "html":
+                    writetotals(rf,__sums)
+                else:
+                    writer.writerow(__sums)
+            if __options['format'] == "html":
+                writefooter(rf)
+                if __failed:
+                    rf.write('\n<p><b>Not included, the query failed for: '+cgi.escape(', '.join(__failed))+'</b></p>')
+            __bytes=rf.tell()
+        __query_elapsed=time.time()-__query_start
+        # The volume stages overlap, so merge covers the whole fan-out
+        __metrics.add('merge',__query_elapsed,__row_count,__bytes,volumes=len(__volumes),failed=len(__failed))
+        logentry(__logfile,'Report generated: '+__report_file)
+        logentry(__logfile,'  rows: '+str(__row_count))
+        logentry(__logfile,'  volumes: '+str(len(__volumes)-len(__failed))+' of '+str(len(__volumes))+' succeeded')
+        if __failed:
+            logentry(__logfile,'  failed volumes: '+', '.join(__failed))
+        logentry(__logfile,'  elapsed: %.2f sec' % (__query_elapsed))
+        logentry(__logfile,'  peak RSS: '+str(peakrss())+' KB')
+        return(__row_count)
+    except psycopg2.Error, e:
+        fatal(__logfile,'Error during SQL query execution',e)
+    except Exception,e:
+        fatal(__logfile,'Error during report generation',e)
+    finally:
+        if __pool is not None:
+            __pool.closeall()
+
+def generatereport(__conn,__report_file,__options,__query,__vars,__logfile,__cache,__prepared=False,__metrics=None):
+    # Execute SQL query and stream results into the report. CSV reports are
+    # exported by the server through COPY; html reports are read through a
+    # server-side cursor, itersize rows at a time. With __prepared the query
+    # goes through PREPARE/EXECUTE instead, so repeated runs on a connection
+    # reuse one plan. Against a local snapshot (sfsnapshot) both formats are
+    # read through a cursor, as there is no COPY or PREPARE. The csv output,
+    # or the html table, is also stored in the result cache and served from
+    # there while the query, its variables and the catalog snapshot are
+    # unchanged. Each stage is recorded in __metrics (sfmetrics).
+    # ----------------------------------------------------------------------
+    if __metrics is None:
+        __metrics=sfmetrics.RunMetrics(reportname(__report_file),None)
+    if __options['volumes'] != '':
+        return(generatefanout(__conn,__report_file,__options,__query,__vars,__logfile,__metrics))
+    __raw=rawvars(__options)
+    __local=isinstance(__conn,sfsnapshot.SnapshotConnection)
+    __report_query=pushdown(__query,__options)
+    __sql,__params=sfdb.compilequery(__report_query,__vars,__raw)
+    __row_count=0
+    __cache_key=None
+    __entry=None
+    try:
+        if __cache is not None:
+            with __metrics.stage('cache') as stage:
+                __marker=snapshotmarker(__conn,__query,__options)
+                if __marker is None:
+                    logentry(__logfile,'No catalog snapshot marker for this query (set cache_marker), result cache not used')
+                else:
+                    if __options['format'] == "csv":
+                        __kind="csv"+__options['delimiter']
+                    else:
+                        __kind="html"+str(int(__options['page_size']))
+                    __cache_key=__cache.key(__sql,sorted(__params.items()),__kind,__options['totals'],__marker)
+                    __hit=__cache.get(__cache_key,int(__options['cache_ttl']))
+                    stage.extra['hit']=__hit is not None
+                    if __hit is not None:
+                        logentry(__logfile,'Result cache hit: '+__cache_key)
+                        with open(__report_file, "w+") as rf:
+                            if __options['format'] == "html":
+                                writetitle(rf,__options)
+                            with open(__hit, "r") as cf:
+                                shutil.copyfileobj(cf,rf)
+                            stage.nbytes=rf.tell()
+                        logentry(__logfile,'Report generated: '+__report_file)
+                        return(None)
+                    logentry(__logfile,'Result cache miss: '+__cache_key)
+                    __entry,__entry_path=__cache.newentry()
+        if __options['explain'] != '':
+            if __local:
+                logentry(__logfile,'A local snapshot has no query plan to capture, explain ignored')
+            else:
+                explainreport(__conn,__sql,__params,__options,__logfile,__metrics)
+        with open(__report_file, "w+") as rf:
+            if __entry is not None:
+                out=sfcache.Tee(rf,__entry)
+            else:
+                out=rf
+            if __options['format'] == "html":
+                writetitle(rf,__options)
+            column_names=None
+            if __prepared and not __local:
+                with __conn.cursor() as cursor:
+                    logentry(__logfile,'Executing SQL Query (prepared statement)')
+                    __query_start=time.time()
+                    __psql,__pparams=sfdb.compilequery(__report_query,__vars,__raw,positional=True)
+                    column_names,__row_count=runcursor(out,rf,cursor,lambda: sfdb.executeprepared(cursor,__psql,__pparams),__options,__metrics)
+            elif __options['format'] == "csv" and not __local:
+                logentry(__logfile,'Executing SQL Query (COPY to csv)')
+                __query_start=time.time()
+                with __metrics.stage('copy') as stage:
+                    __row_count=sfdb.copyexport(__conn,__sql,out,__options['delimiter'],params=__params)
+                    stage.rows=__row_count
+                    stage.nbytes=rf.tell()
+            elif __options['format'] == "csv":
+                with __conn.cursor() as cursor:
+                    cursor.itersize=int(__options['itersize'])
+                    logentry(__logfile,'Executing SQL Query (snapshot '+__conn.directory+')')
+                    __query_start=time.time()
+                    column_names,__row_count=runcursor(out,rf,cursor,lambda: cursor.execute(__sql,__params),__options,__metrics)
+            else:
+                # Cursor names only need to be unique per connection
+                with __conn.cursor(name='sfreport') as cursor:
+                    cursor.itersize=int(__options['itersize'])
+                    logentry(__logfile,'Executing SQL Query (server-side cursor, itersize '+str(cursor.itersize)+')')
+                    __query_start=time.time()
+                    column_names,__row_count=runcursor(out,rf,cursor,lambda: cursor.execute(__sql,__params),__options,__metrics)
+            if __options['totals'] != '':
+                with __metrics.stage('totals') as stage:
+                    __offset=rf.tell()
+                    with __conn.cursor() as cursor:
+                        if column_names is None:
+                            cursor.execute("SELECT * FROM ("+__sql+") AS report LIMIT 0",__params)
+                            column_names = [desc[0] for desc in cursor.description]
+                        __tsql,__tparams=sfdb.compilequery(totalsquery(__query,column_names,__options),__vars,__raw)
+                        if __options['format'] == "csv" and not __local:
+                            sfdb.copyexport(__conn,__tsql,out,__options['delimiter'],False,params=__tparams)
+                        elif __options['format'] == "csv":
+                            cursor.execute(__tsql,__tparams)
+                            csv.writer(out,delimiter=__options['delimiter'],lineterminator='\n').writerow(cursor.fetchone())
+                        else:
+                            cursor.execute(__tsql,__tparams)
+                            writetotals(out,cursor.fetchone())
+                    stage.nbytes=rf.tell()-__offset
+            if __options['format'] == "html":
+                writefooter(out)
+            __query_elapsed=time.time()-__query_start
+        if __entry is not None:
+            with __metrics.stage('cache_store'):
+                __entry.close()
+                __cache.put(__cache_key,__entry_path)
+                __entry=None
+        logentry(__logfile,'Report generated: '+__report_file)
+        logentry(__logfile,'  rows: '+str(__row_count))
+        logentry(__logfile,'  elapsed: %.2f sec' % (__query_elapsed))
+        logentry(__logfile,'  rows/sec: %.1f' % (__row_count/max(__query_elapsed,0.001)))
+        logentry(__logfile,'  peak RSS: '+str(peakrss())+' KB')
+        return(__row_count)
+    except psycopg2.Error, e:
+        fatal(__logfile,'Error during SQL query execution',e)
+    except Exception,e:
+        fatal(__logfile,'Error during report generation',e)
+    finally:
+        if __entry is not None:
+            __entry.close()
+            __cache.discard(__entry_path)
+
+def compressreport(__report_file,__compression):
+    # Compress the report next to the original, returning the new path
+    if __compression == "zip":
+        __compressed=__report_file+".zip"
+        with zipfile.ZipFile(__compressed,"w",zipfile.ZIP_DEFLATED,True) as zf:
+            zf.write(__report_file,os.path.basename(__report_file))
+        return(__compressed,'application/zip')
+    __compressed=__report_file+".gz"
+    with open(__report_file,"rb") as rf:
+        with gzip.open(__compressed,"wb") as cf:
+            shutil.copyfileobj(rf,cf,1048576)
+    return(__compressed,'application/gzip')
+
+def emailreport(__mailer,__report_file,__options,__logfile,__row_count=None,__metrics=None):
+    # The message is written to disk and streamed to the SMTP server, so the
+    # report is never held in memory. Reports over attach_threshold bytes go
+    # out compressed, as an attachment with a short summary. With no mailer
+    # (--no-email) the report is only left in the reports directory.
+    if __mailer is None:
+        logentry(__logfile,'Not emailing report (--no-email). Script exiting..')
+        return
+    __message_file=__report_file+".eml"
+    __attachment=__report_file
+    if __metrics is None:
+        __metrics=sfmetrics.RunMetrics(reportname(__report_file),None)
+    try:
+        logentry(__logfile,'Emailing report')
+        __recipients=[r.strip() for r in __options['to'].split(',') if r.strip()]
+        __size=os.path.getsize(__report_file)
+        __ctype='application/octet-stream'
+        __disposition=__options['disposition']
+        __summary=None
+        if __size > int(__options['attach_threshold']):
+            __disposition='attachment'
+            if __options['compression'] != "none":
+                with __metrics.stage('compress',compression=__options['compression']) as stage:
+                    __attachment,__ctype=compressreport(__report_file,__options['compression'])
+                    stage.nbytes=os.path.getsize(__attachment)
+            __summary=__options['subject']+'\n\n'
+            if __row_count is not None:
+                __summary+='Rows: '+str(__row_count)+'\n'
+            __summary+='Report size: '+str(__size)+' bytes\n'
+            __summary+='The report is attached as '+os.path.basename(__attachment)+' ('+str(os.path.getsize(__attachment))+' bytes).\n'
+            logentry(__logfile,'Report is '+str(__size)+' bytes, sending '+os.path.basename(__attachment)+' as an attachment with a summary')
+        with __metrics.stage('smtp',recipients=len(__recipients)) as stage:
+            with open(__message_file,"w") as mf:
+                sfmail.writemessage(mf,__options['from'],__recipients,__options['subject'],[(__attachment,__ctype,__disposition)],__summary)
+            stage.nbytes=os.path.getsize(__message_file)
+            __mailer.sendfile(__options['from'],__recipients,__message_file)
+        logentry(__logfile,'Report emailed. Script exiting..')
+    except Exception,e:
+        logentry(__logfile,'FATAL: Error during emailing of report')
+        logentry(__logfile,e)
+    finally:
+        for __tmp in (__message_file,__attachment):
+            if __tmp != __report_file and os.path.exists(__tmp):
+                os.remove(__tmp)
+
+def newmetrics(__name,__logfile,__st):
+    # Stage metrics for a run, written next to its logfile
+    return(sfmetrics.RunMetrics(__name,__st,sfmetrics.metricspath(__logfile)))
+
+def finishmetrics(__metrics,__ok,__logfile):
+    # Record the run as a whole and, with --prometheus-dir, publish it for
+    # the textfile collector. Metrics never fail a report.
+    try:
+        __run=__metrics.finish(__ok)
+        logentry(__logfile,'Run metrics: %.2f sec, peak RSS %s KB, written to %s' % (__run['seconds'],__run['peak_rss_kb'],__metrics.path))
+        if prometheus_dir is not None:
+            __metrics.writeprometheus(prometheus_dir)
+    except Exception, e:
+        logentry(__logfile,'Unable to write run metrics')
+        logentry(__logfile,e)
+
+def runreport(__queryfile,__pool,__mailer,__cache,__logfile,__st,__metrics=None):
+    # Run one report config end to end, logging to __logfile
+    if __metrics is None:
+        __metrics=newmetrics(reportname(__queryfile),__logfile,__st)
+    __ok=False
+    try:
+        __options,__query,__vars=readreport(__queryfile,__logfile)
+        __report_file=reports_directory+reportname(__queryfile)+"-"+__st+"-report."+__options['format']
+        try:
+            with __metrics.stage('checkout'):
+                __conn=__pool.getconn()
+        except psycopg2.Error, e:
+            fatal(__logfile,'Unable to get a database connection from the pool. The following error message was generated:',e)
+        try:
+            __cost=checkreport(__conn,__options,__query,__vars,__logfile,__metrics)
+            if not estimate_only:
+                __start=time.time()
+                __row_count=generatereport(__conn,__report_file,__options,__query,__vars,__logfile,__cache,False,__metrics)
+                # a cache hit (no row count) says nothing about the runtime
+                if __cost is not None and __row_count is not None:
+                    recordcost(__metrics.report,__cost,time.time()-__start,__logfile)
+        finally:
+            # End the read transaction before handing the connection back
+            __conn.rollback()
+            __pool.putconn(__conn)
+        if not estimate_only:
+            emailreport(__mailer,__report_file,__options,__logfile,__row_count,__metrics)
+        __ok=True
+    finally:
+        finishmetrics(__metrics,__ok,__logfile)
+
+def readfanout(__fanoutfile,__logfile):
+    # Variable sets for --fanout: a csv file whose header names the query
+    # variables, one set per row
+    try:
+        with open(__fanoutfile) as f:
+            __sets=[dict((k.strip(),v.strip()) for k,v in row.items()) for row in csv.DictReader(f)]
+    except Exception, e:
+        fatal(__logfile,'Unable to read fan-out variable sets in '+__fanoutfile,e)
+    if not __sets:
+        fatal(__logfile,'No variable sets found in '+__fanoutfile)
+    return(__sets)
+
+def runfanout(__queryfile,__fanoutfile,__pool,__mailer,__cache,__logfile,__st,__metrics=None):
+    # Run one report template once per variable set, in turn on a single
+    # connection. The query is prepared once and executed for every set, and
+    # each set gets its own report file and email, with {{var}} placeholders
+    # in the subject filled in.
+    if __metrics is None:
+        __metrics=newmetrics(reportname(__queryfile),__logfile,__st)
+    __ok=False
+    try:
+        __options,__query,__vars=readreport(__queryfile,__logfile)
+        __sets=readfanout(__fanoutfile,__logfile)
+        __failed=0
+        logentry(__logfile,'Fan-out over '+str(len(__sets))+' variable set(s) from '+__fanoutfile)
+        try:
+            with __metrics.stage('checkout'):
+                __conn=__pool.getconn()
+        except psycopg2.Error, e:
+            fatal(__logfile,'Unable to get a database connection from the pool. The following error message was generated:',e)
+        try:
+            for __n,__set in enumerate(__sets):
+                __setvars=dict(__vars)
+                __setvars.update(__set)
+                __setoptions=dict(__options)
+                for qvar in __setvars:
+                    __setoptions['subject']=__setoptions['subject'].replace("{{"+qvar+"}}",__setvars[qvar])
+                __suffix=re.sub(r'[^A-Za-z0-9_.-]+','_','-'.join(__set[k] for k in sorted(__set)))
+                __report_file=reports_directory+reportname(__queryfile)+"-"+__st+"-"+str(__n+1)+"-"+__suffix+"-report."+__options['format']
+                logentry(__logfile,'Variable set '+str(__n+1)+': '+', '.join(k+'='+__set[k] for k in sorted(__set)))
+                __metrics.context['set']=__n+1
+                try:
+                    __cost=checkreport(__conn,__setoptions,__query,__setvars,__logfile,__metrics)
+                    if estimate_only:
+                        __conn.rollback()
+                        continue
+                    __start=time.time()
+                    __row_count=generatereport(__conn,__report_file,__setoptions,__query,__setvars,__logfile,__cache,True,__metrics)
+                    if __cost is not None and __row_count is not None:
+                        recordcost(__metrics.report,__cost,time.time()-__start,__logfile)
+                    # Keep each set in its own transaction, so one failure does not
+                    # abort the rest
+                    __conn.commit()
+                except ReportError:
+                    # The prepared statement outlives the rollback, so the
+                    # next set executes it again
+                    __conn.rollback()
+                    __failed+=1
+                    continue
+                emailreport(__mailer,__report_file,__setoptions,__logfile,__row_count,__metrics)
+        finally:
+            __metrics.context.pop('set',None)
+            __conn.rollback()
+            __pool.putconn(__conn)
+        if __failed:
+            fatal(__logfile,str(__failed)+' of '+str(len(__sets))+' variable set(s) failed')
+        __ok=True
+    finally:
+        finishmetrics(__metrics,__ok,__logfile)
+
+def batchfiles(__spec):
+    if os.path.isdir(__spec):
+        return(sorted(glob.glob(os.path.join(__spec,'*.sql'))))
+    return(sorted(glob.glob(__spec)))
+
+def runbatch(__queryfiles,__pool,__mailer,__cache,__args,__concurrency):
+    # Run reports on __concurrency worker threads. Each worker takes the next
+    # config off the queue, so the suite finishes with its slowest report.
+    __todo=Queue.Queue()
+    for __queryfile in __queryfiles:
+        __todo.put(__queryfile)
+    __failed=[]
+    def worker():
+        while True:
+            try:
+                __queryfile=__todo.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                # Each report keeps its own logfile, named as in single report mode
+                __st=datetime.datetime.fromtimestamp(time.time()).strftime("%Y%m%d-%H%M%S")
+                __logfile=logroot+reportname(__queryfile)+"-"+__st+".log"
+                createlog(__logfile,__st,__args)
+                runreport(__queryfile,__pool,__mailer,__cache,__logfile,__st)
+            except Exception, e:
+                print ("Report "+__queryfile+" failed: "+str(e))
+                __failed.append(__queryfile)
+    __threads=[threading.Thread(target=worker) for i in range(min(__concurrency,len(__queryfiles)))]
+    for __thread in __threads:
+        __thread.start()
+    for __thread in __threads:
+        __thread.join()
+    return(__failed)
+
 #************************************************************
 # Start here                                                #
 #************************************************************
@@ -91,14 +915,47 @@ def logentry(__filein,__txtin):
 # Parse command line arguments
 # ----------------------------
 parser = argparse.ArgumentParser(description='Run a report query for Starfish')
-parser.add_argument('query', metavar='{filename}', nargs=1, help='File containing report options, query variables, and SQL query to run (see sfreport_example.sql for an example)')
+parser.add_argument('query', metavar='{filename}', nargs='?', help='File containing report options, query variables, and SQL query to run (see sfreport_example.sql for an example)')
+parser.add_argument('--batch', metavar='{dir or glob}', help='Run every report config in a directory (*.sql) or matching a glob in one process')
+parser.add_argument('--concurrency', type=int, default=4, help='Number of reports to run at once in batch mode (default: 4)')
+parser.add_argument('--fanout', metavar='{csv file}', help='Run the report once per row of this csv file, whose header names the query variables to set')
+parser.add_argument('--no-cache', action='store_true', help='Neither read nor store cached query results')
+parser.add_argument('--refresh', action='store_true', help='Ignore cached query results, but store the fresh ones')
+parser.add_argument('--no-email', action='store_true', help='Only write the report to the reports directory, do not email it')
+parser.add_argument('--source', default='pg', help='pg (default) or snapshot:{dir} to run against a local snapshot written by sfexport.py')
+parser.add_argument('--prometheus-dir', metavar='{dir}', help='Also write the stage metrics of each report to {dir}/sfreport_{report}.prom for the node exporter textfile collector')
+parser.add_argument('--approx', type=float, metavar='{pct}', help='Preview the report from a {pct}%% TABLESAMPLE SYSTEM sample of its sf.file_current (or sf_reports) scan, with count() and sum() scaled back up and 95%% bounds added')
+parser.add_argument('--estimate', action='store_true', help='Only log the planner\'s row and cost estimates and a predicted runtime for each report, without running or emailing it')
+parser.add_argument('--max-cost', type=float, metavar='{cost}', help='Default max_cost budget for reports that do not set their own')
 args=parser.parse_args()
+if (args.query is None) == (args.batch is None):
+    parser.error('specify either a report config file or --batch')
+if args.concurrency < 1:
+    parser.error('--concurrency must be at least 1')
+if args.fanout and args.batch:
+    parser.error('--fanout runs a single report config, it can not be used with --batch')
+try:
+    snapshot=sfsnapshot.parsesource(args.source)
+except ValueError, e:
+    parser.error(str(e))
+prometheus_dir=args.prometheus_dir
+approx_pct=args.approx
+estimate_only=args.estimate
+default_max_cost=args.max_cost
+cost_history=sfapprox.CostHistory(cost_history_file)
+if snapshot and (approx_pct is not None or estimate_only):
+    parser.error('--approx and --estimate need the live database, not a snapshot')
+if approx_pct is not None and not 0 < approx_pct <= 100:
+    parser.error('--approx must be more than 0 and at most 100')
+if default_max_cost is not None and default_max_cost < 0:
+    parser.error('--max-cost can not be negative')
+if prometheus_dir is not None and not os.path.isdir(prometheus_dir):
+    parser.error('--prometheus-dir '+prometheus_dir+' is not a directory')
 
-# Create logfile and initialize with header information and cmdline arguments
-# ---------------------------------------------------------------------------
+# Create log root directory
+# -------------------------
 ts=time.time()
 st=datetime.datetime.fromtimestamp(ts).strftime("%Y%m%d-%H%M%S")
-logfile=logroot+args.query[0].split(".",1)[0]+"-"+st+".log"
 if not os.path.exists(logroot):
     try:
         os.makedirs(logroot)
@@ -106,18 +963,22 @@ if not os.path.exists(logroot):
         print ("FATAL: Can't make log root directory - "+logroot)
         print (e)
         sys.exit(1)
-if not os.path.exists(logfile):
-    try:
-        with open(logfile, "w") as l:
-            logentry(logfile,"*"*40)
-            logentry(logfile,"Script Initiated at "+st)
-            logentry(logfile,"Command Line Parameters:")
-            for arg in vars(args):
-                logentry(logfile,"    "+str(arg)+": "+str(getattr(args,arg)))
-    except Exception, e:
-        print ("FATAL: Can't create log file - "+logfile)
-        print (e)
-        sys.exit(1)
+
+# Create logfile for this run and initialize with header information and
+# cmdline arguments. In batch mode each report also gets its own logfile.
+# -----------------------------------------------------------------------
+if args.batch:
+    logfile=logroot+"batch-"+st+".log"
+    queryfiles=batchfiles(args.batch)
+    metrics=newmetrics("batch",logfile,st)
+else:
+    logfile=logroot+reportname(args.query)+"-"+st+".log"
+    queryfiles=[args.query]
+    metrics=newmetrics(reportname(args.query),logfile,st)
+try:
+    createlog(logfile,st,args)
+except ReportError:
+    sys.exit(1)
 
 # Initialize reports directory
 # ----------------------------
@@ -131,136 +992,67 @@ if not os.path.exists(reports_directory):
         logentry(logfile,e)
         sys.exit(1)
 
-# Connect to PostgreSQL database
-# ------------------------------
+# Connect to PostgreSQL database, or open the local snapshot
+# ----------------------------------------------------------
 try:
-    conn = psycopg2.connect(readconfigfile(sfconfigfile,'pg','pg_uri'))
-    logentry(logfile,'Connected to database')
-except psycopg2.Error, e:
-    logentry(logfile,'FATAL: Unable to connect to the database. The following error message was generated:')
-    logentry(logfile,e)
-    sys.exit(1)
-
-# Read report options from config file
-# ------------------------------------
-try:
-    config=ConfigParser.ConfigParser()
-    config.read(args.query[0])
-    logentry(logfile,'Report parameters read from sql config file:')
-    for option in config.options('reportoptions'):
-        report_options[option]=readconfigfile(args.query[0],'reportoptions',option)
-        logentry(logfile,'  '+option+": "+report_options[option])
-    if report_options['format'] == "csv":
-        logentry(logfile,'CSV output requested, changing disposition to attachment')
-        report_options['disposition'] = 'attachment'
-    logentry(logfile,'All report parameters:')
-    for option in report_options:
-        logentry(logfile,'  '+option+": "+report_options[option])
-except Exception, e:
-    logentry(logfile,'FATAL: Unable to read report parameters in '+args.query[0])
+    with metrics.stage('connect'):
+        if snapshot:
+            pool = sfsnapshot.SnapshotPool(snapshot)
+            pool.putconn(pool.getconn())
+            logentry(logfile,'Opened snapshot '+snapshot)
+        else:
+            pool = psycopg2.pool.ThreadedConnectionPool(1,min(args.concurrency,len(queryfiles)) or 1,readconfigfile(logfile,sfconfigfile,'pg','pg_uri'))
+            logentry(logfile,'Connected to database')
+except ReportError:
+    finishmetrics(metrics,False,logfile)
     sys.exit(1)
- 
-# Read SQL query from config file
-# -------------------------------
-try:
-    query=readconfigfile(args.query[0],'sqlquery','query')
-    logentry(logfile,'SQL Query read')
-except Exception, e:
-    logentry(logfile,'FATAL: Unable to read SQL query in '+args.query[0])
+except (ImportError, IOError), e:
+    logentry(logfile,'FATAL: Unable to open snapshot '+str(snapshot)+'. The following error message was generated:')
     logentry(logfile,e)
+    finishmetrics(metrics,False,logfile)
     sys.exit(1)
-
-# Read SQL variables from config file
-# -----------------------------------
-try:
-    config=ConfigParser.ConfigParser()
-    config.read(args.query[0])
-    qv=(config.options('queryvars'))
-    logentry(logfile,'SQL variables read')
-except Exception, e:
-    logentry(logfile,'FATAL: Unable to read SQL variables in '+args.query[0])
+except psycopg2.Error, e:
+    logentry(logfile,'FATAL: Unable to connect to the database. The following error message was generated:')
     logentry(logfile,e)
+    finishmetrics(metrics,False,logfile)
     sys.exit(1)
-    
-# Replace variable placeholders in SQL query with those found in config file
-# --------------------------------------------------------------------------
-for qvar in qv:
-    varvalue=config.get('queryvars',qvar)
-    query=query.replace("{{"+qvar+"}}",varvalue)
-
-# Execute SQL query and capture results
-# -------------------------------------
-column_names=[]
-data_rows=[]
-with conn.cursor() as cursor:
-    logentry(logfile,'Executing SQL Query')
+
+# Open result cache
+# -----------------
+cache=None
+if not args.no_cache:
     try:
-        cursor.execute(query)
-        column_names = [desc[0] for desc in cursor.description]
-        for row in cursor:
-            data_rows.append(row)
+        cache=sfcache.ResultCache(cache_root,cache_max_bytes,args.refresh)
     except Exception, e:
-        logentry(logfile,'FATAL: Error during SQL query execution')
+        logentry(logfile,'Unable to open result cache - '+cache_root+', continuing without it')
         logentry(logfile,e)
-        sys.exit(1)
 
-# Generate either csv or html report 
-# ----------------------------------
-report_file=reports_directory+args.query[0].split(".",1)[0]+"-"+st+"-report."+report_options['format']
-try:
-    with open(report_file, "w+") as rf:
-        if report_options['format'] == "csv":
-            rf.write((report_options['delimiter']).join(column_names)+"\n")
-            for row in data_rows:
-                rf.write(report_options['delimiter'].join(str(element) for element in row)+"\n")
-        elif report_options['format'] == "html":
-            rf.write('\n<img src="http://starfishstorage.com/wp-content/uploads/2016/01/StarFishLogo.png" alt="Starfish" id="logo" height="22" width="88.6">')
-            rf.write('\n<p></p><b>'+report_options['subject']+'</b><p></p>')
-            rf.write('\n<table border="1">')
-            rf.write('\n  <tr>')
-            for column in column_names:
-                rf.write('\n    <th align="center">'+str(column)+'</th>')
-            rf.write('\n  </tr>')
-            for row in data_rows:
-                rf.write('\n  <tr valign="top">')
-                for element in row:
-                    rf.write('\n    <td align="center">'+str(element)+'</td>')
-                rf.write('\n  </tr>')
-            rf.write('\n</table>')
+# Run report(s)
+# -------------
+mailer=None
+if not args.no_email and not estimate_only:
+    mailer=sfmail.Mailer()
+exitcode=0
+if args.batch:
+    logentry(logfile,'Running '+str(len(queryfiles))+' report(s) with concurrency '+str(args.concurrency))
+    for queryfile in queryfiles:
+        logentry(logfile,'  '+queryfile)
+    failed=runbatch(queryfiles,pool,mailer,cache,args,args.concurrency)
+    for queryfile in failed:
+        logentry(logfile,'FAILED: '+queryfile)
+    logentry(logfile,'Batch complete: '+str(len(queryfiles)-len(failed))+' succeeded, '+str(len(failed))+' failed')
+    if failed:
+        exitcode=1
+    finishmetrics(metrics,not failed,logfile)
+else:
+    try:
+        if args.fanout:
+            runfanout(args.query,args.fanout,pool,mailer,cache,logfile,st,metrics)
         else:
-            logentry(logfile,'FATAL: Invalid log format specified')
-            sys.exit(1)
-    logentry(logfile,'Report generated: '+report_file)
-except Exception,e:
-    logentry(logfile,'FATAL: Error during report generation')
-    logentry(logfile,e)
-    sys.exit(1)
-
-# Email report
-# ------------
-
-try:
-    logentry(logfile,'Emailing report')
-    from email.mime.application import MIMEApplication
-    from email.mime.multipart import MIMEMultipart
-    msg=MIMEMultipart()
-    msg['Subject']=report_options['subject']
-    msg['From']=report_options['from']
-    msg['To']=report_options['to']
-    with open(report_file, "r") as rf:
-        part=MIMEApplication(rf.read(),Name=os.path.basename(report_file))
-    part['Content-Disposition'] = report_options['disposition']+';filename="%s"' % os.path.basename(report_file)
-    msg.attach(part)
-    s=smtplib.SMTP('localhost')
-    s.sendmail(report_options['from'], report_options['to'], msg.as_string())
-    logentry(logfile,'Report emailed. Script exiting..')
-except Exception,e:
-    logentry(logfile,'FATAL: Error during emailing of report')
-    logentry(logfile,e)
-sys.exit(0)
-
-
-
-
-
-
+            runreport(args.query,pool,mailer,cache,logfile,st,metrics)
+    except ReportError:
+        exitcode=1
+if mailer is not None:
+    mailer.close()
+pool.closeall()
+sys.exit(exitcode)
@@ -4,7 +4,28 @@
 #  from={email sender}   	      # default = root          
 #  format={html OR CSV}               # default = html
 #  disposition=inline OR attachment   # will be reverted to attachment for csv
-#  delimiter={delimiter character for CSV output}
+#  delimiter={delimiter character for CSV output}  # single character, csv is exported with COPY
+#  itersize={rows fetched from the database per batch}  # default = 10000
+#  cache_ttl={seconds a cached result may be reused}      # default = 3600
+#  cache_marker={SQL returning a value that changes when the source data does}
+#                                     # default = latest run_time of the sf_reports or sf_rollup tables in the query
+#  attach_threshold={bytes}           # larger reports are sent as a compressed attachment with a summary, default = 10485760
+#  compression={gzip OR zip OR none}  # compression used above attach_threshold, default = gzip
+#  order_by={SQL ORDER BY list}       # ordering applied by the database, e.g. "Delta size GB" DESC
+#  limit={number of rows}             # only the first rows are fetched (top-N), default = all rows
+#  page_size={rows per page}          # html: start a new table every page_size rows, default = 0 (one table)
+#  totals={comma separated columns}   # add a totals row, summed in SQL over all rows of the query
+#  raw_vars={comma separated vars}    # vars substituted as SQL text (e.g. a column name) instead of bound as values
+#  volumes={comma separated volumes OR all}  # run the query once per volume, bound to {{volume}} (refused inside quotes),
+#                                     # concurrently, and merge the results in volume order; order_by and limit
+#                                     # apply per volume and a volume that fails is listed in the report
+#  fan_concurrency={number}           # volumes queried at once with volumes, default = 4
+#  statement_timeout={seconds}        # cancel a volume's query after this long with volumes, default = 0 (none)
+#  explain={plan OR analyze}          # record the query plan in the run metrics (<log>.metrics.jsonl); analyze
+#                                     # runs EXPLAIN (ANALYZE, BUFFERS), which executes the query a second time
+#  max_cost={planner cost}            # ask the planner for the query's cost first and do not run it above this
+#                                     # budget (sfreport.py --estimate shows the costs), default = no budget
+#  over_budget={refuse OR warn}       # over max_cost, refuse the report (default) or run it with a warning
 
 [reportoptions]
 subject=Report: User size change rate
@@ -27,19 +48,24 @@ minimum_percent_change=0
 # It is specified with 'query='.
 # Note that every line should have at least one space of white space at the start, otherwise a parser error will be generated
 # Also, variables specified in the [queryvars] section should be surrounded by dual curly braces {{ and }}
+# Variables are passed to the database as bound values, except inside quoted strings and for raw_vars,
+# where their text is substituted. sfreport.py --fanout {csv file} runs the report once per row of the
+# csv file, whose header names the variables to set (e.g. one row per volume).
+# sfreport.py --source snapshot:{dir} runs the same query with DuckDB against a local snapshot written
+# by sfexport.py, instead of against the live database.
 
 [sqlquery]
 query=WITH runtime_range AS (
     SELECT MIN(run_time) AS start,
            MAX(run_time) AS end
-    FROM sf_reports.last_time_generic_history
+    FROM sf_rollup.user_history
     WHERE run_time >= (now() - interval '{{number_of_days_to_look_back}} days')
  ), user_size_for_chosen_days AS (
     SELECT volume_name,
            user_name,
            run_time,
            SUM(SIZE) AS size
-    FROM sf_reports.last_time_generic_history
+    FROM sf_rollup.user_history
     INNER JOIN runtime_range ON run_time = runtime_range.start OR run_time = runtime_range.end
     GROUP BY volume_name,
              user_name,
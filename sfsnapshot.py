@@ -0,0 +1,386 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Local columnar snapshots of the catalog. export() copies the columns the
+# reports use from sf.file_current, sf.dir_current, sf_volumes.volume and
+# every sf_reports/sf_rollup table into Parquet files, one directory per
+# table and one file per volume, all read in a single repeatable-read
+# transaction so the snapshot is consistent. connect() opens a snapshot with
+# DuckDB behind a small psycopg2-like connection, so the report tools can run
+# their SQL against it unchanged (--source snapshot:<dir>).
+
+import os
+import re
+import json
+import time
+import shutil
+import calendar
+import threading
+import psycopg2
+import psycopg2.extensions
+
+try:
+  import duckdb
+except ImportError:
+  duckdb = None
+
+try:
+  import pyarrow
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+
+metafile = "snapshot.json"
+
+# Catalog tables and the columns the reports read from them (None: all).
+# Every sf_reports and sf_rollup table is added, with all its columns.
+tables = [
+  ("sf", "file_current", ["id", "volume_id", "parent_id", "name", "size", "uid", "gid", "atime", "mtime", "ctime"]),
+  ("sf", "dir_current", ["id", "volume_id", "parent_id", "path", "name", "size", "uid", "gid", "atime", "mtime", "ctime"]),
+  ("sf_volumes", "volume", None),
+]
+reportschemas = ["sf_reports", "sf_rollup"]
+
+# Parse a --source value: "pg" (the default) for the live database, or
+# "snapshot:<dir>". Returns the snapshot directory, or None for pg.
+def parsesource(source):
+  if source is None or source == "pg":
+    return None
+  if source.startswith("snapshot:") and len(source) > len("snapshot:"):
+    return source[len("snapshot:"):]
+  raise ValueError("unknown source '%s', use pg or snapshot:<dir>" % (source))
+
+#--------------------------------------------------------------------------------------------
+# Export
+
+# Postgres type oid -> (arrow type, conversion of a non-null value)
+def _epochus(value):
+  if value.tzinfo is not None:
+    value = value.replace(tzinfo=None) - value.utcoffset()
+  return calendar.timegm(value.timetuple()) * 1000000 + value.microsecond
+
+def arrowtype(oid):
+  if oid in (20, 21, 23, 26):
+    return pyarrow.int64(), long
+  if oid in (700, 701, 1700):
+    return pyarrow.float64(), float
+  if oid == 16:
+    return pyarrow.bool_(), bool
+  if oid == 1082:
+    return pyarrow.date32(), None
+  if oid == 1114:
+    return pyarrow.timestamp("us"), _epochus
+  if oid == 1184:
+    return pyarrow.timestamp("us", tz="UTC"), _epochus
+  return pyarrow.string(), unicode
+
+# Collects the rows of one table into one Parquet file per volume. Rows are
+# buffered per volume and written a row group at a time.
+class PartitionWriter(object):
+
+  def __init__(self, tabledir, description, rowgroup):
+    self.tabledir = tabledir
+    self.rowgroup = rowgroup
+    fields = []
+    self.converters = []
+    for desc in description:
+      atype, conv = arrowtype(desc[1])
+      fields.append(pyarrow.field(desc[0], atype))
+      self.converters.append((atype, conv))
+    self.schema = pyarrow.schema(fields)
+    self.buffers = {}
+    self.writers = {}
+    self.rows = 0
+
+  def add(self, partition, row):
+    buf = self.buffers.setdefault(partition, [])
+    buf.append(row)
+    if len(buf) >= self.rowgroup:
+      self.flush(partition)
+
+  def flush(self, partition):
+    buf = self.buffers.pop(partition, [])
+    if partition not in self.writers:
+      pdir = os.path.join(self.tabledir, partition)
+      os.makedirs(pdir)
+      self.writers[partition] = pyarrow.parquet.ParquetWriter(os.path.join(pdir, "data.parquet"), self.schema)
+    arrays = []
+    for i, (atype, conv) in enumerate(self.converters):
+      column = [row[i] for row in buf]
+      if conv is _epochus:
+        arrays.append(pyarrow.array([None if v is None else conv(v) for v in column], type=pyarrow.int64()).cast(atype))
+      elif conv is not None:
+        arrays.append(pyarrow.array([None if v is None else conv(v) for v in column], type=atype))
+      else:
+        arrays.append(pyarrow.array(column, type=atype))
+    self.writers[partition].write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+    self.rows += len(buf)
+
+  def close(self):
+    for partition in self.buffers.keys():
+      self.flush(partition)
+    # an empty table still gets a file, so it can be read back
+    if not self.writers:
+      self.flush("volume-none")
+    for writer in self.writers.values():
+      writer.close()
+    return self.rows
+
+# Write a snapshot of the catalog to directory. The snapshot is built next to
+# it and moved into place when complete, replacing any previous one.
+# volumes limits the export to those volume names. Returns the metadata.
+def export(conn, directory, volumes=None, itersize=10000, log=None):
+  if pyarrow is None:
+    raise ImportError("snapshot export needs the pyarrow module")
+  directory = directory.rstrip("/")
+  work = directory + ".new"
+  if os.path.exists(work):
+    shutil.rmtree(work)
+  os.makedirs(work)
+
+  # every query below sees the same snapshot of the database
+  conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+  cur = conn.cursor()
+  cur.execute("SELECT extract(epoch from now())")
+  meta = {'created': cur.fetchone()[0], 'volumes': volumes, 'tables': {}}
+  if volumes:
+    cur.execute("SELECT id, name FROM sf_volumes.volume WHERE name = ANY(%s)", (volumes,))
+  else:
+    cur.execute("SELECT id, name FROM sf_volumes.volume")
+  volids = dict((name, vid) for vid, name in cur.fetchall())
+  cur.execute("""SELECT table_schema, table_name FROM information_schema.tables
+  WHERE table_schema = ANY(%s) ORDER BY table_schema, table_name""", (reportschemas,))
+  selected = tables + [(schema, name, None) for schema, name in cur.fetchall()]
+
+  for schema, name, columns in selected:
+    started = time.time()
+    cur.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = %s AND table_name = %s",
+                (schema, name))
+    available = set(row[0] for row in cur.fetchall())
+    if columns is None:
+      columns = sorted(available)
+    # partition on the volume, by id or by name
+    if "volume_id" in available:
+      key = "volume_id"
+      where = " WHERE volume_id = ANY(%(ids)s)"
+    elif "volume_name" in available:
+      key = "volume_name"
+      where = " WHERE volume_name = ANY(%(names)s)"
+    else:
+      key = None
+      where = ""
+    if key is not None and key not in columns:
+      columns = columns + [key]
+    if not volumes:
+      where = ""
+    query = "SELECT %s FROM %s.%s%s" % (", ".join('"%s"' % (c) for c in columns), schema, name, where)
+    rows = conn.cursor(name="sfsnapshot")
+    rows.itersize = itersize
+    rows.execute(query, {'ids': volids.values(), 'names': volids.keys()})
+    batch = rows.fetchmany(itersize)
+    writer = PartitionWriter(os.path.join(work, schema + "." + name), rows.description, itersize)
+    if key is not None:
+      keycol = columns.index(key)
+      names = dict((vid, vname) for vname, vid in volids.items())
+    while batch:
+      for row in batch:
+        if key is None:
+          partition = "all"
+        else:
+          vid = row[keycol]
+          if key == "volume_name":
+            vid = volids.get(vid)
+          if vid is None or (key == "volume_id" and vid not in names):
+            partition = "volume-none"
+          else:
+            partition = "volume-%d" % (vid)
+        writer.add(partition, row)
+      batch = rows.fetchmany(itersize)
+    rows.close()
+    count = writer.close()
+    meta['tables'][schema + "." + name] = {'columns': columns, 'rows': count}
+    if log is not None:
+      log("%s.%s: %d rows in %.1f sec" % (schema, name, count, time.time() - started))
+  conn.rollback()
+
+  with open(os.path.join(work, metafile), "w") as f:
+    json.dump(meta, f, indent=1)
+  old = directory + ".old"
+  if os.path.exists(directory):
+    os.rename(directory, old)
+  os.rename(work, directory)
+  if os.path.exists(old):
+    shutil.rmtree(old)
+  return meta
+
+#--------------------------------------------------------------------------------------------
+# Reading a snapshot
+
+# psycopg2 placeholders (%(name)s, %s) become DuckDB $n parameters and %% a
+# plain %. DuckDB compares strings bytewise, which is what COLLATE "C" asks for.
+paramstyle = re.compile(r"%\((\w+)\)s|%s|%%")
+collatec = re.compile(r'\s+COLLATE\s+"C"', re.IGNORECASE)
+
+def translate(query, params):
+  query = collatec.sub("", query)
+  if params is None:
+    return query, []
+  values = []
+  numbers = {}
+  positional = iter(params) if not isinstance(params, dict) else None
+  def sub(m):
+    if m.group(0) == "%%":
+      return "%"
+    if m.group(1) is not None:
+      name = m.group(1)
+      if name not in numbers:
+        values.append(params[name])
+        numbers[name] = len(values)
+      return "$%d" % (numbers[name])
+    values.append(next(positional))
+    return "$%d" % (len(values))
+  return paramstyle.sub(sub, query), values
+
+# DuckDB errors are raised as psycopg2.DatabaseError, so the tools handle
+# them the same way whichever source they read
+class SnapshotCursor(object):
+
+  def __init__(self, db):
+    self.db = db
+    self.itersize = 2000
+    self.description = None
+    self.rowcount = -1
+
+  def _call(self, fn, *args):
+    try:
+      return fn(*args)
+    except duckdb.Error, e:
+      raise psycopg2.DatabaseError(str(e))
+
+  def execute(self, query, params=None):
+    sql, values = translate(query, params)
+    self._call(self.db.execute, sql, values)
+    self.description = self.db.description
+
+  def fetchone(self):
+    return self._call(self.db.fetchone)
+
+  def fetchmany(self, size=None):
+    return self._call(self.db.fetchmany, size or self.itersize)
+
+  def fetchall(self):
+    return self._call(self.db.fetchall)
+
+  def __iter__(self):
+    while True:
+      rows = self.fetchmany(self.itersize)
+      if not rows:
+        return
+      for row in rows:
+        yield row
+
+  def close(self):
+    self.db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+# A snapshot opened read-only. Transactions do not apply: the data never
+# changes, so commit and rollback do nothing.
+class SnapshotConnection(object):
+
+  def __init__(self, directory):
+    if duckdb is None:
+      raise ImportError("snapshot sources need the duckdb module")
+    with open(os.path.join(directory, metafile)) as f:
+      self.meta = json.load(f)
+    self.directory = directory
+    self.autocommit = True
+    self.db = duckdb.connect(":memory:")
+    for table in sorted(self.meta['tables']):
+      schema = table.split(".")[0]
+      files = os.path.join(directory, table, "*", "*.parquet").replace("'", "''")
+      self.db.execute("CREATE SCHEMA IF NOT EXISTS %s" % (schema))
+      self.db.execute("CREATE VIEW %s AS SELECT * FROM read_parquet('%s')" % (table, files))
+
+  def cursor(self, name=None):
+    # name is accepted for named (server-side) cursors; results are always
+    # fetched in itersize batches
+    return SnapshotCursor(self.db.cursor())
+
+  def commit(self):
+    pass
+
+  def rollback(self):
+    pass
+
+  def close(self):
+    self.db.close()
+
+def connect(directory):
+  return SnapshotConnection(directory)
+
+# Stands in for psycopg2.pool.ThreadedConnectionPool; every thread gets its
+# own DuckDB connection.
+class SnapshotPool(object):
+
+  def __init__(self, directory):
+    self.directory = directory
+    self.lock = threading.Lock()
+    self.free = []
+    self.opened = []
+
+  def getconn(self):
+    with self.lock:
+      if self.free:
+        return self.free.pop()
+    conn = SnapshotConnection(self.directory)
+    with self.lock:
+      self.opened.append(conn)
+    return conn
+
+  def putconn(self, conn, close=False):
+    with self.lock:
+      if close:
+        self.opened.remove(conn)
+      else:
+        self.free.append(conn)
+    if close:
+      conn.close()
+
+  def closeall(self):
+    with self.lock:
+      for conn in self.opened:
+        conn.close()
+      self.opened = []
+      self.free = []
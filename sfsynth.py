@@ -0,0 +1,438 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Synthetic Starfish catalog for benchmarking the report tools without a
+# live Starfish install. generate() fills a scratch Postgres database with
+# the sf.file_current, sf.dir_current, sf_volumes.volume, sf_volumes.mount
+# and sf_reports tables, with only the columns the tools here read.
+#
+# The catalog is drawn from a seeded random model, so the same entries and
+# seed always give the same catalog. Directory trees are built by splitting
+# a budget of directories between a random number of children, which gives
+# skewed subtrees and realistic depth; files per directory, file sizes and
+# ages are lognormal, ages are correlated within a directory, and owners
+# follow a Zipf-like distribution with most files owned by the owner of
+# their directory. The sf_reports tables are then aggregated from the files
+# in SQL, with history snapshots going back a week per run_time.
+#
+# A database is only ever replaced if it holds a catalog written here
+# (sf_synth.catalog), never a real one.
+
+import math
+import time
+import random
+import bisect
+import datetime
+
+version = "sfsynth 1"
+
+# directory and file name stems and file extensions
+dirstems = ("proj", "data", "src", "run", "sample", "scratch", "results", "lib", "build", "home")
+filestems = ("part", "out", "img", "seq", "log", "chunk", "frame", "model", "table", "file")
+extensions = ("dat", "txt", "h5", "log", "py", "c", "nc", "bam", "tif", "gz")
+
+# atime_age/mtime_age ranges of sf_reports, youngest first, with their
+# starting age in months
+agebuckets = [
+  ("Previous Months: 0-1", 0),
+  ("Previous Months: 1-3", 1),
+  ("Previous Months: 3-6", 3),
+  ("Previous Months: 6-12", 6),
+  ("Previous Years: 1-2", 12),
+  ("Previous Years: 2-3", 24),
+  ("Previous Years: > 3", 36),
+]
+
+tables = [
+  """CREATE TABLE sf_volumes.volume (
+    id integer PRIMARY KEY,
+    name text NOT NULL UNIQUE)""",
+  """CREATE TABLE sf_volumes.mount (
+    id integer PRIMARY KEY,
+    volume_id integer NOT NULL,
+    path text NOT NULL)""",
+  """CREATE TABLE sf.dir_current (
+    id bigint NOT NULL,
+    volume_id integer NOT NULL,
+    parent_id bigint,
+    path text NOT NULL,
+    name text NOT NULL,
+    depth integer NOT NULL,
+    uid integer NOT NULL,
+    gid integer NOT NULL,
+    size bigint NOT NULL,
+    atime timestamp with time zone,
+    mtime timestamp with time zone,
+    ctime timestamp with time zone)""",
+  """CREATE TABLE sf.file_current (
+    id bigint NOT NULL,
+    volume_id integer NOT NULL,
+    parent_id bigint NOT NULL,
+    name text NOT NULL,
+    uid integer NOT NULL,
+    gid integer NOT NULL,
+    size bigint NOT NULL,
+    atime timestamp with time zone,
+    mtime timestamp with time zone,
+    ctime timestamp with time zone)""",
+  """CREATE TABLE sf_reports.last_time_generic_current (
+    volume_name text NOT NULL,
+    run_time timestamp with time zone NOT NULL,
+    user_name text,
+    group_name text,
+    atime_age text,
+    mtime_age text,
+    size numeric,
+    count bigint,
+    cost numeric)""",
+  """CREATE TABLE sf_reports.last_time_generic_history (
+    volume_name text NOT NULL,
+    run_time timestamp with time zone NOT NULL,
+    user_name text,
+    group_name text,
+    atime_age text,
+    mtime_age text,
+    size numeric,
+    count bigint,
+    cost numeric)""",
+  """CREATE TABLE sf_reports.tags_current (
+    volume_name text NOT NULL,
+    run_time timestamp with time zone NOT NULL,
+    tag text,
+    atime_age text,
+    size numeric,
+    count bigint)""",
+  """CREATE TABLE sf_synth.catalog (
+    version text NOT NULL,
+    scale bigint NOT NULL,
+    entries bigint NOT NULL,
+    files bigint NOT NULL,
+    dirs bigint NOT NULL,
+    volumes integer NOT NULL,
+    users integer NOT NULL,
+    groups integer NOT NULL,
+    seed integer NOT NULL,
+    run_time timestamp with time zone NOT NULL,
+    elapsed double precision NOT NULL)""",
+]
+
+# Built once the data is loaded, which is much faster than maintaining them
+indexes = [
+  "ALTER TABLE sf.dir_current ADD PRIMARY KEY (id)",
+  "CREATE INDEX dir_current_volume_path ON sf.dir_current (volume_id, path)",
+  "CREATE INDEX dir_current_parent ON sf.dir_current (volume_id, parent_id, id)",
+  "ALTER TABLE sf.file_current ADD PRIMARY KEY (id)",
+  "CREATE INDEX file_current_parent ON sf.file_current (volume_id, parent_id, id)",
+  "CREATE INDEX last_time_generic_current_volume ON sf_reports.last_time_generic_current (volume_name, run_time)",
+  "CREATE INDEX last_time_generic_history_volume ON sf_reports.last_time_generic_history (volume_name, run_time)",
+  "CREATE INDEX tags_current_volume ON sf_reports.tags_current (volume_name, run_time)",
+]
+
+schemas = ("sf", "sf_volumes", "sf_reports", "sf_rollup", "sf_synth")
+
+# oldest directory or file, in days
+maxage = 20 * 365.0
+
+# Parameters of the random catalog model
+class Model(object):
+
+  def __init__(self, entries, volumes=2, users=200, groups=20, seed=1, dirratio=0.05, maxdepth=24, now=None):
+    if entries < 10 * volumes:
+      raise ValueError("at least %d entries are needed for %d volume(s)" % (10 * volumes, volumes))
+    self.entries = entries
+    self.volumes = volumes
+    self.users = users
+    self.groups = groups
+    self.seed = seed
+    self.maxdepth = maxdepth
+    self.dirs = max(volumes, int(entries * dirratio))
+    self.files = entries - self.dirs
+    # midnight, so the same seed gives the same catalog all day
+    self.now = now if now is not None else (int(time.time()) // 86400) * 86400
+    # Zipf-like owner weights: a few users own most of the files
+    total = 0.0
+    self.usercdf = []
+    for i in range(users):
+      total += 1.0 / (i + 1) ** 1.1
+      self.usercdf.append(total)
+
+  def volumename(self, n):
+    return "vol%02d" % (n + 1)
+
+  def uid(self, n):
+    return 1000 + n
+
+  # primary group of user n
+  def gid(self, n):
+    return 100 + (n * 7) % self.groups
+
+  def pickuser(self, rng):
+    return bisect.bisect_left(self.usercdf, rng.random() * self.usercdf[-1])
+
+  # directories on volume n
+  def volumedirs(self, n):
+    dirs = self.dirs // self.volumes
+    if n < self.dirs % self.volumes:
+      dirs += 1
+    return dirs
+
+# Directories of one volume, in depth first order: (id, parent id, path,
+# name, depth, user, age in days, number of files). Each directory splits
+# the directories left in its budget between its children.
+def tree(model, volume, firstid):
+  rng = random.Random(model.seed * 100003 + volume * 2)
+  filemean = float(model.files) / model.dirs
+  nextid = [firstid]
+
+  def newdir(parentid, path, name, depth, user, age):
+    dirid = nextid[0]
+    nextid[0] += 1
+    # files per directory: lognormal with mean filemean
+    nfiles = int(filemean * rng.lognormvariate(-0.845, 1.3) + rng.random())
+    return (dirid, parentid, path, name, depth, user, min(max(age, 0.1), maxage), nfiles)
+
+  root = newdir(None, "", "", 0, model.pickuser(rng), 180.0)
+  yield root
+  stack = [(root, model.volumedirs(volume) - 1)]
+  while stack:
+    parent, budget = stack.pop()
+    if budget <= 0:
+      continue
+    dirid, parentid, path, name, depth, user, age, nfiles = parent
+    if depth + 1 >= model.maxdepth:
+      children = budget
+    else:
+      # wide near the top, narrower further down
+      fanout = 12.0 if depth < 2 else 4.0
+      children = min(budget, 1 + int(rng.expovariate(1.0 / fanout)))
+    weights = [rng.lognormvariate(0, 1.2) for i in range(children)]
+    total = sum(weights)
+    rest = budget - children
+    shares = [int(rest * w / total) for w in weights]
+    shares[weights.index(max(weights))] += rest - sum(shares)
+    for i in range(children):
+      cname = "%s%d" % (dirstems[rng.randrange(len(dirstems))], i)
+      if path == "":
+        cpath = cname
+      else:
+        cpath = path + "/" + cname
+      # most directories belong to the owner of their parent
+      cuser = user if rng.random() < 0.85 else model.pickuser(rng)
+      cage = age * rng.lognormvariate(0, 0.8)
+      child = newdir(dirid, cpath, cname, depth + 1, cuser, cage)
+      yield child
+      stack.append((child, shares[i]))
+
+# Format epoch seconds as a timestamptz literal. Timestamps are written at
+# a minute's resolution, and dates and times of day are cached, as
+# formatting them is most of the cost of generating a file row.
+class Timestamps(object):
+
+  def __init__(self):
+    self.days = {}
+    self.minutes = ["%02d:%02d:00+00" % (m // 60, m % 60) for m in range(1440)]
+
+  def format(self, t):
+    day, secs = divmod(int(t), 86400)
+    date = self.days.get(day)
+    if date is None:
+      date = datetime.datetime.utcfromtimestamp(day * 86400).strftime("%Y-%m-%d ")
+      self.days[day] = date
+    return date + self.minutes[secs // 60]
+
+# dir_current rows (COPY text format) of volume n, ids from firstid
+def dirrows(model, volume, firstid):
+  ts = Timestamps()
+  for dirid, parentid, path, name, depth, user, age, nfiles in tree(model, volume, firstid):
+    mtime = model.now - age * 86400
+    atime = model.now - age * 0.3 * 86400
+    if parentid is None:
+      parentid = "\\N"
+    yield "%d\t%d\t%s\t%s\t%s\t%d\t%d\t%d\t4096\t%s\t%s\t%s\n" % (
+      dirid, volume + 1, parentid, path, name, depth, model.uid(user), model.gid(user),
+      ts.format(atime), ts.format(mtime), ts.format(mtime))
+
+# file_current rows of volume n. The tree is rebuilt from the same seed, so
+# the files land in the directories dirrows() wrote; a separate generator
+# draws the files.
+def filerows(model, volume, firstdirid, firstid, counts):
+  rng = random.Random(model.seed * 100003 + volume * 2 + 1)
+  ts = Timestamps()
+  fileid = firstid
+  for dirid, parentid, path, name, depth, user, age, nfiles in tree(model, volume, firstdirid):
+    counts[1] += 1
+    for i in range(nfiles):
+      # files mostly belong to the directory owner, a few to someone else
+      # or root, and most are in the owner's primary group
+      r = rng.random()
+      if r < 0.90:
+        fuser = user
+      else:
+        fuser = model.pickuser(rng)
+      uid = 0 if r > 0.985 else model.uid(fuser)
+      gid = model.gid(fuser) if rng.random() < 0.9 else 100 + rng.randrange(model.groups)
+      if rng.random() < 0.03:
+        size = 0
+      else:
+        size = min(int(rng.lognormvariate(10, 2.5)), 1 << 40)
+      mage = min(age * rng.lognormvariate(0, 0.5), maxage)
+      aage = mage * rng.uniform(0.05, 1.0)
+      fname = "%s%d.%s" % (filestems[rng.randrange(len(filestems))], i, extensions[rng.randrange(len(extensions))])
+      yield "%d\t%d\t%d\t%s\t%d\t%d\t%d\t%s\t%s\t%s\n" % (
+        fileid, volume + 1, dirid, fname, uid, gid, size,
+        ts.format(model.now - aage * 86400), ts.format(model.now - mage * 86400),
+        ts.format(model.now - mage * 0.95 * 86400))
+      fileid += 1
+      counts[0] += 1
+
+# File-like reader over a generator of lines, for cursor.copy_expert()
+class LineReader(object):
+
+  def __init__(self, lines):
+    self.lines = lines
+    self.pending = ""
+
+  def read(self, size=65536):
+    parts = [self.pending]
+    n = len(self.pending)
+    for line in self.lines:
+      parts.append(line)
+      n += len(line)
+      if n >= size:
+        break
+    data = "".join(parts)
+    self.pending = data[size:]
+    return data[:size]
+
+# None if the database holds no catalog, the sf_synth.catalog row (a dict)
+# if it holds a synthetic one. A real catalog raises RuntimeError.
+def existing(cur):
+  cur.execute("SELECT to_regclass('sf_volumes.volume') IS NOT NULL, to_regclass('sf_synth.catalog') IS NOT NULL")
+  catalog, synthetic = cur.fetchone()
+  if synthetic:
+    cur.execute("SELECT * FROM sf_synth.catalog")
+    row = cur.fetchone()
+    if row is not None:
+      return dict(zip([desc[0] for desc in cur.description], row))
+  if catalog:
+    raise RuntimeError("the database holds a Starfish catalog that was not generated by sfsynth, refusing to replace it")
+  return None
+
+# SQL mapping a timestamp column to its sf_reports age range at run_time
+def agecase(column):
+  whens = ["WHEN %s > %%(run_time)s::timestamptz - interval '%d months' THEN '%s'" % (column, agebuckets[i + 1][1], label)
+           for i, (label, months) in enumerate(agebuckets[:-1])]
+  return "CASE %s ELSE '%s' END" % (" ".join(whens), agebuckets[-1][0])
+
+def reportrows(cur, model, history, costpertb):
+  params = {"run_time": datetime.datetime.utcfromtimestamp(model.now).strftime("%Y-%m-%d %H:%M:%S+00"),
+            "costpertb": costpertb, "seed": (model.seed % 1000) / 1000.0}
+  cur.execute("""INSERT INTO sf_reports.last_time_generic_current
+  SELECT v.name, %%(run_time)s::timestamptz, 'user' || f.uid, 'group' || f.gid, %s, %s,
+         SUM(f.size), COUNT(*), SUM(f.size) / 1099511627776.0 * %%(costpertb)s
+    FROM sf.file_current f JOIN sf_volumes.volume v ON v.id = f.volume_id
+   GROUP BY 1, 2, 3, 4, 5, 6""" % (agecase("f.atime"), agecase("f.mtime")), params)
+  cur.execute("""INSERT INTO sf_reports.tags_current
+  SELECT v.name, %%(run_time)s::timestamptz, 'project:' || abs(hashtext(split_part(d.path, '/', 1))) %%%% 40, %s,
+         SUM(f.size), COUNT(*)
+    FROM sf.file_current f JOIN sf_volumes.volume v ON v.id = f.volume_id
+         JOIN sf.dir_current d ON d.id = f.parent_id
+   WHERE d.depth > 0
+   GROUP BY 1, 2, 3, 4""" % (agecase("f.atime")), params)
+  # Weekly snapshots going back from run_time, each user's usage a little
+  # smaller the further back it goes
+  cur.execute("SELECT setseed(%(seed)s)", params)
+  for week in range(history):
+    params["week"] = week
+    cur.execute("""INSERT INTO sf_reports.last_time_generic_history
+  SELECT volume_name, run_time - %(week)s * interval '7 days', user_name, group_name, atime_age, mtime_age,
+         round(size * power(0.98, %(week)s) * (0.9 + random() * 0.2)), count, cost * power(0.98, %(week)s)
+    FROM sf_reports.last_time_generic_current""", params)
+
+# Replace the catalog in the database of conn with a synthetic one drawn
+# from model, with history weekly sf_reports snapshots. log is called with
+# progress messages. Returns the new sf_synth.catalog row.
+def generate(conn, model, history=8, costpertb=10.0, log=None):
+  started = time.time()
+  def progress(msg):
+    if log is not None:
+      log("%s (%.1f sec)" % (msg, time.time() - started))
+  cur = conn.cursor()
+  existing(cur)
+  for schema in schemas:
+    cur.execute("DROP SCHEMA IF EXISTS %s CASCADE" % (schema))
+  for schema in schemas:
+    cur.execute("CREATE SCHEMA %s" % (schema))
+  for ddl in tables:
+    cur.execute(ddl)
+  for n in range(model.volumes):
+    cur.execute("INSERT INTO sf_volumes.volume (id, name) VALUES (%s, %s)", (n + 1, model.volumename(n)))
+    cur.execute("INSERT INTO sf_volumes.mount (id, volume_id, path) VALUES (%s, %s, %s)",
+                (n + 1, n + 1, "/mnt/" + model.volumename(n)))
+  counts = [0, 0]
+  dirid, fileid = 1, 1
+  for n in range(model.volumes):
+    cur.copy_expert("COPY sf.dir_current FROM STDIN", LineReader(dirrows(model, n, dirid)))
+    progress("%s: %d directories" % (model.volumename(n), cur.rowcount))
+    before = counts[0]
+    cur.copy_expert("COPY sf.file_current FROM STDIN", LineReader(filerows(model, n, dirid, fileid, counts)))
+    progress("%s: %d files" % (model.volumename(n), counts[0] - before))
+    dirid += model.volumedirs(n)
+    fileid += counts[0] - before
+  for ddl in indexes[:5]:
+    cur.execute(ddl)
+  progress("indexes built")
+  reportrows(cur, model, history, costpertb)
+  for ddl in indexes[5:]:
+    cur.execute(ddl)
+  progress("sf_reports tables filled")
+  catalog = {"version": version, "scale": model.entries, "entries": counts[0] + counts[1], "files": counts[0], "dirs": counts[1],
+             "volumes": model.volumes, "users": model.users, "groups": model.groups, "seed": model.seed,
+             "run_time": datetime.datetime.utcfromtimestamp(model.now).strftime("%Y-%m-%d %H:%M:%S+00"),
+             "elapsed": time.time() - started}
+  columns = sorted(catalog)
+  cur.execute("INSERT INTO sf_synth.catalog (%s) VALUES (%s)" % (", ".join(columns), ", ".join("%%(%s)s" % (c) for c in columns)), catalog)
+  conn.commit()
+  # ANALYZE outside the load transaction, so the planner sees the new rows
+  # the way it would on a live catalog
+  conn.autocommit = True
+  for table in ("sf_volumes.volume", "sf_volumes.mount", "sf.dir_current", "sf.file_current",
+                "sf_reports.last_time_generic_current", "sf_reports.last_time_generic_history", "sf_reports.tags_current"):
+    cur.execute("ANALYZE " + table)
+  conn.autocommit = False
+  progress("analyzed")
+  return catalog
+
+# Whether catalog (from existing()) was generated from model
+def matches(catalog, model):
+  if catalog is None:
+    return False
+  return (catalog["version"], catalog["scale"], catalog["seed"], catalog["volumes"], catalog["users"], catalog["groups"]) == \
+         (version, model.entries, model.seed, model.volumes, model.users, model.groups)
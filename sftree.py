@@ -0,0 +1,221 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Directory tree index for agedu dumps. build() rolls the per-directory
+# stats in an agedu.py sidecar index up the directory tree and writes them
+# as flat arrays; TreeIndex maps the file and answers "top N subtrees under
+# PATH" without a catalog query.
+#
+# Directories are stored in preorder (sorted by volume, then path with "/"
+# sorting before every other byte), so the subtree of directory i is the
+# contiguous range i..end[i]-1 and a top-N query is one partial sort over a
+# slice of an array. Every directory holds cumulative file count and bytes,
+# the min/max atime and mtime below it, and the size-weighted mean atime and
+# mtime of its files.
+#
+# File layout: magic, a header of (count, name bytes, created), then the
+# arrays below, n entries each (keyoff has n+1), little-endian, then the
+# sort keys of all directories back to back.
+
+import os
+import time
+import numpy
+
+magic = "SFTREE\x00\x01"
+headerdtype = numpy.dtype([("count", "<i8"), ("keybytes", "<i8"), ("created", "<f8")])
+arrays = [
+  ("keyoff", "<i8"), ("parent", "<i8"), ("end", "<i8"), ("depth", "<i8"), ("dirid", "<i8"),
+  ("files", "<i8"), ("bytes", "<i8"), ("ownfiles", "<i8"), ("ownbytes", "<i8"),
+  ("amin", "<f8"), ("amax", "<f8"), ("amean", "<f8"),
+  ("mmin", "<f8"), ("mmax", "<f8"), ("mmean", "<f8"),
+]
+
+# Sort key of a directory: the volume, then each path component, separated
+# by NUL so a directory sorts directly before everything below it
+def treekey(vname, dpath):
+  if dpath == "":
+    return vname
+  return vname + "\x00" + dpath.replace("/", "\x00")
+
+# "volume:/path" for a sort key, and back
+def displaypath(key):
+  parts = key.split("\x00", 1)
+  if len(parts) == 1:
+    return parts[0] + ":/"
+  return parts[0] + ":/" + parts[1].replace("\x00", "/")
+
+def keyforpath(path):
+  vname, sep, dpath = path.partition(":")
+  return treekey(vname, dpath.strip("/"))
+
+# Build the tree file at treepath from an agedu.py index (agedu index v2)
+def build(indexpath, treepath):
+  own = {}
+  with open(indexpath) as f:
+    header = f.readline().rstrip("\n").split("\t")
+    if header[0] != "agedu index v2":
+      raise ValueError("%s is not an agedu index v2" % (indexpath))
+    for line in f:
+      fields = line.rstrip("\n").split("\t", 13)
+      stats = [int(fields[5]), int(fields[6])] + [float(v) if v else numpy.nan for v in fields[7:13]]
+      key = treekey(fields[0], fields[13])
+      # a directory block can only appear once, but be safe with repeats
+      if key in own:
+        old = own[key][1]
+        stats = [old[0] + stats[0], old[1] + stats[1],
+                 numpy.fmin(old[2], stats[2]), numpy.fmax(old[3], stats[3]), old[4] + stats[4],
+                 numpy.fmin(old[5], stats[5]), numpy.fmax(old[6], stats[6]), old[7] + stats[7]]
+      own[key] = (int(fields[1]), stats)
+
+  # directories with no files of their own only appear as ancestors
+  for key in own.keys():
+    while "\x00" in key:
+      key = key.rsplit("\x00", 1)[0]
+      if key in own:
+        break
+      own[key] = (-1, [0, 0, numpy.nan, numpy.nan, 0.0, numpy.nan, numpy.nan, 0.0])
+
+  keys = sorted(own)
+  n = len(keys)
+  position = dict((key, i) for i, key in enumerate(keys))
+  out = {}
+  out["parent"] = numpy.array([position.get(k.rsplit("\x00", 1)[0], -1) if "\x00" in k else -1 for k in keys], dtype=numpy.int64)
+  out["depth"] = numpy.array([k.count("\x00") for k in keys], dtype=numpy.int64)
+  out["dirid"] = numpy.array([own[k][0] for k in keys], dtype=numpy.int64)
+  stats = numpy.array([own[k][1] for k in keys], dtype=numpy.float64).reshape(n, 8)
+  out["ownfiles"] = stats[:, 0].astype(numpy.int64)
+  out["ownbytes"] = stats[:, 1].astype(numpy.int64)
+  files = out["ownfiles"].copy()
+  size = out["ownbytes"].copy()
+  amin, amax, asum = stats[:, 2].copy(), stats[:, 3].copy(), stats[:, 4].copy()
+  mmin, mmax, msum = stats[:, 5].copy(), stats[:, 6].copy(), stats[:, 7].copy()
+  nodes = numpy.ones(n, dtype=numpy.int64)
+
+  # roll up one level at a time, deepest first
+  for depth in range(int(out["depth"].max()) if n else 0, 0, -1):
+    child = numpy.nonzero(out["depth"] == depth)[0]
+    parent = out["parent"][child]
+    numpy.add.at(files, parent, files[child])
+    numpy.add.at(size, parent, size[child])
+    numpy.add.at(asum, parent, asum[child])
+    numpy.add.at(msum, parent, msum[child])
+    numpy.add.at(nodes, parent, nodes[child])
+    numpy.fmin.at(amin, parent, amin[child])
+    numpy.fmax.at(amax, parent, amax[child])
+    numpy.fmin.at(mmin, parent, mmin[child])
+    numpy.fmax.at(mmax, parent, mmax[child])
+
+  out["files"] = files
+  out["bytes"] = size
+  out["end"] = numpy.arange(n, dtype=numpy.int64) + nodes
+  out["amin"], out["amax"], out["mmin"], out["mmax"] = amin, amax, mmin, mmax
+  with numpy.errstate(invalid="ignore", divide="ignore"):
+    out["amean"] = numpy.where(size > 0, asum / size, (amin + amax) / 2)
+    out["mmean"] = numpy.where(size > 0, msum / size, (mmin + mmax) / 2)
+  out["keyoff"] = numpy.zeros(n + 1, dtype=numpy.int64)
+  out["keyoff"][1:] = numpy.cumsum([len(k) for k in keys])
+
+  tmp = treepath + ".new"
+  with open(tmp, "wb") as f:
+    f.write(magic)
+    numpy.array([(n, int(out["keyoff"][-1]), time.time())], dtype=headerdtype).tofile(f)
+    for name, dtype in arrays:
+      numpy.asarray(out[name], dtype=dtype).tofile(f)
+    f.write("".join(keys))
+  os.rename(tmp, treepath)
+  return n
+
+class TreeIndex(object):
+
+  def __init__(self, path):
+    with open(path, "rb") as f:
+      if f.read(len(magic)) != magic:
+        raise ValueError("%s is not a tree index" % (path))
+    header = numpy.memmap(path, dtype=headerdtype, mode="r", offset=len(magic), shape=(1,))[0]
+    self.count = int(header["count"])
+    self.created = float(header["created"])
+    offset = len(magic) + headerdtype.itemsize
+    for name, dtype in arrays:
+      length = self.count + 1 if name == "keyoff" else self.count
+      setattr(self, name, numpy.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(length,)))
+      offset += length * numpy.dtype(dtype).itemsize
+    self.keys = numpy.memmap(path, dtype="S1", mode="r", offset=offset, shape=(int(header["keybytes"]),))
+
+  def key(self, i):
+    return self.keys[self.keyoff[i]:self.keyoff[i + 1]].tobytes()
+
+  # Position of a "volume:/path" directory, or None
+  def find(self, path):
+    key = keyforpath(path)
+    lo, hi = 0, self.count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self.key(mid) < key:
+        lo = mid + 1
+      else:
+        hi = mid
+    if lo < self.count and self.key(lo) == key:
+      return lo
+    return None
+
+  # Details of directory i
+  def entry(self, i):
+    return {'path': displaypath(self.key(i)), 'dirid': int(self.dirid[i]),
+            'files': int(self.files[i]), 'bytes': int(self.bytes[i]),
+            'ownfiles': int(self.ownfiles[i]), 'ownbytes': int(self.ownbytes[i]),
+            'atime': (float(self.amin[i]), float(self.amax[i]), float(self.amean[i])),
+            'mtime': (float(self.mmin[i]), float(self.mmax[i]), float(self.mmean[i]))}
+
+  # The n largest (by="bytes" or "files") or oldest (by="atime" or "mtime",
+  # on the size-weighted mean) subtrees below path, or below every volume
+  # if path is None. depth limits them to that many levels down (1: the
+  # immediate subdirectories), 0 for any depth.
+  def top(self, path=None, n=20, by="bytes", depth=1):
+    if path is None:
+      lo, hi, base = 0, self.count, -1
+    else:
+      i = self.find(path)
+      if i is None:
+        raise KeyError(path)
+      lo, hi, base = i + 1, int(self.end[i]), int(self.depth[i])
+    candidates = numpy.arange(lo, hi)
+    if depth:
+      candidates = candidates[self.depth[lo:hi] == base + depth]
+    if by in ("bytes", "files"):
+      values = -numpy.asarray(getattr(self, by)[candidates], dtype=numpy.float64)
+    elif by in ("atime", "mtime"):
+      values = numpy.asarray(getattr(self, by[0] + "mean")[candidates], dtype=numpy.float64)
+      values = numpy.where(numpy.isnan(values), numpy.inf, values)
+    else:
+      raise ValueError("unknown ordering '%s'" % (by))
+    if len(candidates) > n:
+      part = numpy.argpartition(values, n)[:n]
+      candidates, values = candidates[part], values[part]
+    return [self.entry(int(i)) for i in candidates[numpy.argsort(values, kind="mergesort")]]
@@ -41,10 +41,12 @@ set -euo pipefail
 # Change Log
 # 1.01 (April 9, 2017) - Change from mailx to sendmail so html inline can be sent.
 #                      - Added option to specify attachment or inline
+# 1.02 (October 17, 2026) - Read per-tag totals from the sf_rollup.tag_age_current summary
+#                           table kept up to date by sfrefresh.py
 
 
 # Set variables
-readonly VERSION="1.01 April 9, 2018"
+readonly VERSION="1.02 October 17, 2026"
 PROG="${0##*/}"
 readonly SFHOME="${SFHOME:-/opt/starfish}"
 readonly LOGDIR="$SFHOME/log/${PROG%.*}"
@@ -218,15 +220,15 @@ build_sql_query() {
   fi
 QUERY="
 SELECT tag,
-sum(round(size/(1024*1024*1024.0),2)) filter (where atime_age = 'Previous Months: 0-1') as \"Previous Months: 0-1\",
-sum(round(size/(1024*1024*1024.0),2)) filter (where atime_age = 'Previous Months: 1-3') as \"Previous Months: 1-3\",
-sum(round(size/(1024*1024*1024.0),2)) filter (where atime_age = 'Previous Months: 3-6') as \"Previous Months: 3-6\",
-sum(round(size/(1024*1024*1024.0),2)) filter (where atime_age = 'Previous Months: 6-12') as \"Previous Months: 6-12\",
-sum(round(size/(1024*1024*1024.0),2)) filter (where atime_age = 'Previous Years: 1-2') as \"Previous Years: 1-2\",
-sum(round(size/(1024*1024*1024.0),2)) filter (where atime_age = 'Previous Years: 2-3') as \"Previous Years: 2-3\",
-sum(round(size/(1024*1024*1024.0),2)) filter (where atime_age = 'Previous Years: > 3') as \"Previous Years: > 3\",
-sum(round(size/(1024*1024*1024.0),2)) as \"Totals (GB)\"
-FROM sf_reports.tags_current WHERE $volumes_query
+round(sum(size) filter (where atime_age = 'Previous Months: 0-1')/(1024*1024*1024.0),2) as \"Previous Months: 0-1\",
+round(sum(size) filter (where atime_age = 'Previous Months: 1-3')/(1024*1024*1024.0),2) as \"Previous Months: 1-3\",
+round(sum(size) filter (where atime_age = 'Previous Months: 3-6')/(1024*1024*1024.0),2) as \"Previous Months: 3-6\",
+round(sum(size) filter (where atime_age = 'Previous Months: 6-12')/(1024*1024*1024.0),2) as \"Previous Months: 6-12\",
+round(sum(size) filter (where atime_age = 'Previous Years: 1-2')/(1024*1024*1024.0),2) as \"Previous Years: 1-2\",
+round(sum(size) filter (where atime_age = 'Previous Years: 2-3')/(1024*1024*1024.0),2) as \"Previous Years: 2-3\",
+round(sum(size) filter (where atime_age = 'Previous Years: > 3')/(1024*1024*1024.0),2) as \"Previous Years: > 3\",
+round(sum(size)/(1024*1024*1024.0),2) as \"Totals (GB)\"
+FROM sf_rollup.tag_age_current WHERE $volumes_query
 GROUP BY tag
 ORDER BY sum(size) DESC
 ;
@@ -0,0 +1,130 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Unit tests for the sfapprox query rewriter, which is plain string work and
+# needs no database: python -m unittest test_sfapprox
+
+import unittest
+import sfapprox
+
+class SampleTest(unittest.TestCase):
+
+  def check(self, query, expected, pct=10):
+    self.assertEqual(sfapprox.sample(query, pct).sql, expected)
+
+  def test_tablesample(self):
+    s = sfapprox.sample("SELECT name FROM sf.file_current f WHERE size > 0", 5)
+    self.assertEqual(s.sql, "SELECT name FROM sf.file_current f TABLESAMPLE SYSTEM (5.0) WHERE size > 0")
+    self.assertEqual(s.table, "sf.file_current f")
+    self.assertEqual(s.scaled, 0)
+    self.assertEqual(len(s.notes), 1)
+
+  def test_keyword_is_not_alias(self):
+    self.check("SELECT count(*) FROM sf.file_current WHERE size > 0",
+      "SELECT (10.0 * count(*)) , greatest(0, (10.0 * count(*)) - 1.96 * sqrt(0.9 * count(*)) / 0.1) AS count_low, "
+      "(10.0 * count(*)) + 1.96 * sqrt(0.9 * count(*)) / 0.1 AS count_high FROM sf.file_current TABLESAMPLE SYSTEM (10.0) WHERE size > 0")
+
+  def test_bounds_named_after_alias(self):
+    s = sfapprox.sample("SELECT uid, sum(size) AS bytes FROM sf.file_current GROUP BY uid", 10)
+    self.assertEqual(s.bounds, ["bytes"])
+    self.assertEqual(s.scaled, 1)
+    self.assertTrue("(10.0 * sum(size)) - 1.96 * sqrt(0.9 * sum(power((size)::float8, 2))) / 0.1 AS bytes_low" in s.sql)
+
+  def test_nested_in_expression(self):
+    s = sfapprox.sample("SELECT uid, round(sum(size)/1024/1024/1024) AS gb FROM sf.file_current GROUP BY uid", 10)
+    self.assertEqual(s.sql, "SELECT uid, round((10.0 * sum(size))/1024/1024/1024) AS gb "
+      "FROM sf.file_current TABLESAMPLE SYSTEM (10.0) GROUP BY uid")
+    self.assertEqual(s.scaled, 1)
+    self.assertEqual(s.bounds, [])
+    self.assertEqual(s.notes, [])
+
+  def test_product(self):
+    self.check("SELECT sum(size)*0.02 AS cost FROM sf.file_current",
+      "SELECT (10.0 * sum(size))*0.02 AS cost FROM sf.file_current TABLESAMPLE SYSTEM (10.0)")
+
+  def test_having(self):
+    self.check("SELECT uid FROM sf.file_current GROUP BY uid HAVING count(*) > 1000",
+      "SELECT uid FROM sf.file_current TABLESAMPLE SYSTEM (10.0) GROUP BY uid HAVING (10.0 * count(*)) > 1000")
+
+  def test_order_by(self):
+    self.check("SELECT uid, max(size) FROM sf.file_current GROUP BY uid ORDER BY sum(size) DESC LIMIT 10",
+      "SELECT uid, max(size) FROM sf.file_current TABLESAMPLE SYSTEM (10.0) GROUP BY uid ORDER BY (10.0 * sum(size)) DESC LIMIT 10")
+
+  def test_nested_aggregates_scaled_once(self):
+    self.check("SELECT uid, sum(count(*)) OVER () AS total FROM sf.file_current GROUP BY uid",
+      "SELECT uid, (10.0 * sum(count(*)) OVER ()) AS total FROM sf.file_current TABLESAMPLE SYSTEM (10.0) GROUP BY uid")
+
+  def test_filter(self):
+    s = sfapprox.sample("SELECT count(*) FILTER (WHERE size = 0) AS empty, 1 FROM sf.file_current", 10)
+    self.assertTrue(s.sql.startswith("SELECT (10.0 * count(*) FILTER (WHERE size = 0)) AS empty, 1 , "
+      "greatest(0, (10.0 * count(*) FILTER (WHERE size = 0)) - 1.96 * sqrt(0.9 * count(*) FILTER (WHERE size = 0)) / 0.1) AS empty_low"))
+    self.assertEqual(s.bounds, ["empty"])
+
+  def test_distinct_count(self):
+    s = sfapprox.sample("SELECT count(DISTINCT uid) FROM sf.file_current", 10)
+    self.assertEqual(s.sql, "SELECT count(DISTINCT uid) FROM sf.file_current TABLESAMPLE SYSTEM (10.0)")
+    self.assertEqual(s.scaled, 0)
+    self.assertTrue("distinct count" in s.notes[0])
+
+  def test_subquery_left_alone(self):
+    self.check("SELECT count(*), (SELECT count(*) FROM sf.volume) AS volumes FROM sf.file_current",
+      "SELECT (10.0 * count(*)), (SELECT count(*) FROM sf.volume) AS volumes , "
+      "greatest(0, (10.0 * count(*)) - 1.96 * sqrt(0.9 * count(*)) / 0.1) AS count_low, "
+      "(10.0 * count(*)) + 1.96 * sqrt(0.9 * count(*)) / 0.1 AS count_high FROM sf.file_current TABLESAMPLE SYSTEM (10.0)")
+
+  def test_outer_level_left_alone(self):
+    self.check("SELECT sum(n) FROM (SELECT uid, count(*) AS n FROM sf.file_current GROUP BY uid) u HAVING count(*) > 2",
+      "SELECT sum(n) FROM (SELECT uid, (10.0 * count(*)) AS n , "
+      "greatest(0, (10.0 * count(*)) - 1.96 * sqrt(0.9 * count(*)) / 0.1) AS n_low, "
+      "(10.0 * count(*)) + 1.96 * sqrt(0.9 * count(*)) / 0.1 AS n_high "
+      "FROM sf.file_current TABLESAMPLE SYSTEM (10.0) GROUP BY uid) u HAVING count(*) > 2")
+
+  def test_union_branch_left_alone(self):
+    s = sfapprox.sample("SELECT count(*) FROM sf.file_current UNION ALL SELECT count(*) FROM sf.volume", 10)
+    self.assertEqual(s.sql, "SELECT (10.0 * count(*)) FROM sf.file_current TABLESAMPLE SYSTEM (10.0) "
+      "UNION ALL SELECT count(*) FROM sf.volume")
+    self.assertEqual(s.bounds, [])
+
+  def test_strings_and_names(self):
+    self.check("SELECT 'sum(x)' AS s, my_count(size), f.sum(1) FROM sf.file_current f",
+      "SELECT 'sum(x)' AS s, my_count(size), f.sum(1) FROM sf.file_current f TABLESAMPLE SYSTEM (10.0)")
+
+  def test_reports_table(self):
+    s = sfapprox.sample("SELECT sum(size) FROM sf_reports.last_time_generic_current", 1)
+    self.assertEqual(s.table, "sf_reports.last_time_generic_current")
+    self.assertTrue(s.sql.startswith("SELECT (100.0 * sum(size)) ,"))
+
+  def test_errors(self):
+    self.assertRaises(ValueError, sfapprox.sample, "SELECT 1", 10)
+    self.assertRaises(ValueError, sfapprox.sample, "SELECT count(*) FROM sf.file_current", 0)
+    self.assertRaises(ValueError, sfapprox.sample, "SELECT count(*) FROM sf.file_current", 101)
+
+if __name__ == "__main__":
+  unittest.main()
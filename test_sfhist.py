@@ -0,0 +1,60 @@
+#********************************************************
+#
+# Starfish Storage Corporation ("COMPANY") CONFIDENTIAL
+# Unpublished Copyright (c) 2011-2018 Starfish Storage Corporation, All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of COMPANY. The intellectual and
+# technical concepts contained herein are proprietary to COMPANY and may be covered by U.S. and Foreign
+# Patents, patents in process, and are protected by trade secret or copyright law. Dissemination of this
+# information or reproduction of this material is strictly forbidden unless prior written permission is
+# obtained from COMPANY.  Access to the source code contained herein is hereby forbidden to anyone except
+# current COMPANY employees, managers or contractors who have executed Confidentiality and Non-disclosure
+# agreements explicitly covering such access.
+#
+# ANY REPRODUCTION, COPYING, MODIFICATION, DISTRIBUTION, PUBLIC  PERFORMANCE, OR PUBLIC DISPLAY OF OR
+# THROUGH USE  OF THIS  SOURCE CODE  WITHOUT  THE EXPRESS WRITTEN CONSENT OF COMPANY IS STRICTLY PROHIBITED,
+# AND IN VIOLATION OF APPLICABLE LAWS AND INTERNATIONAL TREATIES.  THE RECEIPT OR POSSESSION OF  THIS SOURCE
+# CODE AND/OR RELATED INFORMATION DOES NOT CONVEY OR IMPLY ANY RIGHTS TO REPRODUCE, DISCLOSE OR DISTRIBUTE
+# ITS CONTENTS, OR TO MANUFACTURE, USE, OR SELL ANYTHING THAT IT  MAY DESCRIBE, IN WHOLE OR IN PART.  
+#
+# FOR U.S. GOVERNMENT CUSTOMERS REGARDING THIS DOCUMENTATION/SOFTWARE
+#   These notices shall be marked on any reproduction of this data, in whole or in part.
+#   NOTICE: Notwithstanding any other lease or license that may pertain to, or accompany the delivery of,
+#   this computer software, the rights of the Government regarding its use, reproduction and disclosure are
+#   as set forth in Section 52.227-19 of the FARS Computer Software-Restricted Rights clause.
+#   RESTRICTED RIGHTS NOTICE: Use, duplication, or disclosure by the Government is subject to the
+#   restrictions as set forth in subparagraph (c)(1)(ii) of the Rights in Technical Data and Computer
+#   Software clause at DFARS 52.227-7013.
+#
+#********************************************************
+#
+# Unit tests for the sfhist bucket helpers: python -m unittest test_sfhist
+
+import unittest
+import sfhist
+
+class BucketTest(unittest.TestCase):
+
+  def test_parsebuckets(self):
+    edges, labels = sfhist.parsebuckets("2w,1m,6")
+    self.assertEqual(edges, [14.0, 365.25 / 12, 6 * 365.25 / 12])
+    self.assertEqual(labels, ["< 2w", "2w-1m", "1m-6m", "> 6m"])
+
+  def test_invalid(self):
+    self.assertRaises(ValueError, sfhist.parsebuckets, "1m,2x")
+    self.assertRaises(ValueError, sfhist.parsebuckets, "6m,1m")
+
+  def test_age_on_an_edge(self):
+    self.assertEqual(sfhist.olderbuckets("2w,1m,6m,2y", "6"), [(3, "6m-2y"), (4, "> 2y")])
+    self.assertEqual(sfhist.olderbuckets("2w,1m,6m,2y", "24"), [(4, "> 2y")])
+
+  def test_age_inside_a_range(self):
+    # files 3 to 6 months old are in the 1m-6m bucket and must be reported
+    self.assertEqual(sfhist.olderbuckets("2w,1m,6m,2y", "3"), [(2, "3m-6m"), (3, "6m-2y"), (4, "> 2y")])
+
+  def test_age_in_first_and_last_range(self):
+    self.assertEqual(sfhist.olderbuckets("6m,2y", "1"), [(0, "1m-6m"), (1, "6m-2y"), (2, "> 2y")])
+    self.assertEqual(sfhist.olderbuckets("6m,2y", "36"), [(2, "> 36m")])
+
+if __name__ == "__main__":
+  unittest.main()
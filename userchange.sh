@@ -41,9 +41,11 @@ set -euo pipefail
 # Change Log
 # 1.02 (March 5, 2018) - Change from mailx to sendmail so html inline can be sent.
 #                      - Added option to specify attachment or inline
+# 1.03 (October 17, 2026) - Read per-user snapshots from the sf_rollup.user_history summary
+#                           table kept up to date by sfrefresh.py
 
 # Set variables
-readonly VERSION="1.02 March 5, 2018"
+readonly VERSION="1.03 October 17, 2026"
 PROG="${0##*/}"
 readonly SFHOME="${SFHOME:-/opt/starfish}"
 readonly LOGDIR="$SFHOME/log/${PROG%.*}"
@@ -258,14 +260,14 @@ build_sql_query() {
 WITH runtime_range AS (
     SELECT MIN(run_time) AS start,
            MAX(run_time) AS end
-    FROM sf_reports.last_time_generic_history
+    FROM sf_rollup.user_history
     WHERE run_time >= (now() - interval '$DAYSAGO days') 
 ), user_size_for_chosen_days AS (
     SELECT volume_name,
            user_name,
            run_time,
            SUM(SIZE) AS size
-    FROM sf_reports.last_time_generic_history 
+    FROM sf_rollup.user_history
     INNER JOIN runtime_range ON run_time = runtime_range.start OR run_time = runtime_range.end
     WHERE $volumes_query
     GROUP BY volume_name,
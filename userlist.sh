@@ -41,9 +41,11 @@ set -euo pipefail
 # Change Log
 # 1.02 (March 5, 2018) - Change from mailx to sendmail so html inline can be sent.
 #                      - Added option to specify attachment or inline
+# 1.03 (October 17, 2026) - Read per-user totals from the sf_rollup.user_age_current summary
+#                           table kept up to date by sfrefresh.py
 
 # Set variables
-readonly VERSION="1.02 March 5, 2018"
+readonly VERSION="1.03 October 17, 2026"
 PROG="${0##*/}"
 readonly SFHOME="${SFHOME:-/opt/starfish}"
 readonly LOGDIR="$SFHOME/log/${PROG%.*}"
@@ -228,11 +230,11 @@ build_sql_query() {
       volume_name as \"Volume\",
       user_name as \"User Name\",
       group_name as \"Group Name\",
-      SUM(ROUND(size/(1024*1024*1024.0),2)) as sum_size,
-      SUM(ROUND((size)::DECIMAL/(1024*1024*1024), 2)) AS \"size (GB)\",
+      ROUND(SUM(size)/(1024*1024*1024.0),2) as sum_size,
+      ROUND(SUM(size)::DECIMAL/(1024*1024*1024), 2) AS \"size (GB)\",
       SUM(count)::BIGINT AS \"Number of Files\",
-      SUM(ROUND((cost)::DECIMAL,2)) AS \"Cost($)\"
-    FROM sf_reports.last_time_generic_current 
+      ROUND(SUM(cost)::DECIMAL,2) AS \"Cost($)\"
+    FROM sf_rollup.user_age_current
     WHERE $volumes_query
     GROUP BY user_name,volume_name,group_name
     ORDER BY sum_size DESC